@@ -0,0 +1,242 @@
+import argparse
+import gc
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from itertools import product
+from pathlib import Path
+from typing import Callable, Iterable
+
+import pydantic
+
+from cozy.model.api import SiteController
+from cozy.model.models import Site, Chair, Client, Staff, EventLog, ChairTakeEvent, ChairLeaveEvent
+from cozy.model.persistence import DirectWriter
+
+RESULTS_FOLDER = Path(__file__).parent / 'results'
+
+FULL = {'log_sizes': [0, 1_000, 10_000], 'capacities': [25, 250, 2_500], 'repeat': 200}
+QUICK = {'log_sizes': [0, 1_000], 'capacities': [25, 250], 'repeat': 30}
+
+_T0 = datetime(2024, 1, 1, 8)
+_STAFF = Staff(name='Bench')
+
+
+# Every measure is a list of per operation timings in nanoseconds, reduced to the same few statistics so two runs can
+# be compared line by line.
+def _result(name: str, params: dict, timings: list[int], ops_per_timing: int = 1) -> dict:
+    per_op = sorted(t / ops_per_timing for t in timings)
+    return {
+        'name': name,
+        'params': params,
+        'unit': 'ns',
+        'samples': len(per_op),
+        'min': per_op[0],
+        'median': statistics.median(per_op),
+        'mean': statistics.fmean(per_op),
+        'p95': per_op[min(len(per_op) - 1, int(len(per_op) * 0.95))],
+        'ops_per_second': 1e9 / statistics.median(per_op) if per_op[0] else None,
+    }
+
+
+def _timed(fn: Callable[[], object], setup: Callable[[], object] | None = None, repeat: int = 1) -> list[int]:
+    timings = []
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter_ns()
+            fn()
+            timings.append(time.perf_counter_ns() - start)
+    finally:
+        gc.enable()
+    return timings
+
+
+def _events(count: int, capacity: int) -> Iterable[ChairTakeEvent | ChairLeaveEvent]:
+    # a take followed by a leave on each chair in turn, the shape a regular day produces
+    for i in range(count):
+        chair_id = (i // 2) % capacity + 1
+        when = _T0 + timedelta(seconds=i)
+        if i % 2 == 0:
+            yield ChairTakeEvent(when=when, by=_STAFF, chair=Chair(id=chair_id, occupant=Client(name=f'client {i}'), since=when))
+        else:
+            yield ChairLeaveEvent(when=when, by=_STAFF, chair=Chair(id=chair_id, occupant=None, since=None))
+
+
+def _event_log(count: int, capacity: int) -> EventLog:
+    event_log = EventLog(initial_site_state=Site(capacity=capacity, name='bench', staff=[_STAFF], chairs=[]))
+    for event in _events(count, capacity):
+        event_log.append(event)
+    return event_log
+
+
+def _site_home(root: Path, log_size: int, capacity: int, checkpoint_interval: int, locking: bool = True) -> Path:
+    home = Path(tempfile.mkdtemp(prefix=f'home_{log_size}_{capacity}_', dir=root))
+    (home / 'site_state.json').write_text(Site(capacity=capacity, name='bench', staff=[_STAFF], chairs=[]).model_dump_json())
+    controller = SiteController(home, checkpoint_interval=checkpoint_interval, writer=DirectWriter(), locking=locking)
+    controller.active_staff = _STAFF.name
+    for i in range(log_size // 2):
+        chair = controller.site.chairs[i % capacity]
+        chair.take(Client(name=f'client {i}'))
+        controller.occupy_chair(chair)
+        chair.release()
+        controller.free_chair(chair)
+    controller.close()
+    return home
+
+
+def bench_occupy_free(root: Path, log_sizes: list[int], capacities: list[int], repeat: int) -> list[dict]:
+    # written right away by a DirectWriter so the timings include getting the events and checkpoints into the files,
+    # with the site lock (slim records written under it) and without (full records appended by the writer)
+    results = []
+    for log_size, capacity, locking in product(log_sizes, capacities, (True, False)):
+        home = _site_home(root, log_size, capacity, 200, locking)
+        controller = SiteController(home, writer=DirectWriter(), locking=locking)
+        controller.active_staff = _STAFF.name
+        chairs = controller.site.chairs
+        occupy, free = [], []
+        for i in range(repeat):
+            chair = chairs[i % capacity]
+            chair.take(Client(name=f'bench {i}'))
+            occupy += _timed(lambda: controller.occupy_chair(chair))
+            chair.release()
+            free += _timed(lambda: controller.free_chair(chair))
+        controller.close()
+        params = {'log_size': log_size, 'capacity': capacity, 'locking': locking}
+        results.append(_result('controller.occupy_chair', params, occupy))
+        results.append(_result('controller.free_chair', params, free))
+    return results
+
+
+def bench_cold_start(root: Path, log_sizes: list[int], capacities: list[int], repeat: int) -> list[dict]:
+    results = []
+    for log_size in log_sizes:
+        capacity = capacities[0]
+        # from the newest checkpoint, then with the checkpoints gone which replays the whole journal
+        for checkpoints in (True, False):
+            home = _site_home(root, log_size, capacity, 200)
+            if not checkpoints:
+                shutil.rmtree(home / 'checkpoints')
+            controllers = []
+            timings = _timed(lambda: controllers.append(SiteController(home, writer=DirectWriter())), repeat=max(3, repeat // 20))
+            for controller in controllers:
+                controller.close()
+            results.append(_result('controller.cold_start', {'log_size': log_size, 'capacity': capacity, 'checkpoints': checkpoints}, timings))
+    return results
+
+
+def bench_init_chairs(capacities: list[int], repeat: int) -> list[dict]:
+    results = []
+    for capacity in capacities:
+        sites: list[Site] = []
+        timings = _timed(lambda: sites[-1].init_chairs(capacity * 2),
+                         setup=lambda: sites.append(Site(capacity=capacity, name='bench', staff=[], chairs=[])),
+                         repeat=max(3, repeat // 10))
+        results.append(_result('site.init_chairs', {'capacity': capacity, 'new_capacity': capacity * 2}, timings))
+    return results
+
+
+def bench_event_log_append(log_sizes: list[int], capacities: list[int]) -> list[dict]:
+    results = []
+    for count in sorted({max(log_size, 1_000) for log_size in log_sizes}):
+        events = list(_events(count, capacities[0]))
+        event_log = EventLog(initial_site_state=None)
+        timings = _timed(lambda: [event_log.append(e) for e in events])
+        results.append(_result('event_log.append', {'events': count}, timings, ops_per_timing=count))
+    return results
+
+
+def bench_event_log_json(log_sizes: list[int], capacities: list[int], repeat: int) -> list[dict]:
+    results = []
+    for log_size in log_sizes:
+        event_log = _event_log(log_size, capacities[0])
+        data = event_log.model_dump_json()
+        rounds = max(3, repeat // (20 + log_size // 100))
+        params = {'log_size': log_size}
+        # the size is reported next to the timings, not as a parameter, so a format change still compares
+        results.append(_result('event_log.dump_json', params, _timed(event_log.model_dump_json, repeat=rounds)) | {'bytes': len(data)})
+        results.append(_result('event_log.load_json', params, _timed(lambda: EventLog.model_validate_json(data), repeat=rounds)) | {'bytes': len(data)})
+    return results
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(profile: dict) -> dict:
+    root = Path(tempfile.mkdtemp(prefix='cozy_bench_'))
+    try:
+        results = bench_occupy_free(root, profile['log_sizes'], profile['capacities'], profile['repeat'])
+        results += bench_cold_start(root, profile['log_sizes'], profile['capacities'], profile['repeat'])
+        results += bench_init_chairs(profile['capacities'], profile['repeat'])
+        results += bench_event_log_append(profile['log_sizes'], profile['capacities'])
+        results += bench_event_log_json(profile['log_sizes'], profile['capacities'], profile['repeat'])
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return {
+        'commit': _commit(),
+        'when': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'pydantic': pydantic.VERSION,
+        'machine': f'{platform.system()} {platform.machine()}',
+        'profile': profile,
+        'results': results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    # compares medians of the measures both runs share, returns a line per regression
+    def key(result: dict) -> str:
+        return result['name'] + json.dumps(result['params'], sort_keys=True)
+
+    before = {key(r): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        previous = before.get(key(result))
+        if previous is None or not previous['median']:
+            continue
+        ratio = result['median'] / previous['median']
+        line = f"{result['name']:<28} {json.dumps(result['params'], sort_keys=True):<60} {previous['median']:>14.0f} -> {result['median']:>14.0f} ns  x{ratio:.2f}"
+        print(line)
+        if ratio > threshold:
+            regressions.append(line)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the cozy model and persistence layer")
+    parser.add_argument('--quick', action='store_true', help="smaller logs and sites, for a fast sanity run")
+    parser.add_argument('--output', type=Path, help="where to write the results, defaults to results/<commit>.json")
+    parser.add_argument('--compare', type=Path, help="a previous results file to compare this run against")
+    parser.add_argument('--threshold', type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    report = run(QUICK if args.quick else FULL)
+    output = args.output or RESULTS_FOLDER / f"{report['commit'] or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding='utf-8')
+    print(f"{len(report['results'])} measures written to {output}")
+
+    if args.compare is not None:
+        regressions = compare(json.loads(args.compare.read_text(encoding='utf-8')), report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions over x{args.threshold}:")
+            print('\n'.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+import asyncio
+import inspect
+import math
+from typing import Any, Callable
+
+from PySide6.QtCore import Qt, Signal, QAbstractTableModel, QModelIndex, QPersistentModelIndex, QEvent, QRect, QSize, \
+    QStringListModel
+from PySide6.QtGui import QPainter
+from PySide6.QtWidgets import QStyledItemDelegate, QStyleOptionViewItem, QStyleOptionButton, QStyle, QLineEdit, QWidget, \
+    QTableView, QHeaderView, QAbstractItemView, QApplication, QCompleter
+
+from cozy.model.models import Chair, Client
+
+ChairRole = Qt.UserRole + 1
+
+LABEL_WIDTH = 70
+BUTTON_WIDTH = 190
+ROW_HEIGHT = 34
+MARGIN = 4
+
+
+# Table model over Site.chairs laid out `columns` chairs per row, chair n sits at row (n-1) // columns. Nothing is built
+# per chair : the view asks for the cells it is about to paint and a change to one chair only repaints its cell.
+class ChairGridModel(QAbstractTableModel):
+    interactive = Signal()
+    # a chair could not be taken or freed, the chair is left as it was and the message says why
+    failed = Signal(str)
+
+    def __init__(self, controller: Any, columns: int = 2, parent=None):
+        super().__init__(parent)
+        self.controller = controller
+        self.columns = columns
+        # names typed in empty chairs, they become the occupant once the chair is taken
+        self._drafts: dict[int, str] = {}
+        # changes the async controller is still writing
+        self._pending: set[asyncio.Future] = set()
+
+    @property
+    def chairs(self) -> list[Chair]:
+        return self.controller.site.chairs
+
+    def client_directory(self) -> Any:
+        # past clients to suggest while typing an occupant, only a local SiteController keeps them
+        return getattr(self.controller, 'clients', None)
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else math.ceil(len(self.chairs) / self.columns)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else self.columns
+
+    def chair_at(self, index: QModelIndex | QPersistentModelIndex) -> Chair | None:
+        position = index.row() * self.columns + index.column()
+        return self.chairs[position] if index.isValid() and position < len(self.chairs) else None
+
+    def index_of(self, chair_id: int) -> QModelIndex:
+        return self.index((chair_id - 1) // self.columns, (chair_id - 1) % self.columns)
+
+    def data(self, index, role=Qt.DisplayRole) -> Any:
+        chair = self.chair_at(index)
+        if chair is None:
+            return None
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return chair.occupant.name if chair.occupant is not None else self._drafts.get(chair.id, '')
+        if role == Qt.ToolTipRole:
+            return f"Chair {chair.id} : {chair}"
+        if role == ChairRole:
+            return chair
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole) -> bool:
+        chair = self.chair_at(index)
+        if chair is None or role != Qt.EditRole:
+            return False
+        if chair.occupant is not None:
+            # who sits there only changes through events, free the chair and take it again to fix a name
+            return False
+        self._drafts[chair.id] = str(value).strip()
+        self.dataChanged.emit(index, index)
+        self.interactive.emit()
+        return True
+
+    def flags(self, index) -> Qt.ItemFlag:
+        chair = self.chair_at(index)
+        if chair is None:
+            return Qt.NoItemFlags
+        if chair.is_occupied:
+            return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
+
+    def toggle(self, index: QModelIndex | QPersistentModelIndex) -> None:
+        chair = self.chair_at(index)
+        if chair is None:
+            return
+        # the chair is put back as it was when the controller refuses the change, the draft is only dropped once taken
+        if chair.is_occupied:
+            occupant, since = chair.occupant, chair.since
+            chair.release()
+            self._settle(chair, self.controller.free_chair, lambda: chair.take(occupant, since), lambda: None)
+        else:
+            name = self._drafts.get(chair.id, '').strip()
+            if not name:
+                return
+            chair.take(Client(name=name))
+            self._settle(chair, self.controller.occupy_chair, chair.release, lambda: self._drafts.pop(chair.id, None))
+        self.chair_changed(chair.id)
+        self.interactive.emit()
+
+    def _settle(self, chair: Chair, action: Callable[[Chair], Any], undo: Callable[[], None], done: Callable[[], None]) -> None:
+        # a refusal raises right away from SiteController, the async controller's comes once its task is done
+        try:
+            result = action(chair)
+        except BaseException:
+            undo()
+            raise
+        if not inspect.isawaitable(result):
+            done()
+            return
+        task = asyncio.ensure_future(result)
+        self._pending.add(task)
+
+        def settled(t: asyncio.Future) -> None:
+            self._pending.discard(t)
+            if not t.cancelled() and t.exception() is None:
+                done()
+                return
+            try:
+                undo()
+            except Exception:
+                # the chair changed meanwhile, the reload that follows the failure shows it as it is
+                pass
+            self.chair_changed(chair.id)
+            self.failed.emit(f"Chair {chair.id} was not changed : {'cancelled' if t.cancelled() else t.exception()}")
+
+        task.add_done_callback(settled)
+
+    def chair_changed(self, chair_id: int) -> None:
+        index = self.index_of(chair_id)
+        self.dataChanged.emit(index, index)
+
+    def set_controller(self, controller: Any) -> None:
+        self.controller = controller
+        self.site_changed()
+
+    def site_changed(self) -> None:
+        # the site was reloaded or resized, every cell is looked up again
+        self.beginResetModel()
+        self._drafts = {k: v for k, v in self._drafts.items() if k <= len(self.chairs)}
+        self.endResetModel()
+
+
+# Paints a chair cell the way the old per chair widgets looked (label, occupant name, take / free button) and only
+# creates a real editor for the one cell being edited.
+class ChairDelegate(QStyledItemDelegate):
+
+    @staticmethod
+    def _label_rect(rect: QRect) -> QRect:
+        return QRect(rect.left() + MARGIN, rect.top(), LABEL_WIDTH, rect.height())
+
+    @staticmethod
+    def _button_rect(rect: QRect) -> QRect:
+        return QRect(rect.right() - BUTTON_WIDTH - MARGIN, rect.top() + MARGIN, BUTTON_WIDTH, rect.height() - 2 * MARGIN)
+
+    @staticmethod
+    def _occupant_rect(rect: QRect) -> QRect:
+        left = rect.left() + MARGIN + LABEL_WIDTH
+        return QRect(left, rect.top() + MARGIN, rect.right() - BUTTON_WIDTH - 2 * MARGIN - left, rect.height() - 2 * MARGIN)
+
+    def paint(self, painter: QPainter, option: QStyleOptionViewItem, index) -> None:
+        chair: Chair | None = index.data(ChairRole)
+        if chair is None:
+            return
+        style = option.widget.style() if option.widget else QApplication.style()
+        enabled = bool(option.state & QStyle.State_Enabled)
+        painter.save()
+        painter.drawText(self._label_rect(option.rect), Qt.AlignVCenter | Qt.AlignLeft, f"Chair {chair.id:>3}")
+
+        occupant_rect = self._occupant_rect(option.rect)
+        painter.drawRect(occupant_rect.adjusted(0, 0, -1, -1))
+        painter.drawText(occupant_rect.adjusted(MARGIN, 0, -MARGIN, 0), Qt.AlignVCenter | Qt.AlignLeft, index.data(Qt.DisplayRole) or '')
+
+        button = QStyleOptionButton()
+        button.rect = self._button_rect(option.rect)
+        button.text = f"{chair.since:%A %H:%M} -- Click to free" if chair.is_occupied and chair.since else "Take"
+        button.state = QStyle.State_Raised | (QStyle.State_Enabled if enabled else QStyle.State_None)
+        style.drawControl(QStyle.CE_PushButton, button, painter, option.widget)
+        painter.restore()
+
+    def sizeHint(self, option: QStyleOptionViewItem, index) -> QSize:
+        return QSize(LABEL_WIDTH + BUTTON_WIDTH + 160, ROW_HEIGHT)
+
+    def editorEvent(self, event: QEvent, model, option: QStyleOptionViewItem, index) -> bool:
+        # clicks on the button toggle the chair and never start editing the name
+        if event.type() in (QEvent.MouseButtonPress, QEvent.MouseButtonRelease, QEvent.MouseButtonDblClick):
+            if self._button_rect(option.rect).contains(event.position().toPoint()):
+                if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+                    try:
+                        model.toggle(index)
+                    except Exception as e:
+                        # nothing may escape into Qt, the chair was put back and the window tells what happened
+                        model.failed.emit(f"Chair {index.data(ChairRole).id} was not changed : {e}")
+                return True
+        return super().editorEvent(event, model, option, index)
+
+    def createEditor(self, parent: QWidget, option: QStyleOptionViewItem, index) -> QWidget:
+        editor = QLineEdit(parent)
+        directory = index.model().client_directory()
+        if directory is not None:
+            # the directory does the matching, the completer only shows what it found for the text typed so far
+            suggestions = QStringListModel(editor)
+            completer = QCompleter(suggestions, editor)
+            completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+            editor.setCompleter(completer)
+            editor.textEdited.connect(lambda text: suggestions.setStringList([c.name for c in directory.suggest(text)]))
+        return editor
+
+    def setEditorData(self, editor: QLineEdit, index) -> None:
+        editor.setText(index.data(Qt.EditRole) or '')
+
+    def setModelData(self, editor: QLineEdit, model, index) -> None:
+        model.setData(index, editor.text(), Qt.EditRole)
+
+    def updateEditorGeometry(self, editor: QWidget, option: QStyleOptionViewItem, index) -> None:
+        editor.setGeometry(self._occupant_rect(option.rect))
+
+
+class ChairGridView(QTableView):
+
+    def __init__(self, model: ChairGridModel, parent=None):
+        super().__init__(parent)
+        self.setModel(model)
+        self.setItemDelegate(ChairDelegate(self))
+        self.setShowGrid(False)
+        self.horizontalHeader().hide()
+        self.verticalHeader().hide()
+        self.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        # fixed row heights let the view find the visible rows without measuring any of them
+        self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.verticalHeader().setDefaultSectionSize(ROW_HEIGHT)
+        self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.setEditTriggers(QAbstractItemView.DoubleClicked | QAbstractItemView.SelectedClicked | QAbstractItemView.AnyKeyPressed)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
@@ -0,0 +1,108 @@
+import json
+from http import HTTPStatus
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from cozy.model.models import Site, Chair, Staff, SiteException, StaffNotFoundError
+
+# kept here rather than in cozy.server, the client has no use for the controller stack the server pulls in
+DEFAULT_PORT = 8765
+
+
+class RemoteSiteError(SiteException):
+    def __init__(self, status: int, message: str, error_type: str | None = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.error_type = error_type
+
+
+# Stands in for SiteController when the site is owned by a cozy.server process. The UI keeps changing its local chair
+# objects as before, this only forwards the resulting actions and keeps a copy of the site refreshed on demand. Other
+# terminals' changes only show after refresh(), which the UI calls periodically.
+class RemoteSiteController:
+
+    def __init__(self, base_url: str = f'http://127.0.0.1:{DEFAULT_PORT}', timeout: float = 5.0) -> None:
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.version: int | None = None
+        self._site: Site | None = None
+        self._active_staff: Staff | None = None
+
+    def _call(self, method: str, path: str, payload: dict | None = None) -> tuple[int, dict | None, int | None]:
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        request = Request(self.base_url + path, data=data, method=method, headers={'Content-Type': 'application/json'})
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                version = response.headers.get('X-Site-Version')
+                body = response.read()
+                return response.status, json.loads(body) if body else None, int(version) if version else None
+        except HTTPError as e:
+            if e.code == HTTPStatus.NOT_MODIFIED:
+                return e.code, None, self.version
+            error = json.loads(e.read() or b'{}')
+            if error.get('type') == StaffNotFoundError.__name__:
+                raise StaffNotFoundError(payload.get('staff', '') if payload else '') from None
+            raise RemoteSiteError(e.code, error.get('error', e.reason), error.get('type')) from None
+
+    def refresh(self) -> bool:
+        # fetches the site again only if it changed on the server, tells if it did
+        path = '/site' if self.version is None else f'/site?if_version_not={self.version}'
+        status, body, version = self._call('GET', path)
+        if status == HTTPStatus.NOT_MODIFIED:
+            return False
+        self._site = Site.model_validate(body)
+        self.version = version
+        return True
+
+    @property
+    def site(self) -> Site:
+        if self._site is None:
+            self.refresh()
+        return self._site
+
+    def _post(self, path: str, payload: dict) -> None:
+        try:
+            _, body, version = self._call('POST', path, payload)
+        except BaseException:
+            # the local copy may no longer match the server, the next refresh fetches it whole
+            self.version = None
+            raise
+        self.version = None if version is None or self.version is None or version != self.version + 1 else version
+
+    def occupy_chair(self, chair: Chair):
+        self._post('/occupy', {
+            'chair_id': chair.id,
+            'occupant': chair.occupant.name,
+            'since': chair.since.isoformat() if chair.since else None,
+            'staff': self._staff_name(),
+        })
+
+    def free_chair(self, chair: Chair):
+        self._post('/free', {'chair_id': chair.id, 'staff': self._staff_name()})
+
+    def add_staff(self, staff_name: str):
+        self._post('/staff', {'name': staff_name})
+        if not self.site.has_staff(staff_name):
+            self.site.add_staff(Staff(name=staff_name))
+
+    def _staff_name(self) -> str | None:
+        return self._active_staff.name if self._active_staff else None
+
+    @property
+    def active_staff(self) -> Staff | None:
+        return self._active_staff
+
+    @active_staff.setter
+    def active_staff(self, staff: str | Staff) -> None:
+        if staff is None:
+            self._active_staff = None
+            return
+        if not isinstance(staff, Staff):
+            staff = self.site.get_staff_from_name(staff)
+        self._active_staff = staff
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
@@ -1,102 +1,185 @@
-import math
+import time
+
+_process_started = time.perf_counter()
+
+import asyncio
+import importlib
+import inspect
+import os
+import sys
 from os.path import expanduser
 from pathlib import Path
-from PySide6.QtCore import Qt, QTimer, Signal
-from PySide6.QtWidgets import QApplication, QMainWindow, QLabel, QPushButton, QVBoxLayout, QWidget, QScrollArea, QGridLayout, QInputDialog, QMessageBox, QTextEdit, QBoxLayout, QPlainTextEdit, QProgressBar
-from datetime import datetime
+from typing import Any
 
+from PySide6.QtCore import QTimer
+from PySide6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget
+
+from cozy.chair_grid import ChairGridModel, ChairGridView
 from cozy.gemini_1 import StaffProgressWidget
-from cozy.model.api import SiteController
-from cozy.model.models import Chair, Client
+from cozy.model.models import Site
 
-site_api = SiteController(site_home=Path(expanduser("~")) / '.cozy_2')
+SITE_HOME = Path(expanduser("~")) / '.cozy_2'
 
+# how often the window checks for changes other terminals made to the site
+SITE_POLL_INTERVAL_MS = 2000
 
-class ChairWidget(QWidget):
-    interactive = Signal()
+metrics_exporter: Any = None
 
-    def __init__(self, chair: Chair):
-        super().__init__()
-        self._occupancy_button = None
-        self.occupant_edit: QPlainTextEdit | None = None
-        self._label = None
-        self.chair = chair
-        self.init_ui()
 
-    def init_ui(self):
-        layout = QBoxLayout(QBoxLayout.LeftToRight)
-
-        self._label = QLabel(f"Chair {self.chair.id:>3}")
-        layout.addWidget(self._label)
-
-        self.occupant_edit = QPlainTextEdit(self.chair.occupant.name if self.chair.occupant else '', self)
-        self.occupant_edit.textChanged.connect(self.editing_ocupy)
-        self.occupant_edit.setMaximumHeight(30)
-        self.occupant_edit.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
-        self.occupant_edit.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-
-        layout.addWidget(self.occupant_edit)
-
-        self._occupancy_button = QPushButton("Take", self)
-        self._occupancy_button.clicked.connect(self.toggle_occupancy)
-        layout.addWidget(self._occupancy_button)
-
-        if self.chair.is_occupied:
-            self.occupy()
-        else:
-            self.release()
-
-        self.setLayout(layout)
-
-    def editing_ocupy(self):
-        if self.chair.occupant is not None:
-            self.chair.occupant.name = self.occupant_edit.toPlainText().strip()
-        self.interactive.emit()
-
-    def occupy(self):
-        if self.occupant_edit.toPlainText().strip() != "":
-            self.chair.occupant = Client(name=self.occupant_edit.toPlainText().strip())
-            self.chair.since = datetime.now()
-            self._occupancy_button.setText(f"{self.chair.since:'%A %H:%M'} -- Click to free")
-
-    def release(self):
-        self.chair.occupant = None
-        self.chair.since = None
-        self.occupant_edit.setPlainText('')
-        self._occupancy_button.setText(f"Take")
-
-    def toggle_occupancy(self):
-        if self.chair.is_occupied:
-            self.release()
-            site_api.free_chair(self.chair)
-        else:
-            self.occupy()
-            site_api.occupy_chair(self.chair)
+# Where startup time goes, from the first line of this module to the site being ready. Turned on with
+# --profile-startup or COZY_PROFILE_STARTUP=1, it costs nothing otherwise.
+class StartupProfile:
+
+    def __init__(self, enabled: bool) -> None:
+        self.enabled = enabled
+        self.marks: list[tuple[str, float]] = [('start', _process_started)]
+
+    def mark(self, phase: str) -> None:
+        if self.enabled:
+            self.marks.append((phase, time.perf_counter()))
+
+    def report(self) -> None:
+        if not self.enabled:
+            return
+        print("cozy startup profile", file=sys.stderr)
+        for (_, previous), (phase, at) in zip(self.marks, self.marks[1:]):
+            print(f"  {phase:<28} +{(at - previous) * 1000:8.1f} ms  {(at - _process_started) * 1000:8.1f} ms", file=sys.stderr)
+
+
+# What the window shows until the real controller is loaded : the site as last saved, nothing can be changed through it
+class SiteSnapshot:
+
+    def __init__(self, site: Site) -> None:
+        self.site = site
+        self.active_staff = None
+
+    @classmethod
+    def load(cls, site_home: Path) -> 'SiteSnapshot':
+        # site_state.json is rewritten on every checkpoint and on exit, close enough to what the journal holds
+        try:
+            return cls(Site.model_validate_json((site_home / 'site_state.json').read_bytes()))
+        except (OSError, ValueError):
+            return cls(Site(capacity=0, name="Cozy", staff=[], chairs=[]))
 
-    @property
-    def occupied(self) -> bool:
-        return self.chair.occupant is not None
+
+async def _import_off_loop(name: str) -> Any:
+    # the controller and everything it pulls in are only imported off the UI thread
+    return await asyncio.get_running_loop().run_in_executor(None, importlib.import_module, name)
+
+
+async def open_site_api() -> Any:
+    # when several terminals share a site, a cozy.server process owns it and COZY_SERVER holds its url
+    loop = asyncio.get_running_loop()
+    if os.environ.get('COZY_SERVER'):
+        client = await _import_off_loop('cozy.client')
+        site_api = client.RemoteSiteController(os.environ['COZY_SERVER'])
+        await loop.run_in_executor(None, site_api.refresh)
+        return site_api
+    aio = await _import_off_loop('cozy.model.aio')
+    global metrics_exporter
+    metrics = None
+    # COZY_METRICS names a Prometheus text file the controller's metrics are written to, no metrics are kept otherwise
+    if os.environ.get('COZY_METRICS'):
+        from cozy.model.metrics import SiteMetrics, PrometheusFileExporter
+        metrics = SiteMetrics()
+        metrics_exporter = PrometheusFileExporter(metrics, Path(os.environ['COZY_METRICS'])).start()
+    # other cozy windows may have the same home open, every commit is checked against what they wrote
+    site_api = await aio.AsyncSiteController.open(SITE_HOME, metrics=metrics, locking=True)
+    # built here too so the first occupant typed does not wait on it
+    await site_api.load_clients()
+    return site_api
 
 
 class ChairTrackingUI(QMainWindow):
-    def __init__(self):
+    def __init__(self, site_api: Any):
         super().__init__()
-        self._chair_widgets = {}
+        self.site_api = site_api
+        self.chair_model: ChairGridModel | None = None
+        self.chair_view: ChairGridView | None = None
         self.staff_section = None
+        self.site_poll_timer = QTimer(self)
+        self.site_poll_timer.setInterval(SITE_POLL_INTERVAL_MS)
+        self.site_poll_timer.timeout.connect(self.poll_site)
+        self._polling = False
         self.init_ui()
 
+    @property
+    def ready(self) -> bool:
+        return not isinstance(self.site_api, SiteSnapshot)
+
+    def site_loaded(self, site_api: Any) -> None:
+        self.site_api = site_api
+        self.chair_model.set_controller(site_api)
+        for s in site_api.site.staff:
+            if s.name not in self.staff_section.staff_buttons:
+                self.staff_section.add_staff(s.name)
+        self.staff_section.setEnabled(True)
+        self.statusBar().clearMessage()
+        self.site_poll_timer.start()
+
+    def site_failed(self, message: str) -> None:
+        self.statusBar().showMessage(f"Could not load the site : {message}")
+
+    def poll_site(self) -> None:
+        if self.ready and not self._polling:
+            self._polling = True
+            asyncio.ensure_future(self._poll_site())
+
+    async def _poll_site(self) -> None:
+        # picks up what other terminals changed, through the server or in the same site home, off the UI thread. The
+        # grid is only rebuilt when something did.
+        try:
+            if hasattr(self.site_api, 'refresh'):
+                changed = await asyncio.get_running_loop().run_in_executor(None, self.site_api.refresh)
+            else:
+                changed = await self.site_api.reload_if_changed()
+        except Exception as e:
+            self.statusBar().showMessage(f"Could not refresh the site : {e}")
+            return
+        finally:
+            self._polling = False
+        if changed:
+            self.chair_model.site_changed()
+            for s in self.site_api.site.staff:
+                if s.name not in self.staff_section.staff_buttons:
+                    self.staff_section.add_staff(s.name)
+
+    def action_failed(self, message: str) -> None:
+        self.statusBar().showMessage(message)
+        if self.site_poll_timer.isActive():
+            # another terminal probably got there first, show the site as it is now
+            self.poll_site()
+
     def staff_added_handler(self, staff_name: str) -> None:
-        site_api.add_staff(staff_name)
+        try:
+            result = self.site_api.add_staff(staff_name)
+        except Exception as e:
+            self.action_failed(f"Could not add {staff_name} : {e}")
+            return
+        if inspect.isawaitable(result):
+            asyncio.ensure_future(self._staff_added(staff_name, result))
+
+    async def _staff_added(self, staff_name: str, adding: Any) -> None:
+        try:
+            await adding
+        except Exception as e:
+            self.action_failed(f"Could not add {staff_name} : {e}")
+
+    def close_site(self) -> None:
+        # the loop is stopping, whatever the writer still holds is written before leaving
+        if not self.ready:
+            return
+        controller = getattr(self.site_api, 'controller', self.site_api)
+        controller.close()
 
     def staff_selected_handler(self, staff_name: str) -> None:
-        site_api.active_staff = staff_name
-        for c in self._chair_widgets.values():
-            c.setEnabled(True)
+        self.site_api.active_staff = staff_name
+        self.chair_view.setEnabled(True)
 
     def staff_selected_cleared_handler(self) -> None:
-        site_api.active_staff = None
-        for c in self._chair_widgets.values():
-            c.setEnabled(False)
+        if self.ready:
+            self.site_api.active_staff = None
+        self.chair_view.setEnabled(False)
 
     def ui_interactive_handler(self) -> None:
         self.staff_section.extend_grace_period()
@@ -111,35 +194,64 @@ class ChairTrackingUI(QMainWindow):
         self.staff_section.staff_selection_cleared.connect(self.staff_selected_cleared_handler)
 
         # and finally we add any currently known staff members
-        for s in site_api.site.staff:
+        for s in self.site_api.site.staff:
             self.staff_section.add_staff(s.name)
+        # nobody can act on the site before the controller is there
+        self.staff_section.setEnabled(self.ready)
+        if not self.ready:
+            self.statusBar().showMessage("Loading the site...")
+
+        # one view over all the chairs, only the rows scrolled into sight are ever painted
+        self.chair_model = ChairGridModel(self.site_api, columns=2, parent=self)
+        self.chair_model.interactive.connect(self.ui_interactive_handler)
+        self.chair_model.failed.connect(self.action_failed)
+        self.chair_view = ChairGridView(self.chair_model, self)
+        self.chair_view.setEnabled(False)
 
-        scroll_area = QScrollArea(self)
-        scroll_area.setWidgetResizable(True)
         central_widget_layout = QVBoxLayout(central_widget)
         central_widget_layout.addWidget(self.staff_section)
-        central_widget_layout.addWidget(scroll_area)
-
-        scroll_content = QWidget(self)
-        scroll_area.setWidget(scroll_content)
-
-        grid_layout = QGridLayout(scroll_content)
-
-        for c in site_api.site.chairs:
-            row = math.ceil(c.id / 2)
-            col = (c.id - 1) % 2
-            chair_widget = ChairWidget(c)
-            grid_layout.addWidget(chair_widget, row, col)
-            chair_widget.setEnabled(False)
-            chair_widget.interactive.connect(self.ui_interactive_handler)
-            self._chair_widgets[c.id] = chair_widget
+        central_widget_layout.addWidget(self.chair_view)
 
         self.setGeometry(300, 300, 400, 300)
         self.setWindowTitle('Chair Tracking System')
         self.show()
 
 
+async def load_site(window: ChairTrackingUI, profile: StartupProfile) -> None:
+    try:
+        site_api = await open_site_api()
+    except Exception as e:
+        window.site_failed(f"{type(e).__name__}: {e}")
+        profile.report()
+        return
+    window.site_loaded(site_api)
+    profile.mark('site loaded')
+    profile.report()
+
+
+def main() -> None:
+    profile = StartupProfile('--profile-startup' in sys.argv or os.environ.get('COZY_PROFILE_STARTUP') == '1')
+    profile.mark('imports')
+    app = QApplication([a for a in sys.argv if a != '--profile-startup'])
+    profile.mark('QApplication')
+    snapshot = SiteSnapshot(Site(capacity=0, name="Cozy", staff=[], chairs=[])) if os.environ.get('COZY_SERVER') else SiteSnapshot.load(SITE_HOME)
+    profile.mark('snapshot loaded')
+    window = ChairTrackingUI(snapshot)
+    profile.mark('window built')
+    QTimer.singleShot(0, lambda: profile.mark('event loop running'))
+
+    def quitting() -> None:
+        # pending writes are done in the background, make sure they reach the disk before leaving
+        window.close_site()
+        if metrics_exporter is not None:
+            metrics_exporter.stop()
+
+    app.aboutToQuit.connect(quitting)
+    # the site is loaded and changed from asyncio code running on Qt's own event loop, the way
+    # cozy.model.aio.run_with_qt does it without importing the controller before the window shows
+    from PySide6 import QtAsyncio
+    QtAsyncio.run(load_site(window, profile), keep_running=True, quit_qapp=True)
+
+
 if __name__ == '__main__':
-    app = QApplication([])
-    window = ChairTrackingUI()
-    app.exec()
+    main()
@@ -1,4 +1,5 @@
-from datetime import timedelta, datetime
+import math
+from datetime import timedelta
 from PySide6.QtCore import QTimer, Qt, Signal, Slot
 from PySide6.QtGui import QIcon, QFont
 from PySide6.QtWidgets import (
@@ -13,6 +14,8 @@ from PySide6.QtWidgets import (
     QFontDialog
 )
 
+from cozy.model.session import StaffSessionManager
+
 
 class StaffProgressWidget(QWidget):
     staff_added = Signal(str)
@@ -31,12 +34,24 @@ class StaffProgressWidget(QWidget):
         self.progress_bar: QProgressBar | None = None
         self.staff_buttons = {}
         self.current_staff = None
-        self.timer = None
-        self.grace_period_start = None
         self.grace_period_duration = timedelta(seconds=5)
         self.active_time_seconds = 10
         self.timer_granularity_steps_per_seconds = 100
 
+        # the session decides when it expires and wakes up once for it, the repaint timer only runs while the bar is
+        # visibly going down
+        self.session = StaffSessionManager(self.grace_period_duration, timedelta(seconds=self.active_time_seconds), self.wake_up_later)
+        self.session.on_started(self.session_started)
+        self.session.on_expired(self.session_expired)
+        self.deadline_timer = QTimer(self)
+        self.deadline_timer.setSingleShot(True)
+        self.deadline_timer.timeout.connect(self.session.check)
+        self.wind_down_timer = QTimer(self)
+        self.wind_down_timer.setSingleShot(True)
+        self.wind_down_timer.timeout.connect(self.update_progress)
+        self.repaint_timer = QTimer(self)
+        self.repaint_timer.timeout.connect(self.update_progress)
+
         self.init_ui()
 
     def init_ui(self):
@@ -108,39 +123,53 @@ class StaffProgressWidget(QWidget):
 
     def start_progress(self):
         sender = self.sender()  # Button object that sent the signal
-        staff_name = sender.text()
-
-        self.progress_bar.setValue(self.progress_bar.maximum())
-        # Allow restarting progress for the same staff member
-        if self.current_staff == staff_name and self.timer.isActive():
-            return
+        # selecting the staff member already active simply extends their session
+        self.session.start(sender.text())
+        self.update_progress()
 
+    def session_started(self, staff_name: str):
         self.current_staff = staff_name
         self.progress_bar.setEnabled(True)
         self.progress_bar.setFormat(self.current_staff + "  %p%")
+        self.staff_selected.emit(self.current_staff)
 
-        if self.timer and self.timer.isActive():
-            self.timer.stop()
-
-        self.grace_period_start = datetime.utcnow()
-        self.timer = QTimer(self)
-        self.timer.setInterval(int(1000/self.timer_granularity_steps_per_seconds))  # 1-second interval
-        self.timer.timeout.connect(self.update_progress)
-        self.timer.start()
+    def session_expired(self, staff_name: str):
+        # Progress bar finished, disable it and clear label, but allow restart
+        self.repaint_timer.stop()
+        self.wind_down_timer.stop()
+        self.current_staff = None
+        self.progress_bar.setValue(0)
+        self.progress_bar.setEnabled(False)
+        self.progress_bar.setFormat("%p%")
+        self.staff_selection_cleared.emit()
 
-        self.staff_selected.emit(self.current_staff)
+    def wake_up_later(self, delay: float):
+        self.deadline_timer.start(math.ceil(delay * 1000))
 
     def update_progress(self):
-        if self.progress_bar.value() > 0:
-            if datetime.utcnow() - self.grace_period_start > self.grace_period_duration:
-                self.progress_bar.setValue(self.progress_bar.value() - 1)
-        else:
-            # Progress bar finished, disable it and clear label, but allow restart
-            self.current_staff = None
-            self.progress_bar.setEnabled(False)
-            self.progress_bar.setFormat("%p%")
-            self.staff_selection_cleared.emit()
+        if not self.session.is_active:
+            self.repaint_timer.stop()
+            return
+        self.progress_bar.setValue(round(self.session.remaining() * self.progress_bar.maximum()))
+        until_wind_down = self.session.winding_down_at - self.session.clock()
+        if until_wind_down > 0:
+            # full until the grace period is over, nothing to repaint before then
+            self.repaint_timer.stop()
+            self.wind_down_timer.start(math.ceil(until_wind_down * 1000))
+        elif self.isVisible() and not self.repaint_timer.isActive():
+            refresh_rate = self.screen().refreshRate() if self.screen() else 0
+            self.repaint_timer.start(max(16, int(1000 / refresh_rate)) if refresh_rate else 33)
 
     def extend_grace_period(self):
-        self.grace_period_start = datetime.utcnow()
-        self.progress_bar.setValue(self.progress_bar.maximum())
+        self.session.extend()
+        self.update_progress()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update_progress()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        # the session keeps its own deadline, only the painting stops
+        self.repaint_timer.stop()
+        self.wind_down_timer.stop()
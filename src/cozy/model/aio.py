@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from concurrent.futures import Executor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Coroutine, TypeVar
+
+from cozy.model.api import SiteController
+from cozy.model.clients import ClientDirectory
+from cozy.model.history import EventQuery
+from cozy.model.models import Site, Chair, Staff, EventLog, Event
+from cozy.model.persistence import WriteBehindWriter
+
+T = TypeVar('T')
+
+logger = logging.getLogger(__name__)
+
+
+# asyncio flavour of SiteController. The site itself is only touched from the event loop : a mutation changes it and
+# hands its events to the background writer, which takes the site lock and writes them, then waits for the writer in
+# an executor. A commit the writer refused raises from the mutation awaiting it. Checkpoints are taken on the loop once
+# the writer caught up, so they never wait on it there. Anything else that reads or waits on the disk (loading the
+# site, the full event log, checking for other processes' changes, flushing) runs in an executor and is awaited.
+class AsyncSiteController:
+
+    def __init__(self, controller: SiteController, executor: Executor | None = None) -> None:
+        if not isinstance(controller.writer, WriteBehindWriter):
+            raise ValueError("AsyncSiteController needs a SiteController persisting through a WriteBehindWriter")
+        self.controller = controller
+        self.executor = executor
+        controller.checkpoint_on_commit = False
+
+    @classmethod
+    async def open(cls, site_home: Path, executor: Executor | None = None, **controller_options: Any) -> 'AsyncSiteController':
+        loop = asyncio.get_running_loop()
+        controller = await loop.run_in_executor(executor, partial(SiteController, site_home, **controller_options))
+        return cls(controller, executor)
+
+    async def _off_loop(self, fn: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    @property
+    def site(self) -> Site:
+        return self.controller.site
+
+    @property
+    def active_staff(self) -> Staff | None:
+        return self.controller.active_staff
+
+    @active_staff.setter
+    def active_staff(self, staff: str | Staff | None) -> None:
+        self.controller.active_staff = staff
+
+    @property
+    def clients(self) -> ClientDirectory:
+        # built from the disk on first use, await load_clients() beforehand to keep that off the loop
+        return self.controller.clients
+
+    async def load_clients(self) -> ClientDirectory:
+        return await self._off_loop(lambda: self.controller.clients)
+
+    async def _written(self) -> None:
+        # no await between the last check and the checkpoint : nothing can be handed to the writer in between
+        while self.controller.writing:
+            await self._off_loop(self.controller.wait_written)
+        self.controller.wait_written()
+        if self.controller.checkpoint_due:
+            self.controller.save_site()
+
+    async def occupy_chair(self, chair: Chair) -> None:
+        self.controller.occupy_chair(chair)
+        await self._written()
+
+    async def free_chair(self, chair: Chair) -> None:
+        self.controller.free_chair(chair)
+        await self._written()
+
+    async def move_occupant(self, source: Chair, destination: Chair) -> None:
+        self.controller.move_occupant(source, destination)
+        await self._written()
+
+    async def resize(self, capacity: int) -> list[tuple[Chair, Chair]]:
+        moves = self.controller.resize(capacity)
+        await self._written()
+        return moves
+
+    async def add_staff(self, staff_name: str) -> None:
+        self.controller.add_staff(staff_name)
+        await self._written()
+
+    async def reload_if_changed(self) -> bool:
+        # the version file is read off the loop, the site is only caught up on the loop when another process wrote
+        if not await self._off_loop(self.controller.changed_on_disk):
+            return False
+        return self.controller.reload_if_changed()
+
+    async def event_log(self) -> EventLog:
+        return await self._off_loop(lambda: self.controller.event_log)
+
+    async def query(self, query: EventQuery) -> list[Event]:
+        # only loading the log waits on the disk, the query itself runs on the loop where the log is appended to
+        await self.event_log()
+        return self.controller.query(query)
+
+    async def export_event_log(self, destination: Path | None = None) -> Path:
+        return await self._off_loop(self.controller.export_event_log, destination)
+
+    async def flush(self) -> None:
+        await self._off_loop(self.controller.flush)
+
+    async def close(self) -> None:
+        await self._off_loop(self.controller.close)
+
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+def schedule(coro: Coroutine) -> asyncio.Task:
+    # fire and forget from a Qt slot : keeps the task alive until it is done and logs whatever it raised
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+
+    def done(t: asyncio.Task) -> None:
+        _background_tasks.discard(t)
+        if not t.cancelled() and t.exception() is not None:
+            logger.error("Background site operation failed", exc_info=t.exception())
+
+    task.add_done_callback(done)
+    return task
+
+
+def run_with_qt(main: Coroutine) -> None:
+    # Bridge into the Qt event loop : PySide6 (6.6 and up) ships QtAsyncio, an asyncio event loop driven by Qt's own.
+    # `main` typically opens the AsyncSiteController and builds the window, slots then call schedule(api.occupy_chair(c))
+    # and the loop keeps running until the QApplication quits.
+    from PySide6 import QtAsyncio
+    QtAsyncio.run(main, keep_running=True, quit_qapp=True)
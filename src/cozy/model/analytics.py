@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from cozy.model.models import Event, EventLog, ChairTakeEvent, ChairLeaveEvent
+
+try:
+    import numpy as np
+except ImportError:  # no cov
+    np = None
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("Occupancy analytics need numpy, install cozy[analytics]")
+
+
+# Every stay found in an event history as three parallel arrays : the chair, when the client took it and when they
+# left (NaT while the chair is still occupied). Metrics are computed over the whole table at once.
+class StayTable:
+
+    def __init__(self, chair_ids: 'np.ndarray', starts: 'np.ndarray', ends: 'np.ndarray') -> None:
+        _require_numpy()
+        self.chair_ids = chair_ids
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def from_events(cls, events: Iterable[Event]) -> 'StayTable':
+        _require_numpy()
+        chair_ids: list[int] = []
+        times: list[datetime] = []
+        takes: list[bool] = []
+        for event in events:
+            if isinstance(event, ChairTakeEvent):
+                takes.append(True)
+            elif isinstance(event, ChairLeaveEvent):
+                takes.append(False)
+            else:
+                continue
+            chair_ids.append(event.chair.id)
+            times.append(event.when)
+        return cls.from_arrays(np.asarray(chair_ids, dtype=np.int32), np.asarray(times, dtype='datetime64[us]'), np.asarray(takes, dtype=np.bool_))
+
+    @classmethod
+    def from_event_log(cls, event_log: EventLog) -> 'StayTable':
+        return cls.from_events(event_log.events)
+
+    @classmethod
+    def from_event_logs(cls, event_logs: Iterable[EventLog]) -> 'StayTable':
+        # archived days one after the other, a stay may start in one log and end in the next
+        return cls.from_events(e for event_log in event_logs for e in event_log.events)
+
+    @classmethod
+    def from_arrays(cls, chair_ids: 'np.ndarray', times: 'np.ndarray', takes: 'np.ndarray') -> 'StayTable':
+        # group by chair keeping time order within a chair, then a take followed by a leave of the same chair is a
+        # stay. A take followed by another take (a missed leave) ends when the chair was taken again.
+        order = np.lexsort((times, chair_ids))
+        chair_ids, times, takes = chair_ids[order], times[order], takes[order]
+        same_chair_next = np.zeros(len(chair_ids), dtype=np.bool_)
+        same_chair_next[:-1] = chair_ids[:-1] == chair_ids[1:]
+        next_times = np.full(len(times), np.datetime64('NaT'), dtype='datetime64[us]')
+        next_times[:-1] = times[1:]
+        ends = np.where(same_chair_next, next_times, np.datetime64('NaT'))
+        return cls(chair_ids[takes], times[takes], ends[takes])
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @property
+    def closed(self) -> 'np.ndarray':
+        return ~np.isnat(self.ends)
+
+    def durations(self) -> 'np.ndarray':
+        return self.ends[self.closed] - self.starts[self.closed]
+
+    def average_stay(self) -> timedelta | None:
+        durations = self.durations()
+        if len(durations) == 0:
+            return None
+        return durations.mean().astype('timedelta64[us]').item()
+
+    def stay_percentiles(self, percentiles: Iterable[float] = (50, 90, 99)) -> dict[float, timedelta]:
+        durations = self.durations().astype(np.int64)
+        percentiles = list(percentiles)
+        if len(durations) == 0:
+            return {}
+        values = np.percentile(durations, percentiles)
+        return {p: timedelta(microseconds=float(v)) for p, v in zip(percentiles, values)}
+
+    def occupancy_at(self, moments: 'np.ndarray') -> 'np.ndarray':
+        # occupied chairs at each moment : stays started at or before it minus stays already ended
+        moments = np.asarray(moments, dtype='datetime64[us]')
+        starts = np.sort(self.starts)
+        ends = np.sort(self.ends[self.closed])
+        return np.searchsorted(starts, moments, side='right') - np.searchsorted(ends, moments, side='right')
+
+    def peak_occupancy(self) -> tuple[int, datetime | None]:
+        if len(self.starts) == 0:
+            return 0, None
+        ends = self.ends[self.closed]
+        moments = np.concatenate((self.starts, ends))
+        deltas = np.concatenate((np.ones(len(self.starts), dtype=np.int64), -np.ones(len(ends), dtype=np.int64)))
+        # a leave and a take at the same moment are counted leave first
+        order = np.lexsort((deltas, moments))
+        running = np.cumsum(deltas[order])
+        peak = int(np.argmax(running))
+        return int(running[peak]), moments[order][peak].item()
+
+    def occupancy_per_hour(self, start: datetime | None = None, end: datetime | None = None) -> tuple['np.ndarray', 'np.ndarray']:
+        # occupied chairs at every hour mark of the period covered
+        if len(self.starts) == 0:
+            return np.array([], dtype='datetime64[h]'), np.array([], dtype=np.int64)
+        first = np.datetime64(start, 'h') if start is not None else self.starts.min().astype('datetime64[h]')
+        last_known = np.concatenate((self.starts, self.ends[self.closed])).max()
+        last = np.datetime64(end, 'h') if end is not None else last_known.astype('datetime64[h]')
+        hours = np.arange(first, last + np.timedelta64(1, 'h'), np.timedelta64(1, 'h'))
+        return hours, self.occupancy_at(hours)
+
+    def turnover_per_chair(self) -> dict[int, int]:
+        if len(self.chair_ids) == 0:
+            return {}
+        chair_ids, counts = np.unique(self.chair_ids, return_counts=True)
+        return dict(zip(chair_ids.tolist(), counts.tolist()))
@@ -1,19 +1,72 @@
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import Generator
+from uuid import UUID
 
-from cozy.model.models import Site, Chair, EventLog, ChairTakeEvent, ChairLeaveEvent, Staff, StaffAddEvent
+from cozy.model.checkpoint import CheckpointStore, Checkpoint
+from cozy.model.clients import ClientDirectory
+from cozy.model.history import EventIndex, EventQuery
+from cozy.model.journal import EventJournal, SLIM, FULL
+from cozy.model.locking import FileLock, SiteVersionConflictError, read_version, write_version
+from cozy.model.metrics import SiteMetrics, instrumented
+from cozy.model.persistence import WriteBehindWriter, DirectWriter, AppendOnlyFile, atomic_write_text
+from cozy.model.models import Site, Chair, Client, EventLog, ChairTakeEvent, ChairLeaveEvent, Staff, StaffAddEvent, Event, \
+    StaffRegistry, ClientAddEvent, ClientRemoveEvent, SiteResizedEvent, SiteException
+from cozy.model.replay import apply_event
+from cozy.model.slim import migrate_site
+
+
+class SiteClosedError(SiteException):
+    def __init__(self, home: Path) -> None:
+        super().__init__(f"The site [{home}] was closed, open it again to change it")
+        self.home = home
 
 
 class SiteController:
 
-    def __init__(self, site_home: Path) -> None:
+    def __init__(self, site_home: Path, checkpoint_interval: int = 200, writer: WriteBehindWriter | DirectWriter | None = None, staff_registry: StaffRegistry | None = None, locking: bool = True, metrics: SiteMetrics | None = None) -> None:
+        started = time.perf_counter()
         self.home = site_home
         self.current_site_state = self.home / 'site_state.json'
         self.current_event_log_file = self.home / 'current_event_log.json'
+        # new journals refer to chairs, staff and clients by id, journals started before keep their full records. Ids
+        # are handed out under the site lock, without it journals keep full records.
+        self.journal = EventJournal(self.home / 'journal.jsonl', format=SLIM if locking else FULL)
+        self.checkpoints = CheckpointStore(self.home / 'checkpoints')
+        self.checkpoint_interval = checkpoint_interval
+        # off when whoever drives the controller checkpoints once the writer caught up, see AsyncSiteController
+        self.checkpoint_on_commit = True
+        # mutations are persisted by the writer, in the background unless told otherwise
+        self._owns_writer = writer is None
+        self.writer = writer if writer is not None else WriteBehindWriter()
+        self.staff_registry = staff_registry
+        # off unless given, every hook below then costs a single check
+        self.metrics = metrics
         self.data_folder = self.home / 'data'
         self._site: Site | None = None
         self._active_staff: Staff | None = None
+        self._event_log: EventLog | None = None
+        # events committed while the event log is being read from the journal, the reader catches up with them
+        self._event_log_lock = threading.Lock()
+        self._loading_lock = threading.Lock()
+        self._committed_while_loading: list[Event] | None = None
+        self.clients_file = self.home / 'clients.json'
+        self.event_index_file = self.home / 'event_index.json'
+        # both only get what changed since the last checkpoint appended
+        self._clients_output = AppendOnlyFile(self.clients_file)
+        self._event_index_output = AppendOnlyFile(self.event_index_file)
+        self._clients: ClientDirectory | None = None
+        self._journal_offset = 0
+        self._event_count = 0
+        # the events known to be in the journal, behind _event_count while the writer has commits of ours to write
+        self._journal_event_count = 0
+        self._last_event_id: UUID | None = None
+        self._checkpoint_event_count = 0
+        self._transaction: Transaction | None = None
+        self._diverged = False
+        self._write_error: BaseException | None = None
+        self._closed = False
 
         if not self.home.exists():
             self.home.mkdir()
@@ -21,42 +74,391 @@ class SiteController:
         if not self.data_folder.exists():
             self.data_folder.mkdir()
 
-        if not self.current_site_state.exists():
-            self._site = Site(capacity=25, name="Cozy", staff=[], chairs=[])
-            self.save_site()
+        if not locking and self.journal.exists() and self.journal.read_format() == SLIM:
+            raise ValueError(f"The journal of [{self.home}] refers to names by id, it can only be written with locking on")
+
+        # with locking on (the default), several processes may share this home : every commit takes the lock and is
+        # checked against the version on disk. Turning it off is only for homes a single process ever opens.
+        self.version_file = self.home / 'version'
+        self.lock = FileLock(self.home / '.lock') if locking else None
+        self._locked_journal = _LockedJournal(self)
+        if self.lock is not None:
+            with self.lock:
+                self._open()
+                self._repair_version()
         else:
-            self._site = Site.model_validate_json(self.current_site_state.read_text(encoding='utf-8'))
+            self._open()
 
-        if not self.current_event_log_file.exists():
+        self._intern_staff(self._site)
+
+        if self.metrics is not None:
+            self.metrics.observe('open', time.perf_counter() - started)
+            self.metrics.set_log_length(str(self.home), self._event_count)
+
+    def _open(self) -> None:
+        if self.journal.exists():
+            self._site = self._load()
+        elif self.current_event_log_file.exists():
+            # an event log saved before the journal existed, it becomes the start of the journal and the site state
+            # saved alongside it is the state right after its last event
+            event_log = EventLog.model_validate_json(self.current_event_log_file.read_text(encoding='utf8'))
+            self._site = self._load_legacy_site_state()
+            self.journal.start_from(event_log)
+            self._journal_offset = self.journal.first_event_offset()
+            for self._journal_offset, event in self.journal.events():
+                self._event_count += 1
+                self._last_event_id = event.id
+            self._site.version = self._journal_event_count = self._event_count
+            self.save_site()
+        else:
             # finally we will start a new EventLog
-            self.event_log = EventLog(initial_site_state=self._site.model_copy(deep=True))
+            self._site = self._load_legacy_site_state()
+            self.journal.start(self._site.model_copy(deep=True))
+            self._journal_offset = self.journal.first_event_offset()
+            self.save_site()
+
+    def _load_legacy_site_state(self) -> Site:
+        if self.current_site_state.exists():
+            return Site.model_validate_json(self.current_site_state.read_text(encoding='utf-8'))
+        return Site(capacity=25, name="Cozy", staff=[], chairs=[])
+
+    def _load(self) -> Site:
+        # start from the newest checkpoint matching the journal and only replay the events written after it
+        checkpoint = self.checkpoints.latest_valid(self.journal)
+        if checkpoint is not None:
+            site = checkpoint.site
+            self._journal_offset = checkpoint.offset
+            self._event_count = self._checkpoint_event_count = checkpoint.event_count
+            self._last_event_id = checkpoint.last_event_id
         else:
-            self.event_log = EventLog.model_validate_json(self.current_event_log_file.read_text(encoding='utf8'))
+            site = self.journal.read_initial_site_state() or self._load_legacy_site_state()
+            self._journal_offset = self.journal.first_event_offset()
+            self._event_count = self._checkpoint_event_count = 0
+            self._last_event_id = None
+        self._replay_tail(site)
+        return site
+
+    def _replay_tail(self, site: Site) -> None:
+        for self._journal_offset, event in self.journal.events(self._journal_offset):
+            apply_event(site, event)
+            self._event_count += 1
+            self._last_event_id = event.id
+        site.version = self._event_count
+        self._journal_event_count = self._event_count
+        self._intern_staff(site)
+
+    def _intern_staff(self, site: Site) -> None:
+        # checkpoints and replayed events bring their own staff objects, the registry's ones are used instead
+        if self.staff_registry is not None:
+            site.staff = [self.staff_registry.intern(s) for s in site.staff]
+
+    def _repair_version(self) -> None:
+        # under the lock, the journal is what counts : a crash between its write and the version's, or a torn version
+        # file, leaves the version behind the events and every commit would then conflict
+        if read_version(self.version_file) != self._event_count:
+            write_version(self.version_file, self._event_count)
+
+    @property
+    def version(self) -> int:
+        return self._event_count
+
+    def changed_on_disk(self) -> bool:
+        # tells if reload_if_changed has anything to do, reading the version file is all it costs
+        if self.lock is None:
+            return False
+        self._wait_for_commits()
+        return self._diverged or read_version(self.version_file) != self._event_count
+
+    def reload_if_changed(self) -> bool:
+        # catches up with what other processes committed
+        if not self.changed_on_disk():
+            return False
+        with self.lock:
+            if self._diverged:
+                # this site holds changes that never made it to disk, start over from what is there
+                self._site.restore(self._load(), self.staff_registry)
+                self._diverged = False
+                self._write_error = None
+            elif read_version(self.version_file) != self._event_count:
+                self._replay_tail(self._site)
+            else:
+                return False
+            self._repair_version()
+            if self._clients is not None:
+                self._clients.catch_up(self.journal)
+        with self._event_log_lock:
+            self._event_log = None
+            self._committed_while_loading = None
+        return True
 
     @property
     def site(self) -> Site:
         return self._site
 
+    @property
+    def event_log(self) -> EventLog:
+        # the full history is only parsed when someone actually needs it
+        event_log = self._event_log
+        if event_log is not None:
+            return event_log
+        with self._loading_lock:
+            if self._event_log is not None:
+                return self._event_log
+            started = time.perf_counter()
+            # it may be read on another thread while events keep being committed, those committed from now on are
+            # kept aside and whichever of them the journal did not hold yet are appended before the log is published
+            with self._event_log_lock:
+                loaded_from = self._event_count
+                committed = self._committed_while_loading = []
+            self.writer.flush()
+            event_log = self.journal.to_event_log()
+            if self.event_index_file.exists():
+                # the indexes saved last time, only the events recorded since are indexed again
+                event_log.index = EventIndex.load(self.event_index_file, event_log)
+            with self._event_log_lock:
+                for event in committed[max(0, len(event_log.events) - loaded_from):]:
+                    event_log.append(event)
+                if self._committed_while_loading is committed:
+                    # not published when the site was reloaded meanwhile
+                    self._event_log = event_log
+                    self._committed_while_loading = None
+            if self.metrics is not None:
+                self.metrics.observe('load_event_log', time.perf_counter() - started)
+        return event_log
+
+    @property
+    def clients(self) -> ClientDirectory:
+        # built on first use from the saved directory plus the journal written since, then kept current as events come
+        if self._clients is None:
+            self.writer.flush()
+            self._clients = ClientDirectory.load(self.clients_file, self.journal)
+        return self._clients
+
+    @instrumented('save_site')
     def save_site(self):
-        self.current_site_state.write_text(data=self.site.model_dump_json(indent=2), encoding='utf-8')
-        if self.event_log:
-            self.current_event_log_file.write_text(data=self.event_log.model_dump_json(indent=2), encoding='utf-8')
+        # checkpoint the site state at the current journal position, site_state.json is only a readable copy of it
+        if self.lock is not None:
+            # the position is only known once the writer wrote our commits
+            self._wait_for_commits()
+            self._check_diverged()
+        checkpoint_size = self.checkpoints.write(Checkpoint(offset=self._journal_offset, event_count=self._event_count, last_event_id=self._last_event_id, when=datetime.utcnow(), site=self.site), self.writer)
+        self._checkpoint_event_count = self._event_count
+        data = self.site.model_dump_json(indent=2).encode('utf-8')
+        self.writer.replace(self.current_site_state, data)
+        if self._clients is not None:
+            self._clients.save(self._clients_output, self.writer)
+        if self._event_log is not None and self._event_log.indexed:
+            self._event_log.index.save(self._event_index_output, self.writer)
+        if self.metrics is not None:
+            self.metrics.wrote('checkpoint', checkpoint_size)
+            self.metrics.wrote('site_state', len(data))
+
+    @instrumented('export_event_log')
+    def export_event_log(self, destination: Path | None = None) -> Path:
+        destination = destination if destination is not None else self.current_event_log_file
+        atomic_write_text(destination, self.event_log.model_dump_json(indent=2))
+        return destination
+
+    @instrumented('query')
+    def query(self, query: EventQuery) -> list[Event]:
+        # audit and reports : the recorded events matching a query built with cozy.model.history, oldest first
+        return self.event_log.query(query)
+
+    def record(self, event: Event) -> None:
+        self._record([event])
+
+    def _record(self, events: list[Event]) -> None:
+        if self._transaction is not None:
+            self._transaction.events.extend(events)
+            return
+        self._commit(events)
 
+    def _commit(self, events: list[Event]) -> None:
+        # all the events end up in the journal through a single write
+        if self._closed:
+            raise SiteClosedError(self.home)
+        if not events:
+            return
+        if self.lock is None:
+            data = self.journal.encode(events)
+            self._journal_offset += len(data)
+            self.writer.append(self.journal, data)
+            self._journal_event_count += len(events)
+            if self.metrics is not None:
+                self.metrics.wrote('journal', len(data))
+        else:
+            # checked, encoded and written by the writer under the lock, a failure there diverges the site
+            self._check_diverged()
+            self.writer.commit(self._locked_journal, events)
+        with self._event_log_lock:
+            if self._event_log is not None:
+                for event in events:
+                    self._event_log.append(event)
+            elif self._committed_while_loading is not None:
+                self._committed_while_loading.extend(events)
+            self._event_count += len(events)
+        if self._clients is not None:
+            self._clients.apply_events(events)
+            if self.lock is None:
+                self._clients.offset = self._journal_offset
+        self._last_event_id = events[-1].id
+        self._site.version = self._event_count
+        if self.metrics is not None:
+            self.metrics.recorded(str(self.home), [type(e).__name__ for e in events], self._event_count)
+        if self.checkpoint_on_commit and self.checkpoint_due:
+            self.save_site()
+
+    @property
+    def checkpoint_due(self) -> bool:
+        return self._event_count - self._checkpoint_event_count >= self.checkpoint_interval
+
+    @property
+    def writing(self) -> bool:
+        # commits handed to the writer that it has not written yet
+        return self._journal_event_count != self._event_count and not self._diverged
+
+    def wait_written(self) -> None:
+        # blocks until the writer wrote every commit so far, raises when it had to refuse one
+        self._wait_for_commits()
+        self._check_diverged()
+
+    def _write_locked(self, events: list[Event], sync: bool) -> None:
+        # on the writer's thread : other processes never see the new version without its events
+        try:
+            with self.lock:
+                found = read_version(self.version_file)
+                if found is not None and found != self._journal_event_count:
+                    raise SiteVersionConflictError(self._journal_event_count, found)
+                # encoded only now, the names other processes declared are all known once we are up to date
+                data = self.journal.encode(events)
+                self._journal_offset = self.journal.write(data)
+                if sync:
+                    self.journal.sync()
+                write_version(self.version_file, self._journal_event_count + len(events))
+                self._journal_event_count += len(events)
+        except BaseException as e:
+            # some of the events may be on disk, the next reload starts over from what is there
+            self._write_error = e
+            self._diverged = True
+            raise
+        if self._clients is not None:
+            self._clients.offset = self._journal_offset
+        if self.metrics is not None:
+            self.metrics.wrote('journal', len(data))
+
+    def _wait_for_commits(self) -> None:
+        # blocks until the writer wrote our commits or gave up on them
+        if self.writing:
+            self.writer.flush()
+
+    def _check_diverged(self) -> None:
+        # once a commit failed the site holds events the journal does not, it is reloaded before writing again
+        if self._diverged:
+            found = read_version(self.version_file)
+            raise SiteVersionConflictError(self._journal_event_count, found if found is not None else self._journal_event_count) from self._write_error
+
+    def transaction(self) -> 'Transaction':
+        return Transaction(self)
+
+    @instrumented('occupy_chair')
     def occupy_chair(self, chair: Chair):
-        self.event_log.append(ChairTakeEvent(when=datetime.utcnow(), by=self.active_staff, chair=chair))
-        self.save_site()
+        # events keep a snapshot of the chair, the live one keeps changing with the site
+        self.record(ChairTakeEvent(when=datetime.utcnow(), by=self.active_staff, chair=chair.model_copy(deep=True)))
 
+    @instrumented('free_chair')
     def free_chair(self, chair: Chair):
-        self.event_log.append(ChairLeaveEvent(when=datetime.utcnow(), by=self.active_staff, chair=chair))
-        self.save_site()
+        self.record(ChairLeaveEvent(when=datetime.utcnow(), by=self.active_staff, chair=chair.model_copy(deep=True)))
+
+    @instrumented('move_occupant')
+    def move_occupant(self, source: Chair, destination: Chair):
+        with self.transaction():
+            destination.take(source.occupant, since=source.since)
+            self.occupy_chair(destination)
+            source.release()
+            self.free_chair(source)
 
+    @instrumented('resize')
+    def resize(self, capacity: int) -> list[tuple[Chair, Chair]]:
+        # whoever sits past the new capacity is moved down first, the moves and the resize are recorded as one batch.
+        # If the batch cannot be committed the site goes back to the size and seating it had.
+        if capacity == self.site.capacity:
+            return []
+        with self.transaction():
+            moves = self.site.relocations(capacity)
+            when = datetime.utcnow()
+            resized = SiteResizedEvent(when=when, by=self.active_staff, capacity=capacity)
+            events: list[Event] = []
+            for source, destination in moves:
+                occupant, since = source.occupant, source.since
+                destination.take(occupant, since=since)
+                source.release()
+                # the snapshots are built rather than deep copied, a few thousand moves add up
+                events.append(ChairTakeEvent(when=when, by=self.active_staff, chair=Chair(id=destination.id, occupant=occupant.model_copy(), since=since)))
+                events.append(ChairLeaveEvent(when=when, by=self.active_staff, chair=Chair(id=source.id, occupant=None, since=None)))
+            self.site.init_chairs(capacity)
+            events.append(resized)
+            self._record(events)
+        return moves
+
+    @instrumented('add_staff')
     def add_staff(self, staff_name: str):
         if not self.site.has_staff(staff_name):
             staff = Staff(name=staff_name)
-            self.site.staff.append(staff)
-            self.event_log.append(StaffAddEvent(when=datetime.utcnow(), by=self.active_staff if self.active_staff else staff, who=staff))
+            if self.staff_registry is not None:
+                staff = self.staff_registry.intern(staff)
+            self.site.add_staff(staff)
+            self.record(StaffAddEvent(when=datetime.utcnow(), by=self.active_staff if self.active_staff else staff, who=staff))
+
+    def add_client(self, client_name: str):
+        if client_name not in self.clients:
+            self.record(ClientAddEvent(when=datetime.utcnow(), by=self.active_staff, who=Client(name=client_name)))
+
+    def remove_client(self, client_name: str):
+        # forgets a client, their past stays in the journal but they are no longer suggested
+        if client_name in self.clients:
+            self.record(ClientRemoveEvent(when=datetime.utcnow(), by=self.active_staff, who=Client(name=client_name)))
+
+    @instrumented('flush')
+    def flush(self) -> None:
+        # blocks until every mutation so far is on disk, call it before shutting down. Raises when some never made it.
+        self.writer.flush()
+        self._check_diverged()
+
+    def migrate_journal(self) -> None:
+        # rewrites a journal of full records with slim ones and checkpoints the site against the new one. Every other
+        # process using this home must be stopped first, they would keep appending to the journal being replaced.
+        if self.lock is None:
+            raise ValueError("Slim journals are only written with locking on")
+        self.flush()
+        with self.lock:
+            self.journal.close()
+            migrate_site(self.home)
+            self.journal = EventJournal(self.journal.path, format=SLIM)
+            self._journal_offset = self.journal.path.stat().st_size
+            if self._clients is not None:
+                self._clients.offset = self._journal_offset
             self.save_site()
 
+    def close(self) -> None:
+        # nothing can be recorded afterwards, another controller may already own the home
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._wait_for_commits()
+            if not self._diverged and self._event_count != self._checkpoint_event_count:
+                self.save_site()
+            if self._owns_writer:
+                self.writer.close()
+            else:
+                self.writer.flush()
+        finally:
+            self.journal.close()
+            self._clients_output.close()
+            self._event_index_output.close()
+        # events that never made it to the journal are not dropped silently
+        self._check_diverged()
+
     @property
     def active_staff(self) -> Staff | None:
         return self._active_staff
@@ -71,12 +473,47 @@ class SiteController:
         self._active_staff = staff
 
 
+class _LockedJournal:
+    # the journal of a home other processes write to, as the writer sees it : events are handed over rather than
+    # bytes, slim records can only be encoded under the lock once the names declared elsewhere are known
+    def __init__(self, controller: SiteController) -> None:
+        self.controller = controller
+
+    def commit(self, events: list[Event], sync: bool) -> None:
+        self.controller._write_locked(events, sync)
+
+    def sync(self) -> None:
+        self.controller.journal.sync()
+
+
 class Transaction:
-    def __init__(self) -> None:
-        pass
+    # Groups several mutations : their events are kept aside and written as one unit when the block ends. If the block
+    # raises, the site goes back to what it was when the transaction started and none of its events are kept. Nested
+    # transactions simply join the outer one.
+    def __init__(self, controller: SiteController) -> None:
+        self.controller = controller
+        self.events: list[Event] = []
+        self._site_state: Site | None = None
+        self._joined = False
 
     def __enter__(self) -> 'Transaction':
-        pass
+        if self.controller._transaction is not None:
+            self._joined = True
+            return self.controller._transaction
+        self._site_state = self.controller.site.model_copy(deep=True)
+        self.controller._transaction = self
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
-        pass
+        if self._joined:
+            return
+        self.controller._transaction = None
+        if exc_type is None:
+            try:
+                self.controller._commit(self.events)
+            except BaseException:
+                self.controller.site.restore(self._site_state, self.controller.staff_registry)
+                raise
+        else:
+            self.controller.site.restore(self._site_state, self.controller.staff_registry)
+            self.events.clear()
@@ -0,0 +1,360 @@
+import argparse
+import struct
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import BinaryIO, Callable, Generator, Protocol
+from uuid import UUID
+
+from cozy.model.models import Site, Chair, Event, EventLog, EventRegistry, SiteException, EVENT_LOG_VIEWS, \
+    SiteResizedEvent, ChairTakeEvent, ChairLeaveEvent, StaffAddEvent, StaffRemoveEvent, ClientAddEvent, ClientRemoveEvent
+
+# File layout : a header (magic, schema version, content kind) followed by records. Every record is a one byte type
+# tag and a four bytes payload length, so a reader can skip record types it does not know about.
+MAGIC = b'COZY'
+SCHEMA_VERSION = 1
+KIND_EVENT_LOG = 1
+KIND_SITE = 2
+
+TAG_INITIAL_SITE = 0x01
+TAG_FINAL_SITE = 0x02
+TAG_SITE = 0x03
+
+_header = struct.Struct('<4sHB')
+_record = struct.Struct('<BI')
+_u16 = struct.Struct('<H')
+_i32 = struct.Struct('<i')
+_i64 = struct.Struct('<q')
+_when = struct.Struct('<qi')
+_event_head = struct.Struct('<16sqiH')  # id, when and the length of the staff name, read in one go
+
+_NONE_STR = 0xFFFF
+_NONE_TIME = -(2 ** 63)
+_NAIVE = -(2 ** 31)
+_EPOCH = datetime(1970, 1, 1)
+
+
+class BinaryFormatError(SiteException):
+    pass
+
+
+class _Writer:
+    def __init__(self) -> None:
+        self.parts: list[bytes] = []
+
+    def str(self, value: str | None) -> None:
+        if value is None:
+            self.parts.append(_u16.pack(_NONE_STR))
+            return
+        data = value.encode('utf-8')
+        if len(data) >= _NONE_STR:
+            raise BinaryFormatError(f"Strings are limited to [{_NONE_STR - 1}] bytes, this one takes [{len(data)}]")
+        self.parts.append(_u16.pack(len(data)))
+        self.parts.append(data)
+
+    def i32(self, value: int) -> None:
+        self.parts.append(_i32.pack(value))
+
+    def i64(self, value: int) -> None:
+        self.parts.append(_i64.pack(value))
+
+    def uuid(self, value: UUID) -> None:
+        self.parts.append(value.bytes)
+
+    def when(self, value: datetime | None) -> None:
+        # microseconds since the epoch plus the utc offset in seconds, naive datetimes stay naive
+        if value is None:
+            self.parts.append(_when.pack(_NONE_TIME, _NAIVE))
+        elif value.tzinfo is None:
+            self.parts.append(_when.pack((value - _EPOCH) // timedelta(microseconds=1), _NAIVE))
+        else:
+            seconds, rest = divmod(value.utcoffset(), timedelta(seconds=1))
+            if rest:
+                raise BinaryFormatError(f"Utc offsets are stored in whole seconds, [{value.utcoffset()}] is not")
+            local = value.replace(tzinfo=None)
+            self.parts.append(_when.pack((local - _EPOCH) // timedelta(microseconds=1), seconds))
+
+    def bytes(self) -> bytes:
+        return b''.join(self.parts)
+
+
+class _Reader:
+    def __init__(self, data: bytes | memoryview) -> None:
+        self.data = data
+        self.position = 0
+
+    def str(self) -> str | None:
+        (length,) = _u16.unpack_from(self.data, self.position)
+        self.position += 2
+        if length == _NONE_STR:
+            return None
+        value = bytes(self.data[self.position:self.position + length]).decode('utf-8')
+        self.position += length
+        return value
+
+    def i32(self) -> int:
+        (value,) = _i32.unpack_from(self.data, self.position)
+        self.position += 4
+        return value
+
+    def i64(self) -> int:
+        (value,) = _i64.unpack_from(self.data, self.position)
+        self.position += 8
+        return value
+
+    def uuid(self) -> UUID:
+        value = UUID(bytes=bytes(self.data[self.position:self.position + 16]))
+        self.position += 16
+        return value
+
+    def when(self) -> datetime | None:
+        micros, offset = _when.unpack_from(self.data, self.position)
+        self.position += _when.size
+        return self.when_from(micros, offset)
+
+    @staticmethod
+    def when_from(micros: int, offset: int) -> datetime | None:
+        if micros == _NONE_TIME:
+            return None
+        value = _EPOCH + timedelta(microseconds=micros)
+        return value if offset == _NAIVE else value.replace(tzinfo=timezone(timedelta(seconds=offset)))
+
+
+def _write_chair(w: _Writer, chair: Chair) -> None:
+    w.i32(chair.id)
+    w.str(chair.occupant.name if chair.occupant is not None else None)
+    w.when(chair.since)
+
+
+# readers build plain dicts, the models are validated from them in one go which is much faster than building each one
+def _read_chair(r: _Reader) -> dict:
+    chair_id = r.i32()
+    name = r.str()
+    return {'id': chair_id, 'occupant': {'name': name} if name is not None else None, 'since': r.when()}
+
+
+def _write_site(w: _Writer, site: Site) -> None:
+    w.str(site.name)
+    w.i32(site.capacity)
+    w.i64(site.version)
+    w.i32(len(site.staff))
+    for s in site.staff:
+        w.str(s.name)
+    w.i32(len(site.chairs))
+    for c in site.chairs:
+        _write_chair(w, c)
+
+
+def _read_site(r: _Reader) -> dict:
+    name = r.str()
+    capacity = r.i32()
+    version = r.i64()
+    staff = [{'name': r.str()} for _ in range(r.i32())]
+    chairs = [_read_chair(r) for _ in range(r.i32())]
+    return {'name': name, 'capacity': capacity, 'version': version, 'staff': staff, 'chairs': chairs}
+
+
+# per event type : its record tag, how to write what it adds to Event and how to read those fields back
+_EVENT_CODECS: EventRegistry[tuple[int, Callable[[_Writer, Event], None], Callable[[_Reader], dict]]] = EventRegistry({
+    SiteResizedEvent: (0x10, lambda w, e: w.i32(e.capacity), lambda r: {'capacity': r.i32()}),
+    ChairTakeEvent: (0x11, lambda w, e: _write_chair(w, e.chair), lambda r: {'chair': _read_chair(r)}),
+    ChairLeaveEvent: (0x12, lambda w, e: _write_chair(w, e.chair), lambda r: {'chair': _read_chair(r)}),
+    StaffAddEvent: (0x13, lambda w, e: w.str(e.who.name), lambda r: {'who': {'name': r.str()}}),
+    StaffRemoveEvent: (0x14, lambda w, e: w.str(e.who.name), lambda r: {'who': {'name': r.str()}}),
+    ClientAddEvent: (0x15, lambda w, e: w.str(e.who.name), lambda r: {'who': {'name': r.str()}}),
+    ClientRemoveEvent: (0x16, lambda w, e: w.str(e.who.name), lambda r: {'who': {'name': r.str()}}),
+})
+_EVENT_TYPES_BY_TAG = {_EVENT_CODECS.handler_for(t)[0]: t for t in _EVENT_CODECS.types()}
+
+
+def encode_event(event: Event) -> tuple[int, bytes]:
+    tag, write, _ = _EVENT_CODECS.handler_for(type(event))
+    w = _Writer()
+    w.uuid(event.id)
+    w.when(event.when)
+    w.str(event.by.name)
+    write(w, event)
+    return tag, w.bytes()
+
+
+def _decode_event_fields(event_type: type[Event], payload: bytes | memoryview) -> dict:
+    event_id, micros, offset, length = _event_head.unpack_from(payload, 0)
+    r = _Reader(payload)
+    r.position = _event_head.size - _u16.size
+    when = r.when_from(micros, offset)
+    fields = {'id': UUID(bytes=event_id), 'when': when, 'by': {'name': r.str()}}
+    fields.update(_EVENT_CODECS.handler_for(event_type)[2](r))
+    return fields
+
+
+def decode_event(tag: int, payload: bytes | memoryview) -> Event:
+    event_type = _EVENT_TYPES_BY_TAG[tag]
+    return event_type.model_validate(_decode_event_fields(event_type, payload))
+
+
+def _record_bytes(tag: int, payload: bytes) -> bytes:
+    return _record.pack(tag, len(payload)) + payload
+
+
+def _site_record(tag: int, site: Site) -> bytes:
+    w = _Writer()
+    _write_site(w, site)
+    return _record_bytes(tag, w.bytes())
+
+
+def dump_event_log(event_log: EventLog) -> bytes:
+    parts = [_header.pack(MAGIC, SCHEMA_VERSION, KIND_EVENT_LOG)]
+    if event_log.initial_site_state is not None:
+        parts.append(_site_record(TAG_INITIAL_SITE, event_log.initial_site_state))
+    parts.extend(_record_bytes(*encode_event(e)) for e in event_log.events)
+    if event_log.final_site_state is not None:
+        parts.append(_site_record(TAG_FINAL_SITE, event_log.final_site_state))
+    return b''.join(parts)
+
+
+def dump_site(site: Site) -> bytes:
+    return _header.pack(MAGIC, SCHEMA_VERSION, KIND_SITE) + _site_record(TAG_SITE, site)
+
+
+def _check_header(data: bytes, kind: int) -> None:
+    if len(data) < _header.size:
+        raise BinaryFormatError("Not a cozy binary file, it is too short")
+    magic, version, found_kind = _header.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise BinaryFormatError("Not a cozy binary file, the magic number is wrong")
+    if version > SCHEMA_VERSION:
+        raise BinaryFormatError(f"This file uses schema version [{version}], this cozy only reads up to [{SCHEMA_VERSION}]")
+    if found_kind != kind:
+        raise BinaryFormatError(f"Expected content kind [{kind}] but this file holds [{found_kind}]")
+
+
+def _records(data: bytes, kind: int):
+    _check_header(data, kind)
+    view = memoryview(data)
+    position = _header.size
+    while position < len(data):
+        tag, length = _record.unpack_from(data, position)
+        position += _record.size
+        if position + length > len(data):
+            raise BinaryFormatError(f"Truncated record at byte offset [{position - _record.size}]")
+        yield tag, view[position:position + length]
+        position += length
+
+
+def iter_event_log_records(stream: BinaryIO) -> Generator[tuple[int, bytes], None, None]:
+    # same records as _records but read one at a time from an open file, the whole log never sits in memory
+    _check_header(stream.read(_header.size), KIND_EVENT_LOG)
+    while frame := stream.read(_record.size):
+        if len(frame) < _record.size:
+            raise BinaryFormatError("Truncated record header at the end of the file")
+        tag, length = _record.unpack(frame)
+        payload = stream.read(length)
+        if len(payload) < length:
+            raise BinaryFormatError(f"Truncated record at byte offset [{stream.tell() - len(payload) - _record.size}]")
+        yield tag, payload
+
+
+def event_type_for_tag(tag: int) -> type[Event] | None:
+    return _EVENT_TYPES_BY_TAG.get(tag)
+
+
+def read_site_record(payload: bytes | memoryview) -> Site:
+    return Site.model_validate(_read_site(_Reader(payload)))
+
+
+def load_event_log(data: bytes) -> EventLog:
+    fields: dict = {'initial_site_state': None, 'event_order': []}
+    views = {event_type: fields.setdefault(EVENT_LOG_VIEWS.handler_for(event_type), []) for event_type in _EVENT_CODECS.types()}
+    for tag, payload in _records(data, KIND_EVENT_LOG):
+        event_type = _EVENT_TYPES_BY_TAG.get(tag)
+        if event_type is not None:
+            event = _decode_event_fields(event_type, payload)
+            fields['event_order'].append(event['id'])
+            views[event_type].append(event)
+        elif tag == TAG_INITIAL_SITE:
+            fields['initial_site_state'] = _read_site(_Reader(payload))
+        elif tag == TAG_FINAL_SITE:
+            fields['final_site_state'] = _read_site(_Reader(payload))
+        # unknown tags come from a newer minor revision, they are skipped
+    return EventLog.model_validate(fields)
+
+
+def load_site(data: bytes) -> Site:
+    for tag, payload in _records(data, KIND_SITE):
+        if tag == TAG_SITE:
+            return Site.model_validate(_read_site(_Reader(payload)))
+    raise BinaryFormatError("No site found in this file")
+
+
+class Codec(Protocol):
+    def dump_event_log(self, event_log: EventLog) -> bytes: ...
+    def load_event_log(self, data: bytes) -> EventLog: ...
+    def dump_site(self, site: Site) -> bytes: ...
+    def load_site(self, data: bytes) -> Site: ...
+
+
+class JsonCodec:
+    def dump_event_log(self, event_log: EventLog) -> bytes:
+        return event_log.model_dump_json(indent=2).encode('utf-8')
+
+    def load_event_log(self, data: bytes) -> EventLog:
+        return EventLog.model_validate_json(data)
+
+    def dump_site(self, site: Site) -> bytes:
+        return site.model_dump_json(indent=2).encode('utf-8')
+
+    def load_site(self, data: bytes) -> Site:
+        return Site.model_validate_json(data)
+
+
+class BinaryCodec:
+    def dump_event_log(self, event_log: EventLog) -> bytes:
+        return dump_event_log(event_log)
+
+    def load_event_log(self, data: bytes) -> EventLog:
+        return load_event_log(data)
+
+    def dump_site(self, site: Site) -> bytes:
+        return dump_site(site)
+
+    def load_site(self, data: bytes) -> Site:
+        return load_site(data)
+
+
+def codec_for(data: bytes) -> Codec:
+    # files written by either codec can be read without knowing which one wrote them
+    return BinaryCodec() if data[:len(MAGIC)] == MAGIC else JsonCodec()
+
+
+def read_event_log(path: Path) -> EventLog:
+    data = path.read_bytes()
+    return codec_for(data).load_event_log(data)
+
+
+def read_site(path: Path) -> Site:
+    data = path.read_bytes()
+    return codec_for(data).load_site(data)
+
+
+def convert_json_file(source: Path, destination: Path | None = None) -> Path:
+    # site_state.json, current_event_log.json or any other file holding either of them
+    destination = destination if destination is not None else source.with_suffix('.cozy')
+    data = source.read_bytes()
+    try:
+        converted = dump_event_log(EventLog.model_validate_json(data))
+    except ValueError:
+        converted = dump_site(Site.model_validate_json(data))
+    destination.write_bytes(converted)
+    return destination
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert cozy JSON site and event log files to the binary format")
+    parser.add_argument('files', type=Path, nargs='+')
+    args = parser.parse_args()
+    for source in args.files:
+        destination = convert_json_file(source)
+        print(f"{source} [{source.stat().st_size} bytes] -> {destination} [{destination.stat().st_size} bytes]")
+
+
+if __name__ == '__main__':
+    main()
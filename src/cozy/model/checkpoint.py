@@ -0,0 +1,53 @@
+from datetime import datetime
+from pathlib import Path
+from uuid import UUID
+
+from pydantic import BaseModel
+
+from cozy.model.journal import EventJournal
+from cozy.model.models import Site
+from cozy.model.persistence import WriteBehindWriter, DirectWriter
+
+
+class Checkpoint(BaseModel):
+    # the site state as it was right after the event ending at this journal byte offset
+    offset: int
+    event_count: int
+    last_event_id: UUID | None
+    when: datetime
+    site: Site
+
+
+class CheckpointStore:
+
+    def __init__(self, folder: Path, keep: int = 3) -> None:
+        self.folder = folder
+        self.keep = keep
+
+    def write(self, checkpoint: Checkpoint, writer: WriteBehindWriter | DirectWriter | None = None) -> int:
+        # returns the size of the serialized checkpoint
+        if not self.folder.exists():
+            self.folder.mkdir()
+        data = checkpoint.model_dump_json().encode('utf-8')
+        (writer or DirectWriter()).replace(self.folder / f'checkpoint_{checkpoint.offset:012d}.json', data, on_written=self.prune)
+        return len(data)
+
+    def prune(self) -> None:
+        for old in self.paths()[self.keep:]:
+            old.unlink(missing_ok=True)
+
+    def paths(self) -> list[Path]:
+        # newest first, the zero padded offset in the name makes lexical order the journal order
+        if not self.folder.exists():
+            return []
+        return sorted(self.folder.glob('checkpoint_*.json'), reverse=True)
+
+    def latest_valid(self, journal: EventJournal) -> Checkpoint | None:
+        for path in self.paths():
+            try:
+                checkpoint = Checkpoint.model_validate_json(path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                continue
+            if journal.record_ends_at(checkpoint.offset, checkpoint.last_event_id):
+                return checkpoint
+        return None
@@ -0,0 +1,344 @@
+import unicodedata
+from collections import Counter, deque
+from datetime import datetime
+from itertools import chain
+from pathlib import Path
+from typing import Callable, Iterable
+from uuid import UUID
+
+from pydantic import BaseModel
+
+from cozy.model.journal import EventJournal
+from cozy.model.models import Event, EventRegistry, ChairTakeEvent, ClientAddEvent, ClientRemoveEvent
+from cozy.model.persistence import WriteBehindWriter, DirectWriter, AppendOnlyFile
+
+
+class ClientEntry(BaseModel):
+    # ids are handed out in the order clients first show up in the journal, so rebuilding gives the same ones
+    id: int
+    name: str
+    visits: int = 0
+    last_seen: datetime | None = None
+
+
+class ClientDirectoryState(BaseModel):
+    # the directory as it was right after the journal record ending at `offset`. When `since` is given, only the entries
+    # changed and the ids removed after the journal record ending there.
+    since: int | None = None
+    offset: int
+    last_event_id: UUID | None
+    next_id: int
+    entries: list[ClientEntry]
+    removed: list[int] = []
+
+
+def normalize(text: str) -> str:
+    # case and accents do not matter when looking a client up
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ' '.join(''.join(c for c in decomposed if not unicodedata.combining(c)).split())
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _TrieNode:
+    __slots__ = ('children', 'ids')
+
+    def __init__(self) -> None:
+        self.children: dict[str, _TrieNode] = {}
+        self.ids: dict[int, None] = {}
+
+
+# Every word of every client name, so "smi" finds "John Smith". Completion walks the subtree under the typed prefix,
+# shortest words first, and stops as soon as it has enough clients.
+class PrefixTrie:
+
+    def __init__(self) -> None:
+        self.root = _TrieNode()
+
+    def add(self, word: str, client_id: int) -> None:
+        node = self.root
+        for c in word:
+            node = node.children.setdefault(c, _TrieNode())
+        node.ids[client_id] = None
+
+    def remove(self, word: str, client_id: int) -> None:
+        path = [self.root]
+        for c in word:
+            node = path[-1].children.get(c)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].ids.pop(client_id, None)
+        # prune the branch that no longer leads anywhere
+        for parent, c, node in zip(reversed(path[:-1]), reversed(word), reversed(path)):
+            if node.ids or node.children:
+                break
+            del parent.children[c]
+
+    def complete(self, prefix: str, accept: Callable[[int], bool], limit: int) -> list[int]:
+        node = self._node(prefix)
+        found: list[int] = []
+        seen: set[int] = set()
+        # breadth first, a level holds the words one letter longer than the level before, in alphabetical order
+        queue = deque([node] if node is not None else [])
+        while queue and len(found) < limit:
+            node = queue.popleft()
+            for client_id in node.ids:
+                if client_id not in seen:
+                    seen.add(client_id)
+                    if accept(client_id):
+                        found.append(client_id)
+            queue.extend(node.children[c] for c in sorted(node.children))
+        return found[:limit]
+
+    def _node(self, word: str) -> _TrieNode | None:
+        node = self.root
+        for c in word:
+            node = node.children.get(c)
+            if node is None:
+                return None
+        return node
+
+
+# Every client the site has seen, for occupant autocompletion. It follows the journal : a taken chair adds its occupant
+# (or counts one more visit), ClientAddEvent / ClientRemoveEvent add and forget clients explicitly. apply() is called
+# as events are recorded and catch_up() reads only the journal records written since the directory was last saved.
+# Saved as JSON lines : the whole directory once, then only the clients each save found changed.
+class ClientDirectory:
+
+    def __init__(self) -> None:
+        self._entries: dict[int, ClientEntry] = {}
+        self._by_name: dict[str, int] = {}
+        self._keys: dict[int, str] = {}
+        self._trie = PrefixTrie()
+        self._trigrams: dict[str, set[int]] = {}
+        self._trigram_counts: dict[int, int] = {}
+        self._next_id = 1
+        self.offset = 0
+        self.last_event_id: UUID | None = None
+        # the offset at the last save and what changed since, None when the saved file is not known to match
+        self._saved_offset: int | None = None
+        self._changed: set[int] = set()
+        self._removed: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, name: str) -> bool:
+        return normalize(name) in self._by_name
+
+    def get(self, name: str) -> ClientEntry | None:
+        client_id = self._by_name.get(normalize(name))
+        return self._entries[client_id] if client_id is not None else None
+
+    def by_id(self, client_id: int) -> ClientEntry | None:
+        return self._entries.get(client_id)
+
+    def add(self, name: str, when: datetime | None = None, visit: bool = False) -> ClientEntry:
+        key = normalize(name)
+        client_id = self._by_name.get(key)
+        if client_id is None:
+            entry = self._index(ClientEntry(id=self._next_id, name=name.strip()))
+            self._next_id += 1
+        else:
+            entry = self._entries[client_id]
+        if visit:
+            entry.visits += 1
+        if when is not None and (entry.last_seen is None or when > entry.last_seen):
+            entry.last_seen = when
+        self._changed.add(entry.id)
+        return entry
+
+    def remove(self, name: str) -> None:
+        client_id = self._by_name.pop(normalize(name), None)
+        if client_id is None:
+            return
+        self._entries.pop(client_id)
+        self._changed.discard(client_id)
+        self._removed.add(client_id)
+        del self._trigram_counts[client_id]
+        key = self._keys.pop(client_id)[1:]
+        for word in set(key.split()):
+            self._trie.remove(word, client_id)
+        for trigram in _trigrams(key):
+            ids = self._trigrams.get(trigram)
+            if ids is not None:
+                ids.discard(client_id)
+                if not ids:
+                    del self._trigrams[trigram]
+
+    def _index(self, entry: ClientEntry) -> ClientEntry:
+        key = normalize(entry.name)
+        self._entries[entry.id] = entry
+        self._by_name[key] = entry.id
+        self._keys[entry.id] = ' ' + key
+        for word in set(key.split()):
+            self._trie.add(word, entry.id)
+        trigrams = _trigrams(key)
+        for trigram in trigrams:
+            self._trigrams.setdefault(trigram, set()).add(entry.id)
+        self._trigram_counts[entry.id] = len(trigrams)
+        return entry
+
+    def apply(self, event: Event) -> None:
+        _DIRECTORY_APPLIERS.handler_for(type(event))(self, event)
+        self.last_event_id = event.id
+
+    def apply_events(self, events: Iterable[Event]) -> None:
+        for event in events:
+            self.apply(event)
+
+    def catch_up(self, journal: EventJournal) -> int:
+        # applies whatever the journal holds past this directory's offset, returns how many events that was
+        count = 0
+        offset = self.offset or journal.first_event_offset()
+        for offset, event in journal.events(offset):
+            self.apply(event)
+            count += 1
+        self.offset = offset
+        return count
+
+    def complete(self, text: str, limit: int = 10) -> list[ClientEntry]:
+        # every word typed so far must start a word of the name, the last one may still be incomplete
+        words = normalize(text).split()
+        if not words:
+            return []
+        # keys are kept with a leading space, " jean" in " marie jeanne" tells a word starts with "jean"
+        required = [' ' + w for w in words[:-1]]
+        keys = self._keys
+
+        def accept(client_id: int) -> bool:
+            key = keys[client_id]
+            return all(w in key for w in required)
+
+        # a few more than asked for so the regulars among them come first
+        found = self._trie.complete(words[-1], accept if required else lambda i: True, limit * 4)
+        found.sort(key=lambda i: (-self._entries[i].visits, self._keys[i]))
+        return [self._entries[i] for i in found[:limit]]
+
+    def search(self, text: str, limit: int = 10, min_similarity: float = 0.3) -> list[ClientEntry]:
+        # typo tolerant : clients sharing the most three letter groups with the text
+        query = _trigrams(normalize(text))
+        if not query:
+            return []
+        shared = Counter(chain.from_iterable(self._trigrams.get(t, ()) for t in query))
+        # a client sharing fewer than this many cannot reach the similarity asked for whatever its length
+        least = min_similarity * len(query)
+        scored = []
+        for client_id, count in shared.items():
+            if count < least:
+                continue
+            similarity = count / (len(query) + self._trigram_counts[client_id] - count)
+            if similarity >= min_similarity:
+                scored.append((-similarity, -self._entries[client_id].visits, client_id))
+        return [self._entries[client_id] for _, _, client_id in sorted(scored)[:limit]]
+
+    def suggest(self, text: str, limit: int = 10) -> list[ClientEntry]:
+        # what the occupant field offers as you type : prefix matches, topped up with close spellings
+        found = self.complete(text, limit)
+        if len(found) < limit:
+            ids = {e.id for e in found}
+            found += [e for e in self.search(text, limit) if e.id not in ids][:limit - len(found)]
+        return found
+
+    def state(self) -> ClientDirectoryState:
+        return ClientDirectoryState(offset=self.offset, last_event_id=self.last_event_id, next_id=self._next_id,
+                                    entries=list(self._entries.values()))
+
+    @classmethod
+    def from_state(cls, state: ClientDirectoryState) -> 'ClientDirectory':
+        directory = cls()
+        for entry in state.entries:
+            directory._index(entry)
+        directory._next_id = state.next_id
+        directory.offset = state.offset
+        directory.last_event_id = state.last_event_id
+        return directory
+
+    def _unsaved_state(self) -> ClientDirectoryState:
+        return ClientDirectoryState(since=self._saved_offset, offset=self.offset, last_event_id=self.last_event_id,
+                                    next_id=self._next_id, entries=[self._entries[i] for i in sorted(self._changed)],
+                                    removed=sorted(self._removed))
+
+    def save(self, file: AppendOnlyFile, writer: WriteBehindWriter | DirectWriter | None = None) -> None:
+        # only the clients changed since the last save are appended, the whole directory is written once, when the file
+        # is not known to hold the rest
+        writer = writer or DirectWriter()
+        if self._saved_offset is None or file.rewriting:
+            file.rewrite(self.state().model_dump_json().encode('utf-8') + b'\n', writer)
+        elif self.offset != self._saved_offset or self._changed or self._removed:
+            writer.append(file, self._unsaved_state().model_dump_json().encode('utf-8') + b'\n')
+        self._saved_offset = self.offset
+        self._changed.clear()
+        self._removed.clear()
+
+    @classmethod
+    def load(cls, path: Path, journal: EventJournal) -> 'ClientDirectory':
+        # starts from the saved directory when it still matches the journal, from scratch otherwise
+        directory = None
+        try:
+            with path.open('rb') as f:
+                state, complete = cls._read(f)
+            if state is not None and journal.record_ends_at(state.offset, state.last_event_id):
+                directory = cls.from_state(state)
+                if complete:
+                    directory._saved_offset = directory.offset
+        except OSError:
+            pass
+        directory = directory or cls()
+        directory.catch_up(journal)
+        return directory
+
+    @staticmethod
+    def _read(lines: Iterable[bytes]) -> tuple[ClientDirectoryState | None, bool]:
+        # the whole directory with the changes each save added merged in, up to the first record that does not follow
+        # on. Tells if every record did and the file can be appended to as it is.
+        state = None
+        entries: dict[int, ClientEntry] = {}
+        complete = True
+        for line in lines:
+            try:
+                record = ClientDirectoryState.model_validate_json(line)
+            except ValueError:
+                complete = False
+                break
+            if (state is None) != (record.since is None) or (state is not None and record.since != state.offset):
+                complete = False
+                break
+            for client_id in record.removed:
+                entries.pop(client_id, None)
+            entries.update((e.id, e) for e in record.entries)
+            state = record
+            # a record missing its newline was torn, or saved before the directory was saved a line at a time
+            complete = line.endswith(b'\n')
+        if state is None:
+            return None, False
+        return state.model_copy(update={'since': None, 'entries': list(entries.values()), 'removed': []}), complete
+
+
+def _apply_chair_take(directory: ClientDirectory, event: ChairTakeEvent) -> None:
+    if event.chair.occupant is not None and event.chair.occupant.name.strip():
+        directory.add(event.chair.occupant.name, event.when, visit=True)
+
+
+def _apply_client_add(directory: ClientDirectory, event: ClientAddEvent) -> None:
+    directory.add(event.who.name, event.when)
+
+
+def _apply_client_remove(directory: ClientDirectory, event: ClientRemoveEvent) -> None:
+    directory.remove(event.who.name)
+
+
+def _apply_nothing(directory: ClientDirectory, event: Event) -> None:
+    pass
+
+
+_DIRECTORY_APPLIERS: EventRegistry[Callable[[ClientDirectory, Event], None]] = EventRegistry({
+    Event: _apply_nothing,
+    ChairTakeEvent: _apply_chair_take,
+    ClientAddEvent: _apply_client_add,
+    ClientRemoveEvent: _apply_client_remove,
+})
@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+from typing import Any, Iterator
+
+from cozy.model.models import Site, Chair, Client, DoubleOccupancyError
+
+try:
+    import numpy as np
+except ImportError:  # no cov
+    np = None
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("The columnar chair storage needs numpy, install cozy[columnar]")
+
+
+# Compact, array backed storage for the chairs of very large sites. Each chair is one row over a handful of columns
+# and occupant names live once in an interned name table. Chair objects are only built when asked for one and are
+# snapshots : changes go through take and release.
+#
+# A standalone utility : Site, SiteController and the journal keep working on Chair models and never read from it.
+# Build one from a site (from_site) for bulk queries or compact storage and turn it back into a site with to_site.
+class ChairColumns:
+    _NO_OCCUPANT = -1
+
+    def __init__(self, capacity: int = 0) -> None:
+        _require_numpy()
+        self.ids = np.arange(1, capacity + 1, dtype=np.int32)
+        self.occupied = np.zeros(capacity, dtype=np.bool_)
+        self.occupant = np.full(capacity, self._NO_OCCUPANT, dtype=np.int32)
+        self.since = np.full(capacity, np.datetime64('NaT'), dtype='datetime64[us]')
+        self.names: list[str] = []
+        self._name_index: dict[str, int] = {}
+
+    @classmethod
+    def from_chairs(cls, chairs: list[Chair]) -> 'ChairColumns':
+        columns = cls(0)
+        columns.ids = np.fromiter((c.id for c in chairs), dtype=np.int32, count=len(chairs))
+        columns.occupant = np.fromiter((columns.intern(c.occupant.name) if c.occupant else cls._NO_OCCUPANT for c in chairs), dtype=np.int32, count=len(chairs))
+        columns.occupied = columns.occupant != cls._NO_OCCUPANT
+        columns.since = np.array([c.since if c.since is not None else 'NaT' for c in chairs], dtype='datetime64[us]')
+        return columns
+
+    @classmethod
+    def from_site(cls, site: Site) -> 'ChairColumns':
+        return cls.from_chairs(site.chairs)
+
+    def intern(self, name: str) -> int:
+        index = self._name_index.get(name)
+        if index is None:
+            index = self._name_index[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[Chair]:
+        for row in range(len(self.ids)):
+            yield self._materialize(row)
+
+    def chair(self, chair_id: int) -> Chair:
+        return self._materialize(chair_id - 1)
+
+    def to_chairs(self) -> list[Chair]:
+        return list(self)
+
+    def _materialize(self, row: int) -> Chair:
+        if not self.occupied[row]:
+            return Chair(id=int(self.ids[row]), occupant=None, since=None)
+        since = self.since[row]
+        return Chair(
+            id=int(self.ids[row]),
+            occupant=Client(name=self.names[self.occupant[row]]),
+            since=since.astype(datetime) if not np.isnat(since) else None,
+        )
+
+    @property
+    def busy_count(self) -> int:
+        return int(np.count_nonzero(self.occupied))
+
+    def take(self, chair_id: int, client: Client, since: datetime | None = None) -> None:
+        row = chair_id - 1
+        if self.occupied[row]:
+            raise DoubleOccupancyError(self.chair(chair_id), client)
+        self.occupied[row] = True
+        self.occupant[row] = self.intern(client.name)
+        self.since[row] = since if since is not None else datetime.now()
+
+    def release(self, chair_id: int) -> None:
+        row = chair_id - 1
+        self.occupied[row] = False
+        self.occupant[row] = self._NO_OCCUPANT
+        self.since[row] = np.datetime64('NaT')
+
+    def resize(self, capacity: int) -> None:
+        # only grows or drops trailing free chairs, relocating occupants is the site's business
+        current = len(self.ids)
+        if capacity < current and self.occupied[capacity:].any():
+            raise ValueError(f"Chairs above [{capacity}] are still occupied")
+        if capacity <= current:
+            self.ids, self.occupied, self.occupant, self.since = (c[:capacity].copy() for c in (self.ids, self.occupied, self.occupant, self.since))
+            return
+        grown = ChairColumns(capacity)
+        grown.ids[:current], grown.occupied[:current], grown.occupant[:current], grown.since[:current] = self.ids, self.occupied, self.occupant, self.since
+        self.ids, self.occupied, self.occupant, self.since = grown.ids, grown.occupied, grown.occupant, grown.since
+
+    def free_chair_ids(self) -> 'np.ndarray':
+        return self.ids[~self.occupied]
+
+    def occupied_longer_than(self, duration: timedelta, now: datetime | None = None) -> 'np.ndarray':
+        now = np.datetime64(now if now is not None else datetime.now(), 'us')
+        limit = now - np.timedelta64(duration)
+        # NaT never compares true so free chairs drop out on their own
+        return self.ids[self.occupied & (self.since <= limit)]
+
+    def occupant_names(self, chair_ids: Any) -> list[str]:
+        rows = np.asarray(chair_ids, dtype=np.int64) - 1
+        return [self.names[i] if i != self._NO_OCCUPANT else '' for i in self.occupant[rows]]
+
+    def to_dict(self) -> dict:
+        # compact serialized form, one list per column instead of one object per chair
+        return {
+            'ids': self.ids.tolist(),
+            'occupant': self.occupant.tolist(),
+            'since': np.datetime_as_string(self.since).tolist(),
+            'names': list(self.names),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ChairColumns':
+        columns = cls(0)
+        columns.names = list(data['names'])
+        columns._name_index = {name: i for i, name in enumerate(columns.names)}
+        columns.ids = np.asarray(data['ids'], dtype=np.int32)
+        columns.occupant = np.asarray(data['occupant'], dtype=np.int32)
+        columns.occupied = columns.occupant != cls._NO_OCCUPANT
+        columns.since = np.asarray(data['since'], dtype='datetime64[us]')
+        return columns
+
+    def to_site(self, name: str, staff: list | None = None) -> Site:
+        return Site(capacity=len(self.ids), name=name, staff=staff or [], chairs=self.to_chairs())
@@ -0,0 +1,261 @@
+import argparse
+import csv
+import json
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Generator, Iterable, NamedTuple, Sequence
+
+from cozy.model.models import Event, ChairTakeEvent, ChairLeaveEvent
+from cozy.model.reader import read_events
+
+try:
+    import numpy as np
+except ImportError:  # no cov
+    np = None
+
+_CHAIR_EVENTS = (ChairTakeEvent, ChairLeaveEvent)
+
+
+# One client on one chair, from the take to the leave. A plain tuple rather than a model, exports hold millions of them.
+class Stay(NamedTuple):
+    chair_id: int
+    client: str
+    start: datetime
+    end: datetime | None
+    taken_by: str
+    freed_by: str | None
+
+    @property
+    def duration_seconds(self) -> float | None:
+        return (self.end - self.start).total_seconds() if self.end is not None else None
+
+
+# Pairs chair takes with the leave that follows on the same chair, the same way StayTable does : a take followed by
+# another take (a missed leave) ends when the chair was taken again. Only the stays still open are kept in memory.
+class StayBuilder:
+
+    def __init__(self) -> None:
+        self.open: dict[int, Stay] = {}
+        # the first chair event seen for each chair, (is a take, when, by whom), what a stay left open by the archive
+        # before this one is closed with
+        self.firsts: dict[int, tuple[bool, datetime, str]] = {}
+
+    def feed(self, event: Event) -> Stay | None:
+        chair_id = event.chair.id
+        taking = isinstance(event, ChairTakeEvent)
+        self.firsts.setdefault(chair_id, (taking, event.when, event.by.name))
+        previous = self.open.pop(chair_id, None)
+        if taking and event.chair.occupant is not None:
+            self.open[chair_id] = Stay(chair_id, event.chair.occupant.name, event.when, None, event.by.name, None)
+        if previous is None:
+            return None
+        return previous._replace(end=event.when, freed_by=None if taking else event.by.name)
+
+    def chunks(self, events: Iterable[Event], chunk_size: int) -> Generator[list[Stay], None, None]:
+        # the stays closed by the events, at most chunk_size at a time
+        chunk: list[Stay] = []
+        for event in events:
+            stay = self.feed(event)
+            if stay is not None:
+                chunk.append(stay)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+
+def iter_stays(archives: Iterable[Path], chunk_size: int = 10_000) -> Generator[list[Stay], None, None]:
+    # archives one after the other, a stay may start in one and end in the next. Stays still open at the end come last.
+    builder = StayBuilder()
+    for archive in archives:
+        yield from builder.chunks(read_events(archive, types=_CHAIR_EVENTS), chunk_size)
+    if builder.open:
+        yield list(builder.open.values())
+
+
+class CsvStayWriter:
+    COLUMNS = ('chair_id', 'client', 'start', 'end', 'duration_seconds', 'taken_by', 'freed_by')
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.rows = 0
+        self._file = path.open('w', newline='', encoding='utf-8')
+        self._csv = csv.writer(self._file)
+        self._csv.writerow(self.COLUMNS)
+
+    def write(self, stays: Sequence[Stay]) -> None:
+        self._csv.writerows((s.chair_id, s.client, s.start.isoformat(), s.end.isoformat() if s.end is not None else '',
+                             s.duration_seconds if s.end is not None else '', s.taken_by, s.freed_by or '') for s in stays)
+        self.rows += len(stays)
+
+    def append_part(self, part: Path, chunk_size: int = 10_000) -> None:
+        # rows of a file written by another CsvStayWriter minus the header, parsed back as a quoted name may span lines
+        with part.open('r', newline='', encoding='utf-8') as f:
+            rows = csv.reader(f)
+            next(rows, None)
+            while chunk := list(islice(rows, chunk_size)):
+                self._csv.writerows(chunk)
+                self.rows += len(chunk)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> 'CsvStayWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+# Column oriented export : a directory holding one raw little endian file per column and columns.json describing them.
+# Times are microseconds since the epoch (NaT for stays still open), names are codes into the `names` list of
+# columns.json (-1 for none). Every chunk is appended to the column files as it comes, numpy reads them back whole or
+# memory mapped.
+class ColumnStayWriter:
+    COLUMNS = {'chair_id': '<i4', 'client': '<i4', 'start': '<i8', 'end': '<i8', 'taken_by': '<i4', 'freed_by': '<i4'}
+    _NAME_COLUMNS = ('client', 'taken_by', 'freed_by')
+    _NONE = -1
+
+    def __init__(self, path: Path) -> None:
+        _require_numpy()
+        self.path = path
+        self.rows = 0
+        self.names: dict[str, int] = {}
+        path.mkdir(parents=True, exist_ok=True)
+        self._files = {column: (path / f'{column}.bin').open('wb') for column in self.COLUMNS}
+
+    def _code(self, name: str | None) -> int:
+        if name is None:
+            return self._NONE
+        return self.names.setdefault(name, len(self.names))
+
+    def write(self, stays: Sequence[Stay]) -> None:
+        columns = {
+            'chair_id': np.fromiter((s.chair_id for s in stays), dtype='<i4', count=len(stays)),
+            'start': np.array([s.start for s in stays], dtype='datetime64[us]').view('<i8'),
+            'end': np.array([s.end for s in stays], dtype='datetime64[us]').view('<i8'),
+        }
+        for column in self._NAME_COLUMNS:
+            columns[column] = np.fromiter((self._code(getattr(s, column)) for s in stays), dtype='<i4', count=len(stays))
+        self._append(columns)
+
+    def _append(self, columns: dict[str, 'np.ndarray']) -> None:
+        for column, values in columns.items():
+            values.astype(self.COLUMNS[column], copy=False).tofile(self._files[column])
+        self.rows += len(columns['chair_id'])
+
+    def append_part(self, part: Path, chunk_size: int = 100_000) -> None:
+        # rows of a directory written by another ColumnStayWriter, read back a chunk at a time with their names recoded
+        meta = json.loads((part / 'columns.json').read_text(encoding='utf-8'))
+        # index -1 of the lookup is the last entry, which stays "none"
+        recode = np.array([self._code(name) for name in meta['names']] + [self._NONE], dtype='<i4')
+        handles = {column: (part / f'{column}.bin').open('rb') for column in self.COLUMNS}
+        try:
+            for _ in range(0, meta['rows'], chunk_size):
+                columns = {column: np.fromfile(handles[column], dtype=dtype, count=chunk_size) for column, dtype in self.COLUMNS.items()}
+                for column in self._NAME_COLUMNS:
+                    columns[column] = recode[columns[column]]
+                self._append(columns)
+        finally:
+            for handle in handles.values():
+                handle.close()
+
+    def close(self) -> None:
+        for handle in self._files.values():
+            handle.close()
+        meta = {'rows': self.rows, 'columns': self.COLUMNS, 'names': list(self.names)}
+        (self.path / 'columns.json').write_text(json.dumps(meta), encoding='utf-8')
+
+    def __enter__(self) -> 'ColumnStayWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def read_stay_columns(path: Path, mmap: bool = False) -> tuple[dict[str, 'np.ndarray'], list[str]]:
+    # the columns of a ColumnStayWriter export and the names their codes point to
+    _require_numpy()
+    meta = json.loads((path / 'columns.json').read_text(encoding='utf-8'))
+    columns = {}
+    for column, dtype in meta['columns'].items():
+        if meta['rows'] == 0:
+            values = np.zeros(0, dtype=dtype)
+        else:
+            values = np.memmap(path / f'{column}.bin', dtype=dtype, mode='r') if mmap else np.fromfile(path / f'{column}.bin', dtype=dtype)
+        columns[column] = values.view('datetime64[us]') if column in ('start', 'end') else values
+    return columns, meta['names']
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("Column exports need numpy, install cozy[columnar]")
+
+
+WRITERS: dict[str, Any] = {'csv': CsvStayWriter, 'columns': ColumnStayWriter}
+
+
+def _export_archive(archive: Path, part: Path, format: str, chunk_size: int) -> tuple[dict[int, tuple[bool, datetime, str]], list[Stay]]:
+    # runs in a worker process : the stays closed within one archive go to `part`, what is needed to stitch the
+    # archives back together is returned
+    builder = StayBuilder()
+    with WRITERS[format](part) as writer:
+        for chunk in builder.chunks(read_events(archive, types=_CHAIR_EVENTS), chunk_size):
+            writer.write(chunk)
+    return builder.firsts, list(builder.open.values())
+
+
+def _stitch(results: Iterable[tuple[dict[int, tuple[bool, datetime, str]], list[Stay]]]) -> list[Stay]:
+    # stays left open by an archive end with the first event on their chair in a later archive, if any
+    stitched: list[Stay] = []
+    carried: dict[int, Stay] = {}
+    for firsts, still_open in results:
+        for chair_id in [c for c in carried if c in firsts]:
+            taking, when, by = firsts[chair_id]
+            stitched.append(carried.pop(chair_id)._replace(end=when, freed_by=None if taking else by))
+        carried.update((s.chair_id, s) for s in still_open)
+    return stitched + list(carried.values())
+
+
+def export_stays(archives: Sequence[Path], destination: Path, format: str = 'csv', chunk_size: int = 10_000, workers: int = 1) -> int:
+    # Flattens the chair events of the archives (journals, binary or JSON event logs, oldest first) into stays written
+    # to `destination` in `format`, a chunk at a time. With several workers each archive is read by a worker process
+    # into a part of its own, the parts are then appended in archive order followed by the stays spanning archives.
+    # Returns the number of stays written.
+    writer_type = WRITERS[format]
+    if workers <= 1 or len(archives) <= 1:
+        with writer_type(destination) as writer:
+            for chunk in iter_stays(archives, chunk_size):
+                writer.write(chunk)
+            return writer.rows
+    with tempfile.TemporaryDirectory(prefix='cozy-export-', dir=destination.parent) as scratch:
+        parts = [Path(scratch) / f'{i:05}' for i in range(len(archives))]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_export_archive, archives, parts, [format] * len(archives), [chunk_size] * len(archives)))
+        with writer_type(destination) as writer:
+            for part in parts:
+                writer.append_part(part)
+            writer.write(_stitch(results))
+            return writer.rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export the chair stays recorded in cozy event logs")
+    parser.add_argument('archives', type=Path, nargs='+', help="journals or event logs, oldest first")
+    parser.add_argument('-o', '--output', type=Path, required=True)
+    parser.add_argument('--format', choices=sorted(WRITERS), default='csv')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunk-size', type=int, default=10_000)
+    args = parser.parse_args()
+
+    rows = export_stays(args.archives, args.output, args.format, args.chunk_size, args.workers)
+    print(f"{rows} stays written to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,361 @@
+import heapq
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, Sequence
+from uuid import UUID
+
+from pydantic import BaseModel
+
+from cozy.model.clients import normalize
+from cozy.model.models import Event, EventLog, EventRegistry, ChairTakeEvent, ChairLeaveEvent, ClientAddEvent, \
+    ClientRemoveEvent, EVENT_TYPES
+from cozy.model.persistence import WriteBehindWriter, DirectWriter, AppendOnlyFile
+
+
+def time_bucket(when: datetime) -> int:
+    # hours since 0001-01-01 in the event's own wall clock
+    return when.toordinal() * 24 + when.hour
+
+
+class EventIndexState(BaseModel):
+    # what was indexed from event `since` (None for the whole index) up to the first `count` events of the log, the
+    # last of them being `last_event_id`. A seated chair mapped to None was freed.
+    since: int | None = None
+    count: int
+    last_event_id: UUID | None
+    staff: dict[str, list[int]]
+    chairs: dict[int, list[int]]
+    clients: dict[str, list[int]]
+    buckets: dict[int, list[int]]
+    types: dict[str, list[int]]
+    seated: dict[int, str | None]
+
+
+_MAPS = ('staff', 'chairs', 'clients', 'buckets', 'types')
+
+
+# Secondary indexes over an EventLog : for every staff member, chair, client, hour and event type, the positions of
+# the matching events in the log. Positions only ever get appended, so every list is sorted and reading one back gives
+# events in the order they were recorded. Saved as JSON lines : the whole index once, then only what each save added.
+class EventIndex:
+
+    def __init__(self) -> None:
+        self.staff: dict[str, list[int]] = {}
+        self.chairs: dict[int, list[int]] = {}
+        self.clients: dict[str, list[int]] = {}
+        self.buckets: dict[int, list[int]] = {}
+        self.types: dict[str, list[int]] = {}
+        # who sits on each chair, chair leave events usually hold the chair already freed
+        self.seated: dict[int, str] = {}
+        self.count = 0
+        self.last_event_id: UUID | None = None
+        # the count at the last save and the keys indexed since, None when the saved file is not known to match
+        self._saved_count: int | None = None
+        self._touched: dict[str, set] = {name: set() for name in _MAPS}
+        self._touched_seats: set[int] = set()
+
+    def _file(self, name: str, key: str | int, position: int) -> None:
+        getattr(self, name).setdefault(key, []).append(position)
+        self._touched[name].add(key)
+
+    def _seat(self, chair_id: int, client: str | None) -> str | None:
+        # who sat on the chair before
+        self._touched_seats.add(chair_id)
+        if client is None:
+            return self.seated.pop(chair_id, None)
+        previous = self.seated.get(chair_id)
+        self.seated[chair_id] = client
+        return previous
+
+    def add(self, event: Event) -> None:
+        position = self.count
+        self._file('staff', event.by.name, position)
+        self._file('buckets', time_bucket(event.when), position)
+        self._file('types', type(event).__name__, position)
+        _INDEXERS.handler_for(type(event))(self, position, event)
+        self.count += 1
+        self.last_event_id = event.id
+
+    def add_all(self, events: Iterable[Event]) -> None:
+        for event in events:
+            self.add(event)
+
+    @classmethod
+    def build(cls, event_log: EventLog) -> 'EventIndex':
+        index = cls()
+        index.add_all(event_log.events)
+        return index
+
+    def state(self) -> EventIndexState:
+        return EventIndexState(count=self.count, last_event_id=self.last_event_id, staff=self.staff, chairs=self.chairs,
+                               clients=self.clients, buckets=self.buckets, types=self.types, seated=self.seated)
+
+    def _unsaved_state(self) -> EventIndexState:
+        # the positions added since the last save, found from the end of the lists touched meanwhile
+        since = self._saved_count
+        added = {}
+        for name in _MAPS:
+            entries = getattr(self, name)
+            added[name] = {key: entries[key][bisect_left(entries[key], since):] for key in self._touched[name]}
+        return EventIndexState(since=since, count=self.count, last_event_id=self.last_event_id,
+                               seated={c: self.seated.get(c) for c in self._touched_seats}, **added)
+
+    def _mark_saved(self) -> None:
+        self._saved_count = self.count
+        for touched in self._touched.values():
+            touched.clear()
+        self._touched_seats.clear()
+
+    @classmethod
+    def from_state(cls, state: EventIndexState) -> 'EventIndex':
+        index = cls()
+        index.staff, index.chairs, index.clients = state.staff, state.chairs, state.clients
+        index.buckets, index.types = state.buckets, state.types
+        index.seated = {c: client for c, client in state.seated.items() if client is not None}
+        index.count = state.count
+        index.last_event_id = state.last_event_id
+        return index
+
+    def save(self, file: AppendOnlyFile, writer: WriteBehindWriter | DirectWriter | None = None) -> None:
+        # only what was indexed since the last save is appended, so the cost follows the events recorded meanwhile.
+        # The whole index is written once, when the file is not known to hold the rest.
+        writer = writer or DirectWriter()
+        if self._saved_count is None or file.rewriting:
+            file.rewrite(self.state().model_dump_json().encode('utf-8') + b'\n', writer)
+        elif self.count != self._saved_count:
+            writer.append(file, self._unsaved_state().model_dump_json().encode('utf-8') + b'\n')
+        self._mark_saved()
+
+    @classmethod
+    def load(cls, path: Path, event_log: EventLog) -> 'EventIndex':
+        # starts from the saved index when the log still holds the events it was built from, from scratch otherwise
+        index = None
+        complete = False
+        try:
+            with path.open('rb') as f:
+                index, complete = cls._read(f)
+            events = event_log.events
+            if index is not None and not (index.count <= len(events) and (events[index.count - 1].id if index.count else None) == index.last_event_id):
+                index = None
+        except OSError:
+            pass
+        if index is not None and complete:
+            index._mark_saved()
+        index = index or cls()
+        index.add_all(event_log.events[index.count:])
+        return index
+
+    @classmethod
+    def _read(cls, lines: Iterable[bytes]) -> tuple['EventIndex | None', bool]:
+        # the whole index followed by what each save added, up to the first record that does not follow on. Tells if
+        # every record did and the file can be appended to as it is.
+        index = None
+        complete = True
+        for line in lines:
+            try:
+                state = EventIndexState.model_validate_json(line)
+            except ValueError:
+                return index, False
+            # a record missing its newline was torn, or saved before indexes were saved a line at a time
+            complete = line.endswith(b'\n')
+            if index is None:
+                if state.since is not None:
+                    return None, False
+                index = cls.from_state(state)
+                continue
+            if state.since != index.count:
+                return index, False
+            for name in _MAPS:
+                entries = getattr(index, name)
+                for key, positions in getattr(state, name).items():
+                    entries.setdefault(key, []).extend(positions)
+            for chair_id, client in state.seated.items():
+                if client is None:
+                    index.seated.pop(chair_id, None)
+                else:
+                    index.seated[chair_id] = client
+            index.count = state.count
+            index.last_event_id = state.last_event_id
+        return index, complete
+
+
+def _index_chair_take(index: EventIndex, position: int, event: ChairTakeEvent) -> None:
+    index._file('chairs', event.chair.id, position)
+    if event.chair.occupant is not None:
+        client = normalize(event.chair.occupant.name)
+        index._file('clients', client, position)
+        index._seat(event.chair.id, client)
+
+
+def _index_chair_leave(index: EventIndex, position: int, event: ChairLeaveEvent) -> None:
+    index._file('chairs', event.chair.id, position)
+    seated = index._seat(event.chair.id, None)
+    client = normalize(event.chair.occupant.name) if event.chair.occupant is not None else seated
+    if client is not None:
+        index._file('clients', client, position)
+
+
+def _index_client(index: EventIndex, position: int, event: ClientAddEvent | ClientRemoveEvent) -> None:
+    index._file('clients', normalize(event.who.name), position)
+
+
+def _index_nothing(index: EventIndex, position: int, event: Event) -> None:
+    pass
+
+
+_INDEXERS: EventRegistry[Callable[[EventIndex, int, Event], None]] = EventRegistry({
+    Event: _index_nothing,
+    ChairTakeEvent: _index_chair_take,
+    ChairLeaveEvent: _index_chair_leave,
+    ClientAddEvent: _index_client,
+    ClientRemoveEvent: _index_client,
+})
+
+
+# What to look for in an EventLog. Queries combine with & and | and are run against the log's index :
+#
+#     event_log.query(by_staff('ann') & between(datetime(2024, 3, 1, 22), datetime(2024, 3, 2, 6)))
+#
+# Every query knows the positions it matches from the index and how many there are at most. An & only walks the
+# smallest of its parts and checks the others position by position, so the work follows the size of the answer
+# rather than the size of the log.
+class EventQuery(ABC):
+
+    @abstractmethod
+    def estimate(self, index: EventIndex) -> int:
+        ...
+
+    @abstractmethod
+    def positions(self, index: EventIndex) -> Iterable[int]:
+        ...
+
+    @abstractmethod
+    def accepts(self, index: EventIndex, position: int, event: Event) -> bool:
+        ...
+
+    def __and__(self, other: 'EventQuery') -> 'EventQuery':
+        return AllOf(self, other)
+
+    def __or__(self, other: 'EventQuery') -> 'EventQuery':
+        return AnyOf(self, other)
+
+
+def _contains(positions: Sequence[int], position: int) -> bool:
+    i = bisect_left(positions, position)
+    return i < len(positions) and positions[i] == position
+
+
+class _Keyed(EventQuery):
+    # the events listed under one key of one of the index's maps
+
+    def __init__(self, key: str | int, lookup: Callable[[EventIndex], dict]) -> None:
+        self.key = key
+        self.lookup = lookup
+
+    def _positions(self, index: EventIndex) -> list[int]:
+        return self.lookup(index).get(self.key, [])
+
+    def estimate(self, index: EventIndex) -> int:
+        return len(self._positions(index))
+
+    def positions(self, index: EventIndex) -> Iterable[int]:
+        return self._positions(index)
+
+    def accepts(self, index: EventIndex, position: int, event: Event) -> bool:
+        return _contains(self._positions(index), position)
+
+
+def by_staff(name: str) -> EventQuery:
+    return _Keyed(name, lambda index: index.staff)
+
+
+def chair(chair_id: int) -> EventQuery:
+    return _Keyed(chair_id, lambda index: index.chairs)
+
+
+def client(name: str) -> EventQuery:
+    return _Keyed(normalize(name), lambda index: index.clients)
+
+
+def of_type(*event_types: type[Event]) -> EventQuery:
+    # subclasses included, like isinstance
+    names = [name for name, t in EVENT_TYPES.items() if issubclass(t, event_types)]
+    return AnyOf(*(_Keyed(name, lambda index: index.types) for name in names))
+
+
+class _Between(EventQuery):
+
+    def __init__(self, start: datetime | None = None, end: datetime | None = None) -> None:
+        self.start = start
+        self.end = end
+
+    def _buckets(self, index: EventIndex) -> list[list[int]]:
+        first = time_bucket(self.start) if self.start is not None else None
+        last = time_bucket(self.end) if self.end is not None else None
+        if first is not None and last is not None and last - first < len(index.buckets):
+            keys: Iterable[int] = range(first, last + 1)
+        else:
+            keys = sorted(k for k in index.buckets if (first is None or k >= first) and (last is None or k <= last))
+        return [index.buckets[k] for k in keys if k in index.buckets]
+
+    def estimate(self, index: EventIndex) -> int:
+        return sum(len(b) for b in self._buckets(index))
+
+    def positions(self, index: EventIndex) -> Iterable[int]:
+        # events are mostly recorded in time order but nothing forces it, the buckets are merged back by position
+        return heapq.merge(*self._buckets(index))
+
+    def accepts(self, index: EventIndex, position: int, event: Event) -> bool:
+        return (self.start is None or event.when >= self.start) and (self.end is None or event.when < self.end)
+
+
+def between(start: datetime | None = None, end: datetime | None = None) -> EventQuery:
+    # events that happened from `start` included up to `end` excluded, either end may be left open
+    return _Between(start, end)
+
+
+class AllOf(EventQuery):
+
+    def __init__(self, *queries: EventQuery) -> None:
+        self.queries = queries
+
+    def estimate(self, index: EventIndex) -> int:
+        return min(q.estimate(index) for q in self.queries)
+
+    def positions(self, index: EventIndex) -> Iterable[int]:
+        # positions alone cannot tell a time range, positions() is always followed by accepts() on the events found
+        return min(self.queries, key=lambda q: q.estimate(index)).positions(index)
+
+    def accepts(self, index: EventIndex, position: int, event: Event) -> bool:
+        return all(q.accepts(index, position, event) for q in self.queries)
+
+
+class AnyOf(EventQuery):
+
+    def __init__(self, *queries: EventQuery) -> None:
+        self.queries = queries
+
+    def estimate(self, index: EventIndex) -> int:
+        return sum(q.estimate(index) for q in self.queries)
+
+    def positions(self, index: EventIndex) -> Iterable[int]:
+        previous = None
+        for position in heapq.merge(*(q.positions(index) for q in self.queries)):
+            if position != previous:
+                yield position
+                previous = position
+
+    def accepts(self, index: EventIndex, position: int, event: Event) -> bool:
+        return any(q.accepts(index, position, event) for q in self.queries)
+
+
+def run_query(index: EventIndex, events: Sequence[Event], query: EventQuery) -> list[Event]:
+    found = []
+    for position in query.positions(index):
+        event = events[position]
+        if query.accepts(index, position, event):
+            found.append(event)
+    return found
+
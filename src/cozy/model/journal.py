@@ -0,0 +1,242 @@
+import json
+import os
+from contextlib import suppress
+from pathlib import Path
+from uuid import UUID
+from typing import BinaryIO, Generator, Iterable
+
+from cozy.model.models import Site, Event, EventLog, SiteException, EVENT_TYPES
+from cozy.model.slim import NameTable, encode_events, decode_record
+
+HEADER_TYPE = 'EventLog'
+
+# bytes of records parsed at once when reading the journal
+_READ_CHUNK = 1 << 20
+
+# record formats : events holding full snapshots of their chair and staff, or slim ones referring to names by id
+FULL = 'full'
+SLIM = 'slim'
+
+
+# Append only JSON Lines journal : the first record is a header holding the initial site state and every following
+# record is one event. Recording an event writes a single line at the end of the file so the cost of an action does
+# not depend on how much history was already recorded. The header tells which record format the journal uses,
+# `format` only decides it for journals this instance starts.
+class EventJournal:
+    def __init__(self, path: Path, format: str = FULL) -> None:
+        self.path = path
+        self.format = format
+        self._file: BinaryIO | None = None
+        self._names: NameTable | None = None
+        self._header_read = False
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def start(self, initial_site_state: Site | None) -> None:
+        # a new journal always starts with its header, anything previously there is discarded
+        self.close()
+        header = {'type': HEADER_TYPE, 'data': {'initial_site_state': self._dump(initial_site_state)}}
+        if self.format != FULL:
+            header['data']['format'] = self.format
+        self.path.write_bytes(self._encode(header))
+        self._names = NameTable() if self.format == SLIM else None
+        if self._names is not None:
+            self._names.complete = True
+        self._header_read = True
+
+    def start_from(self, event_log: EventLog) -> None:
+        self.start(event_log.initial_site_state)
+        self.append_many(event_log.events)
+
+    def append(self, event: Event) -> int:
+        return self.append_many([event])
+
+    def append_many(self, events: Iterable[Event]) -> int:
+        return self.write(self.encode(events))
+
+    def encode(self, events: Iterable[Event]) -> bytes:
+        names = self._name_table()
+        if names is not None:
+            if not names.complete:
+                # ids are only handed out knowing every name already in the journal
+                names.scan(self.path)
+                names.complete = True
+            # names declared by records encoded earlier but never written are not known to anyone
+            names.discard()
+            return encode_events(names, events)
+        return b''.join(self._encode({'type': type(e).__name__, 'data': self._dump(e)}) for e in events)
+
+    def write(self, data: bytes) -> int:
+        # appends already encoded records, returns the offset right after them
+        handle = self._handle()
+        if data:
+            try:
+                handle.write(data)
+                handle.flush()
+            except BaseException:
+                # reopened on the next write, whatever part of a record made it to the file is dropped then
+                self._file = None
+                with suppress(OSError):
+                    handle.close()
+                raise
+        if self._names is not None:
+            # the names these records declare now belong to the journal
+            self._names.commit()
+        return handle.tell()
+
+    def read_format(self) -> str:
+        # the record format of an existing journal, the one it is started with otherwise
+        self._name_table()
+        return self.format
+
+    def sync(self) -> None:
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+
+    def read_initial_site_state(self) -> Site | None:
+        with self.path.open('rb') as f:
+            header = json.loads(f.readline())
+        if header.get('type') != HEADER_TYPE:
+            raise JournalCorruptedError(self.path, 0)
+        state = header['data']['initial_site_state']
+        return Site.model_validate(state) if state is not None else None
+
+    def first_event_offset(self) -> int:
+        with self.path.open('rb') as f:
+            return len(f.readline())
+
+    def record_ends_at(self, offset: int, event_id: UUID | None) -> bool:
+        # tells if the record ending at this offset is the given event (or the header when no event id is given)
+        with self.path.open('rb') as f:
+            if offset <= 0 or offset > f.seek(0, 2):
+                return False
+            f.seek(offset - 1)
+            if f.read(1) != b'\n':
+                return False
+            start = offset - 1
+            line = b''
+            while start > 0:
+                chunk_start = max(0, start - 4096)
+                f.seek(chunk_start)
+                line = f.read(start - chunk_start) + line
+                start = chunk_start
+                newline = line.rfind(b'\n')
+                if newline >= 0:
+                    line = line[newline + 1:]
+                    break
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return False
+        if event_id is None:
+            return record.get('type') == HEADER_TYPE
+        return record.get('type') != HEADER_TYPE and record['data'].get('id') == str(event_id)
+
+    def _name_table(self) -> NameTable | None:
+        # the header is read once to learn the format of an existing journal
+        if not self._header_read and self.exists():
+            with self.path.open('rb') as f:
+                header = json.loads(f.readline())
+            self.format = header.get('data', {}).get('format', FULL)
+            self._names = NameTable() if self.format == SLIM else None
+            self._header_read = True
+        return self._names
+
+    def events(self, offset: int = 0) -> Generator[tuple[int, Event], None, None]:
+        # yields each event found after the given byte offset along with the offset right after its record
+        names = self._name_table()
+        if names is not None and not names.complete and offset > 0:
+            # the names used past the offset may have been declared before it
+            names.scan(self.path, offset)
+        with self.path.open('rb') as f:
+            f.seek(offset)
+            if offset == 0:
+                f.readline()
+            position = f.tell()
+            torn = False
+            while not torn:
+                lines = f.readlines(_READ_CHUNK)
+                if not lines:
+                    break
+                if not lines[-1].endswith(b'\n'):
+                    # a half written record at the tail, the writer died before finishing it
+                    lines.pop()
+                    torn = True
+                for line, record in zip(lines, self._parse(lines)):
+                    position += len(line)
+                    if names is not None:
+                        try:
+                            event = decode_record(names, record)
+                        except (KeyError, ValueError) as e:
+                            raise JournalCorruptedError(self.path, position - len(line)) from e
+                        if event is not None:
+                            yield position, event
+                        continue
+                    event_type = EVENT_TYPES.get(record['type'])
+                    if event_type is None:
+                        raise JournalCorruptedError(self.path, position - len(line))
+                    yield position, event_type.model_validate(record['data'])
+            if names is not None and not torn:
+                names.complete = True
+
+    @staticmethod
+    def _parse(lines: list[bytes]) -> list[dict]:
+        # a whole chunk of records in a single call, line by line only to point at the one that does not parse
+        try:
+            return json.loads(b'[' + b','.join(lines) + b']')
+        except ValueError:
+            return [json.loads(line) for line in lines]
+
+    def to_event_log(self) -> EventLog:
+        event_log = EventLog(initial_site_state=self.read_initial_site_state())
+        for _, event in self.events():
+            event_log.append(event)
+        return event_log
+
+    def export(self, destination: Path) -> None:
+        destination.write_text(data=self.to_event_log().model_dump_json(indent=2), encoding='utf-8')
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _handle(self) -> BinaryIO:
+        if self._file is None:
+            drop_torn_tail(self.path)
+            self._file = self.path.open('ab')
+        return self._file
+
+    @staticmethod
+    def _dump(model: Site | Event | None) -> dict | None:
+        return model.model_dump(mode='json') if model is not None else None
+
+    @staticmethod
+    def _encode(record: dict) -> bytes:
+        return (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def drop_torn_tail(path: Path) -> None:
+    # a crash in the middle of an append leaves a partial last line, appending after it would glue two records
+    with path.open('r+b') as f:
+        end = f.seek(0, 2)
+        position = end
+        while position > 0:
+            chunk_start = max(0, position - 4096)
+            f.seek(chunk_start)
+            chunk = f.read(position - chunk_start)
+            newline = chunk.rfind(b'\n')
+            if newline >= 0:
+                if chunk_start + newline + 1 != end:
+                    f.truncate(chunk_start + newline + 1)
+                return
+            position = chunk_start
+        f.truncate(0)
+
+
+class JournalCorruptedError(SiteException):
+    def __init__(self, path: Path, offset: int) -> None:
+        super().__init__(f"Journal [{path}] holds an unreadable record at byte offset [{offset}]")
+        self.path = path
+        self.offset = offset
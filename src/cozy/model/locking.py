@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from pathlib import Path
+from typing import IO
+
+from cozy.model.models import SiteException
+
+try:
+    import fcntl
+except ImportError:  # no cov
+    fcntl = None
+    import msvcrt
+
+
+class SiteLockTimeoutError(SiteException):
+    retryable = True
+
+    def __init__(self, path: Path, timeout: float) -> None:
+        super().__init__(f"Could not lock [{path}] within [{timeout}] seconds, another process is holding it")
+        self.path = path
+
+
+class SiteVersionConflictError(SiteException):
+    # another process committed since this one last loaded the site : reload and try again
+    retryable = True
+
+    def __init__(self, expected_version: int, found_version: int) -> None:
+        super().__init__(f"Site changed on disk [version {found_version}] since it was loaded [version {expected_version}], reload it and try again")
+        self.expected_version = expected_version
+        self.found_version = found_version
+
+
+# Advisory, cross process lock on a file. Only meant to be held for the few microseconds a commit takes. Reentrant
+# for the thread holding it, other threads of the process wait their turn like other processes do.
+class FileLock:
+
+    def __init__(self, path: Path, timeout: float = 5.0, poll_interval: float = 0.002) -> None:
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._file: IO[bytes] | None = None
+        self._depth = 0
+        self._thread_lock = threading.RLock()
+
+    def acquire(self) -> None:
+        deadline = time.monotonic() + self.timeout
+        if not self._thread_lock.acquire(timeout=self.timeout):
+            raise SiteLockTimeoutError(self.path, self.timeout)
+        if self._depth:
+            self._depth += 1
+            return
+        try:
+            handle = self.path.open('a+b')
+            while not self._try_lock(handle):
+                if time.monotonic() >= deadline:
+                    handle.close()
+                    raise SiteLockTimeoutError(self.path, self.timeout)
+                time.sleep(self.poll_interval)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._file = handle
+        self._depth = 1
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth:
+            self._thread_lock.release()
+            return
+        handle, self._file = self._file, None
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        else:  # no cov
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        handle.close()
+        self._thread_lock.release()
+
+    @staticmethod
+    def _try_lock(handle: IO[bytes]) -> bool:
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:  # no cov
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    def __enter__(self) -> 'FileLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.release()
+
+
+# wide enough for any event count, every write covers the whole number
+_VERSION_WIDTH = 20
+
+
+def write_version(path: Path, version: int) -> None:
+    # rewritten in place under the lock with a single write of a fixed width : no temporary file and rename on every
+    # commit, and a reader never sees a number shorter than the one written. A torn file after a crash reads as None
+    # and is rewritten when the site is next opened.
+    handle = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        os.write(handle, f'{version:>{_VERSION_WIDTH}}'.encode('ascii'))
+    finally:
+        os.close(handle)
+
+
+def read_version(path: Path) -> int | None:
+    try:
+        return int(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
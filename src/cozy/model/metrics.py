@@ -0,0 +1,164 @@
+import bisect
+import threading
+import time
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, TypeVar
+
+from cozy.model.persistence import atomic_write_text
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+# seconds, from a fast in memory mutation up to a slow load of a large history
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        # one count per bucket plus the +Inf one, not cumulative : they are summed up when exported
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float | None:
+        # upper bound of the bucket holding the q-th observation, good enough to tell fast from slow
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'sum': self.sum, 'p50': self.quantile(0.5), 'p95': self.quantile(0.95),
+                'p99': self.quantile(0.99), 'buckets': dict(zip([*map(str, self.buckets), '+Inf'], self.counts))}
+
+
+# What a SiteController did and how long it took : latency per operation, bytes handed to the disk per target, events
+# recorded per type and the length of the event log. One instance can be shared by several controllers.
+class SiteMetrics:
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.latency: dict[str, Histogram] = {}
+        self.bytes_written: dict[str, int] = {}
+        self.events: dict[str, int] = {}
+        self.log_length: dict[str, int] = {}
+
+    def observe(self, operation: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self.latency.get(operation)
+            if histogram is None:
+                histogram = self.latency[operation] = Histogram()
+            histogram.observe(seconds)
+
+    def wrote(self, target: str, size: int) -> None:
+        with self._lock:
+            self.bytes_written[target] = self.bytes_written.get(target, 0) + size
+
+    def recorded(self, site: str, event_types: list[str], log_length: int) -> None:
+        with self._lock:
+            for event_type in event_types:
+                self.events[event_type] = self.events.get(event_type, 0) + 1
+            self.log_length[site] = log_length
+
+    def set_log_length(self, site: str, log_length: int) -> None:
+        with self._lock:
+            self.log_length[site] = log_length
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'latency': {operation: h.to_dict() for operation, h in self.latency.items()},
+                'bytes_written': dict(self.bytes_written),
+                'events': dict(self.events),
+                'log_length': dict(self.log_length),
+            }
+
+    def to_prometheus(self, prefix: str = 'cozy') -> str:
+        lines: list[str] = []
+        with self._lock:
+            lines += [f'# HELP {prefix}_operation_seconds Time taken by SiteController operations',
+                      f'# TYPE {prefix}_operation_seconds histogram']
+            for operation, h in sorted(self.latency.items()):
+                cumulative = 0
+                for bound, count in zip([*map(str, h.buckets), '+Inf'], h.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_operation_seconds_bucket{{operation="{operation}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_operation_seconds_sum{{operation="{operation}"}} {h.sum}')
+                lines.append(f'{prefix}_operation_seconds_count{{operation="{operation}"}} {h.count}')
+            lines += [f'# HELP {prefix}_bytes_written_total Bytes serialized and handed to the disk',
+                      f'# TYPE {prefix}_bytes_written_total counter']
+            lines += [f'{prefix}_bytes_written_total{{target="{t}"}} {n}' for t, n in sorted(self.bytes_written.items())]
+            lines += [f'# HELP {prefix}_events_total Events recorded',
+                      f'# TYPE {prefix}_events_total counter']
+            lines += [f'{prefix}_events_total{{type="{t}"}} {n}' for t, n in sorted(self.events.items())]
+            lines += [f'# HELP {prefix}_event_log_length Events in the event log of a site',
+                      f'# TYPE {prefix}_event_log_length gauge']
+            lines += [f'{prefix}_event_log_length{{site="{_escape(s)}"}} {n}' for s, n in sorted(self.log_length.items())]
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def instrumented(operation: str) -> Callable[[F], F]:
+    # times a method of an object with a `metrics` attribute, costs a single attribute check while metrics are off
+    def decorate(fn: F) -> F:
+        @wraps(fn)
+        def wrapper(self, *args: Any, **kwargs: Any) -> Any:
+            metrics = self.metrics
+            if metrics is None:
+                return fn(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(self, *args, **kwargs)
+            finally:
+                metrics.observe(operation, time.perf_counter() - start)
+        return wrapper  # type: ignore[return-value]
+    return decorate
+
+
+# Rewrites a Prometheus text format file every `interval` seconds, for node_exporter's textfile collector or anything
+# else that scrapes files. The file is replaced atomically so a scraper never reads half of it.
+class PrometheusFileExporter:
+
+    def __init__(self, metrics: SiteMetrics, path: Path, interval: float = 15.0, prefix: str = 'cozy') -> None:
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.prefix = prefix
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def write(self) -> None:
+        atomic_write_text(self.path, self.metrics.to_prometheus(self.prefix), fsync=False)
+
+    def start(self) -> 'PrometheusFileExporter':
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='cozy-metrics', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.write()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.write()
@@ -1,10 +1,12 @@
+import heapq
 import json
+import weakref
 from pathlib import Path
 from uuid import UUID, uuid4
 from datetime import datetime, date
 
-from typing import List, Any
-from pydantic import Field, SerializeAsAny
+from typing import List, Any, Generic, TypeVar
+from pydantic import Field, SerializeAsAny, PrivateAttr
 from pydantic.main import BaseModel
 
 
@@ -19,21 +21,59 @@ class Staff(BaseModel):
     name: str
 
 
+class StaffRegistry:
+    # hands out a single Staff instance per name, sites sharing a registry share their staff objects
+    def __init__(self) -> None:
+        self._staff: dict[str, Staff] = {}
+
+    def intern(self, staff: Staff) -> Staff:
+        return self._staff.setdefault(staff.name, staff)
+
+    def get(self, name: str) -> Staff | None:
+        return self._staff.get(name)
+
+    def __len__(self) -> int:
+        return len(self._staff)
+
+
 class Chair(BaseModel):
     id: int
     occupant: Client | None
     since: datetime | None
 
+    # the site holding this chair, told whenever the chair gets taken or freed so it can keep its indexes current
+    _site: weakref.ref | None = PrivateAttr(default=None)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name != 'occupant':
+            super().__setattr__(name, value)
+            return
+        was_occupied = self.is_occupied
+        super().__setattr__(name, value)
+        site = self._site() if self._site is not None else None
+        if site is not None and was_occupied != self.is_occupied:
+            site._occupancy_changed(self)
+
     def take(self, client: Client, since: datetime | None = None) -> None:
         if self.occupant:
             raise DoubleOccupancyError(self, client)
         self.occupant = client
         self.since = since if since is not None else datetime.now()
 
+    def release(self) -> None:
+        self.occupant = None
+        self.since = None
+
     @property
     def is_occupied(self) -> bool:
         return self.occupant is not None
 
+    def __eq__(self, other: Any) -> bool:
+        # the link back to the site is not part of the chair's value, comparing it would compare the sites in turn
+        if not isinstance(other, Chair):
+            return NotImplemented
+        return self.__dict__ == other.__dict__
+
     def __str__(self):
         return f"{self.occupant} @ {self.since.strftime('%A %H:%M')}" if self.occupant else "Empty"
 
@@ -43,12 +83,38 @@ class Site(BaseModel):
     name: str
     staff: list[Staff]
     chairs: list[Chair]
+    # number of events committed to reach this state, it only ever goes up
+    version: int = 0
+
+    # indexes over chairs and staff, kept current by chair take / release and by the staff methods below. They are
+    # rebuilt from scratch whenever the chairs or staff lists were replaced or resized behind the site's back.
+    _busy: int = PrivateAttr(default=0)
+    _free_ids: list[int] = PrivateAttr(default_factory=list)
+    _indexed_chairs: tuple[list[Chair], int] | None = PrivateAttr(default=None)
+    _staff_by_name: dict[str, Staff] = PrivateAttr(default_factory=dict)
+    _indexed_staff: tuple[list[Staff], int] | None = PrivateAttr(default=None)
 
     def __init__(self, /, **data: Any):
         super().__init__(**data)
         self._capacity = 0
         self.init_chairs(data['capacity'] if 'capacity' in data else 0)
 
+    def __copy__(self) -> 'Site':
+        copied = super().__copy__()
+        copied._indexed_chairs = copied._indexed_staff = None
+        return copied
+
+    def __deepcopy__(self, memo: dict[int, Any] | None = None) -> 'Site':
+        copied = super().__deepcopy__(memo)
+        copied._indexed_chairs = copied._indexed_staff = None
+        return copied
+
+    def __eq__(self, other: Any) -> bool:
+        # the indexes are caches, two sites holding the same chairs and staff are equal whether they were built or not
+        if not isinstance(other, Site):
+            return NotImplemented
+        return self.__dict__ == other.__dict__
+
     @property
     def capacity(self) -> int:
         return self._capacity
@@ -60,37 +126,131 @@ class Site(BaseModel):
 
     @property
     def busy_count(self):
-        return len([c for c in self.chairs if c.is_occupied])
+        self._chair_index()
+        return self._busy
+
+    @property
+    def free_count(self) -> int:
+        self._chair_index()
+        return len(self.chairs) - self._busy
+
+    def next_free_chair(self) -> Chair | None:
+        # lowest numbered free chair, chairs taken since they were freed are only dropped from the heap once they
+        # reach its top
+        free_ids = self._chair_index()
+        while free_ids:
+            chair_id = free_ids[0]
+            if chair_id <= len(self.chairs) and not self.chairs[chair_id - 1].is_occupied:
+                return self.chairs[chair_id - 1]
+            heapq.heappop(free_ids)
+        return None
 
     def occupy(self, chair_id: int, client: Client, since: datetime | None) -> None:
-        self.chairs[chair_id].take(client, since)
+        self.chairs[chair_id - 1].take(client, since)
+
+    def release(self, chair_id: int) -> None:
+        self.chairs[chair_id - 1].release()
+
+    def _chair_index(self) -> list[int]:
+        if not self._chair_index_current():
+            site = weakref.ref(self)
+            for c in self.chairs:
+                c._site = site
+            self._busy = sum(1 for c in self.chairs if c.is_occupied)
+            self._free_ids = [c.id for c in self.chairs if not c.is_occupied]
+            heapq.heapify(self._free_ids)
+            self._indexed_chairs = (self.chairs, len(self.chairs))
+        elif len(self._free_ids) > 2 * len(self.chairs):
+            # too many stale entries piled up
+            self._free_ids = [c.id for c in self.chairs if not c.is_occupied]
+            heapq.heapify(self._free_ids)
+        return self._free_ids
+
+    def _chair_index_current(self) -> bool:
+        return self._indexed_chairs is not None and self._indexed_chairs[0] is self.chairs and self._indexed_chairs[1] == len(self.chairs)
+
+    def _occupancy_changed(self, chair: Chair) -> None:
+        if not self._chair_index_current():
+            # the index is stale anyway and will be rebuilt on the next query
+            return
+        if not (0 < chair.id <= len(self.chairs)) or self.chairs[chair.id - 1] is not chair:
+            # a copy of one of our chairs, not ours to count
+            return
+        if chair.is_occupied:
+            self._busy += 1
+        else:
+            self._busy -= 1
+            heapq.heappush(self._free_ids, chair.id)
 
-    def init_chairs(self, target_capacity: int) -> None:
+    def init_chairs(self, target_capacity: int) -> list[tuple[Chair, Chair]]:
         # so adding capacity is simple...
         while len(self.chairs) < target_capacity:
             self.chairs.append(Chair(id=len(self.chairs) + 1, occupant=None, since=None))
-        # but removing capacity...  we must "move" people in the slice of chairs
-        # into a free chair of the kept capacity
+        # but removing capacity...  we must "move" people in the slice of chairs into a free chair of the kept capacity
+        moves = self.relocations(target_capacity)
+        for source, destination in moves:
+            destination.take(source.occupant, since=source.since)
+            source.release()
+        del self.chairs[target_capacity:]
+        self.capacity = self._capacity = target_capacity
+        return moves
+
+    def relocations(self, target_capacity: int) -> list[tuple[Chair, Chair]]:
+        # (source, destination) pairs moving everyone seated past target_capacity into the last free chairs it keeps,
+        # in the same relative order. One pass from the end of the kept chairs, however many are moved.
         if self.busy_count > target_capacity:
             raise SiteResizeBelowOccupancyException(self, target_capacity)
-        to_be_relocated = self.chairs[target_capacity:]
-        to_be_kept = self.chairs[:target_capacity]
-        # go through the chairs to be removed and move them such that their relative ordering in chairs remains the same
-        for chair in reversed(to_be_relocated):
-            for c in reversed(to_be_kept):
-                if not c.is_occupied:
-                    c.take(chair.occupant, since=chair.since)
-        self._capacity = target_capacity
+        to_be_relocated = [c for c in self.chairs[target_capacity:] if c.is_occupied]
+        free: list[Chair] = []
+        cursor = target_capacity - 1
+        while len(free) < len(to_be_relocated):
+            if not self.chairs[cursor].is_occupied:
+                free.append(self.chairs[cursor])
+            cursor -= 1
+        return list(zip(to_be_relocated, reversed(free)))
+
+    def restore(self, state: 'Site', staff_registry: StaffRegistry | None = None) -> None:
+        # puts this site back in the given state, the chair objects already handed out stay the site's chairs. Staff
+        # go through the registry when given one, so they are the same instances as before.
+        self.name = state.name
+        self.version = state.version
+        self.capacity = state.capacity
+        self._capacity = state._capacity
+        staff = [s.model_copy() for s in state.staff]
+        self.staff[:] = [staff_registry.intern(s) for s in staff] if staff_registry is not None else staff
+        self._indexed_staff = None
+        del self.chairs[len(state.chairs):]
+        for chair, saved in zip(self.chairs, state.chairs):
+            chair.occupant = saved.occupant.model_copy() if saved.occupant else None
+            chair.since = saved.since
+        self.chairs.extend(c.model_copy(deep=True) for c in state.chairs[len(self.chairs):])
 
     def has_staff(self, name: str) -> bool:
-        return name in [s.name for s in self.staff]
+        return name in self._staff_index()
 
     def get_staff_from_name(self, name: str) -> Staff:
-        if self.has_staff(name):
-            return [s for s in self.staff if s.name == name].pop()
+        staff = self._staff_index().get(name)
+        if staff is not None:
+            return staff
 
         raise StaffNotFoundError(name)
 
+    def add_staff(self, staff: Staff) -> None:
+        index = self._staff_index()
+        self.staff.append(staff)
+        index[staff.name] = staff
+        self._indexed_staff = (self.staff, len(self.staff))
+
+    def remove_staff(self, name: str) -> None:
+        self.staff[:] = [s for s in self.staff if s.name != name]
+        self._indexed_staff = None
+
+    def _staff_index(self) -> dict[str, Staff]:
+        if self._indexed_staff is None or self._indexed_staff[0] is not self.staff or self._indexed_staff[1] != len(self.staff):
+            self._staff_by_name = {s.name: s for s in self.staff}
+            self._indexed_staff = (self.staff, len(self.staff))
+        return self._staff_by_name
+
 
 class SiteException(Exception):
     pass
@@ -147,6 +307,49 @@ class ClientRemoveEvent(Event):
     who: Client
 
 
+H = TypeVar('H')
+
+
+class EventRegistry(Generic[H]):
+    # maps event classes to their handler, a lookup is a single dict access whatever the number of registered types
+    def __init__(self, handlers: dict[type[Event], H] | None = None) -> None:
+        self._handlers: dict[type[Event], H] = {}
+        for event_type, handler in (handlers or {}).items():
+            self.register(event_type, handler)
+
+    def register(self, event_type: type[Event], handler: H) -> None:
+        self._handlers[event_type] = handler
+
+    def handler_for(self, event_type: type[Event]) -> H:
+        try:
+            return self._handlers[event_type]
+        except KeyError:
+            pass
+        # subclasses of a registered event are handled like their parent, the answer is remembered for next time
+        for parent in event_type.__mro__[1:]:
+            if parent in self._handlers:
+                self._handlers[event_type] = self._handlers[parent]
+                return self._handlers[event_type]
+        raise ValueError("Unknown Event")
+
+    def types(self) -> list[type[Event]]:
+        return list(self._handlers)
+
+
+# which EventLog list holds each type of event
+EVENT_LOG_VIEWS: EventRegistry[str] = EventRegistry({
+    SiteResizedEvent: 'site_resize_events',
+    ChairTakeEvent: 'chair_take_events',
+    ChairLeaveEvent: 'chair_leave_events',
+    StaffAddEvent: 'staff_add_events',
+    StaffRemoveEvent: 'staff_remove_events',
+    ClientAddEvent: 'client_add_events',
+    ClientRemoveEvent: 'client_remove_events',
+})
+
+EVENT_TYPES: dict[str, type[Event]] = {event_type.__name__: event_type for event_type in EVENT_LOG_VIEWS.types()}
+
+
 class EventLog(BaseModel):
     initial_site_state: Site | None
     event_order: List[UUID] = Field(default_factory=list)
@@ -158,26 +361,66 @@ class EventLog(BaseModel):
     client_add_events: List[ClientAddEvent] = Field(default_factory=list)
     client_remove_events: List[ClientRemoveEvent] = Field(default_factory=list)
     final_site_state: Site | None = None
+    version: int = 0
+
+    # all events in the order they were appended along with an index by id, the typed lists above are kept as the
+    # serialized form and as per type views
+    _events: list[Event] = PrivateAttr(default_factory=list)
+    _by_id: dict[UUID, Event] = PrivateAttr(default_factory=dict)
+    # secondary indexes for query(), built on first use (see cozy.model.history) and kept current by append
+    _index: Any = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        for event_type in EVENT_LOG_VIEWS.types():
+            for event in self.of_type(event_type):
+                self._by_id[event.id] = event
+        self._events = [self._by_id[event_id] for event_id in self.event_order if event_id in self._by_id]
+        self.version = max(self.version, len(self._events))
 
     def append(self, event: Event) -> None:
+        view = EVENT_LOG_VIEWS.handler_for(type(event))
         self.event_order.append(event.id)
+        getattr(self, view).append(event)
+        self._events.append(event)
+        self._by_id[event.id] = event
+        self.version += 1
+        if self._index is not None:
+            self._index.add(event)
+
+    @property
+    def events(self) -> list[Event]:
+        # every event in chronological order, do not modify
+        return self._events
+
+    def get(self, event_id: UUID) -> Event | None:
+        return self._by_id.get(event_id)
+
+    def of_type(self, event_type: type[Event]) -> list[Event]:
+        return getattr(self, EVENT_LOG_VIEWS.handler_for(event_type))
+
+    @property
+    def index(self) -> Any:
+        if self._index is None:
+            from cozy.model.history import EventIndex
+            self._index = EventIndex.build(self)
+        return self._index
+
+    @index.setter
+    def index(self, index: Any) -> None:
+        self._index = index
+
+    @property
+    def indexed(self) -> bool:
+        return self._index is not None
+
+    def query(self, query: Any) -> list[Event]:
+        # the events matching a cozy.model.history query, in the order they were recorded
+        from cozy.model.history import run_query
+        return run_query(self.index, self._events, query)
+
+    def __len__(self) -> int:
+        return len(self._events)
 
-        if isinstance(event, SiteResizedEvent):
-            self.site_resize_events.append(event)
-        elif isinstance(event, ChairTakeEvent):
-            self.chair_take_events.append(event)
-        elif isinstance(event, ChairLeaveEvent):
-            self.chair_leave_events.append(event)
-        elif isinstance(event, StaffAddEvent):
-            self.staff_add_events.append(event)
-        elif isinstance(event, StaffRemoveEvent):
-            self.staff_remove_events.append(event)
-        elif isinstance(event, ClientAddEvent):
-            self.client_add_events.append(event)
-        elif isinstance(event, ClientRemoveEvent):
-            self.client_remove_events.append(event)
-        else:
-            raise ValueError("Unknown Event")
 
 class UUIDEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -0,0 +1,280 @@
+import atexit
+import os
+import tempfile
+import threading
+import time
+from enum import Enum
+from pathlib import Path
+from typing import BinaryIO, Callable, Protocol
+
+from cozy.model.journal import EventJournal, drop_torn_tail
+from cozy.model.models import Event
+
+
+class Durability(Enum):
+    # fsync after every write, at most once per fsync interval, or leave it to the OS
+    ALWAYS = 'always'
+    INTERVAL = 'interval'
+    NEVER = 'never'
+
+
+def atomic_write_bytes(path: Path, data: bytes, fsync: bool = True) -> None:
+    # readers see either the previous content or the new one, never a partial file
+    handle, temp_name = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        # mkstemp creates owner only files, keep what the file had or the usual permissions instead
+        os.chmod(temp_name, path.stat().st_mode & 0o777 if path.exists() else 0o644)
+        with os.fdopen(handle, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_name, path)
+    except BaseException:
+        Path(temp_name).unlink(missing_ok=True)
+        raise
+    if fsync and hasattr(os, 'O_DIRECTORY'):
+        directory = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+def atomic_write_text(path: Path, data: str, encoding: str = 'utf-8', fsync: bool = True) -> None:
+    atomic_write_bytes(path, data.encode(encoding), fsync=fsync)
+
+
+# A file of JSON lines appended to through the writers like a journal and now and then written again whole. Like the
+# journal, a line left half written by a crash is cut before the next append.
+class AppendOnlyFile:
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        # writers write appends before replacements, nothing is appended while the whole file waits to be written
+        self.rewriting = False
+        self._file: BinaryIO | None = None
+
+    def rewrite(self, data: bytes, writer: 'WriteBehindWriter | DirectWriter') -> None:
+        self.rewriting = True
+        writer.replace(self.path, data, self._rewritten)
+
+    def _rewritten(self) -> None:
+        # the next append goes to the new file
+        self.close()
+        self.rewriting = False
+
+    def write(self, data: bytes) -> int:
+        if self._file is None:
+            if self.path.exists():
+                drop_torn_tail(self.path)
+            self._file = self.path.open('ab')
+        self._file.write(data)
+        self._file.flush()
+        return self._file.tell()
+
+    def sync(self) -> None:
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Where commit() sends events : the target encodes and writes them itself, under whatever lock it needs, and takes note
+# of its own failures. Its events are not written again after a failure, other processes may have written since.
+class CommitTarget(Protocol):
+    def commit(self, events: list[Event], sync: bool) -> None: ...
+    def sync(self) -> None: ...
+
+
+# Persists on a background thread so the caller never waits on the disk. Commits, journal appends and file
+# replacements submitted within the debounce window are written together : commits and appends to the same target
+# become one write and only the last content submitted for a file is written. flush() blocks until everything
+# submitted so far is on disk. Appends and replacements that fail are kept and tried again every retry interval,
+# flush() raises the error until they make it to disk.
+class WriteBehindWriter:
+
+    def __init__(self, debounce: float = 0.05, durability: Durability = Durability.INTERVAL, fsync_interval: float = 1.0, retry_interval: float = 1.0) -> None:
+        self.debounce = debounce
+        self.durability = durability
+        self.fsync_interval = fsync_interval
+        self.retry_interval = retry_interval
+        self._cond = threading.Condition()
+        self._commits: dict[CommitTarget, list[Event]] = {}
+        self._appends: dict[EventJournal | AppendOnlyFile, list[bytes]] = {}
+        self._replacements: dict[Path, tuple[bytes, Callable[[], None] | None]] = {}
+        self._dirty: set[EventJournal | AppendOnlyFile | CommitTarget] = set()
+        self._retry_at = 0.0
+        self._last_sync = time.monotonic()
+        self._submitted = 0
+        self._written = 0
+        self._flush_requested = False
+        self._closing = False
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(target=self._run, name='cozy-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def commit(self, target: CommitTarget, events: list[Event]) -> None:
+        with self._cond:
+            self._commits.setdefault(target, []).extend(events)
+            self._submitted += 1
+            self._cond.notify_all()
+
+    def append(self, journal: EventJournal | AppendOnlyFile, data: bytes) -> None:
+        with self._cond:
+            self._appends.setdefault(journal, []).append(data)
+            self._submitted += 1
+            self._cond.notify_all()
+
+    def replace(self, path: Path, data: bytes, on_written: Callable[[], None] | None = None) -> None:
+        with self._cond:
+            self._replacements[path] = (data, on_written)
+            self._submitted += 1
+            self._cond.notify_all()
+
+    def flush(self) -> None:
+        with self._cond:
+            target = self._submitted
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._written < target and self._error is None and self._thread.is_alive():
+                self._cond.wait()
+            self._check()
+
+    def close(self) -> None:
+        if not self._thread.is_alive():
+            return
+        try:
+            self.flush()
+        finally:
+            # whatever still fails gets a last try
+            with self._cond:
+                self._closing = True
+                self._cond.notify_all()
+            self._thread.join()
+            atexit.unregister(self.close)
+
+    def _check(self) -> None:
+        # raised to every flush until the writes that failed are done
+        if self._error is not None:
+            raise self._error
+
+    def _has_work(self) -> bool:
+        return bool(self._commits or self._appends or self._replacements or self._flush_requested or self._closing)
+
+    def _idle(self) -> bool:
+        # waits out the retry interval after a failure, however much work comes in meanwhile
+        if self._closing:
+            return False
+        if self._error is not None and time.monotonic() < self._retry_at:
+            return True
+        return not self._has_work()
+
+    def _sync_due_in(self) -> float | None:
+        if not self._dirty:
+            return None
+        return max(0.0, self.fsync_interval - (time.monotonic() - self._last_sync))
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._idle():
+                    due_in = self._sync_due_in()
+                    if self._error is not None and time.monotonic() < self._retry_at:
+                        due_in = self._retry_at - time.monotonic()
+                    elif due_in == 0.0:
+                        break
+                    self._cond.wait(timeout=due_in)
+                # wait out the debounce window so a burst of mutations ends up in a single write
+                deadline = time.monotonic() + self.debounce
+                while not (self._flush_requested or self._closing) and (self._commits or self._appends or self._replacements):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(timeout=remaining)
+                commits, self._commits = self._commits, {}
+                appends, self._appends = self._appends, {}
+                replacements, self._replacements = self._replacements, {}
+                force_sync = self._flush_requested or self._closing
+                closing = self._closing
+                self._flush_requested = False
+                target = self._submitted
+            try:
+                self._write(commits, appends, replacements, force_sync)
+            except BaseException as e:
+                with self._cond:
+                    # what was not written goes back ahead of what was submitted since
+                    for journal, chunks in self._appends.items():
+                        appends.setdefault(journal, []).extend(chunks)
+                    replacements.update(self._replacements)
+                    self._appends, self._replacements = appends, replacements
+                    self._error = e
+                    self._retry_at = time.monotonic() + self.retry_interval
+                    self._cond.notify_all()
+            else:
+                with self._cond:
+                    self._error = None
+                    self._written = target
+                    self._cond.notify_all()
+            if closing:
+                return
+
+    def _write(self, commits: dict[CommitTarget, list[Event]], appends: dict[EventJournal | AppendOnlyFile, list[bytes]], replacements: dict[Path, tuple[bytes, Callable[[], None] | None]], force_sync: bool) -> None:
+        # journals first, a checkpoint on disk must never get ahead of the events it covers. Whatever is written is
+        # taken out of the dicts, what is left is tried again.
+        for target, events in commits.items():
+            try:
+                target.commit(events, sync=self.durability is Durability.ALWAYS)
+            except Exception:
+                continue
+            if self.durability is not Durability.ALWAYS:
+                self._dirty.add(target)
+        commits.clear()
+        for journal in list(appends):
+            journal.write(b''.join(appends[journal]))
+            del appends[journal]
+            self._dirty.add(journal)
+        if self.durability is Durability.NEVER:
+            self._dirty.clear()
+        elif self.durability is Durability.ALWAYS or force_sync or self._sync_due_in() == 0.0:
+            for journal in self._dirty:
+                journal.sync()
+            self._dirty.clear()
+            self._last_sync = time.monotonic()
+        for path in list(replacements):
+            data, on_written = replacements[path]
+            atomic_write_bytes(path, data, fsync=self.durability is not Durability.NEVER)
+            del replacements[path]
+            if on_written is not None:
+                on_written()
+
+
+# Same interface, writes right away on the calling thread. Meant for scripts and tools where a background thread is
+# not worth it.
+class DirectWriter:
+
+    def __init__(self, durability: Durability = Durability.NEVER) -> None:
+        self.durability = durability
+
+    def commit(self, target: CommitTarget, events: list[Event]) -> None:
+        target.commit(events, sync=self.durability is not Durability.NEVER)
+
+    def append(self, journal: EventJournal | AppendOnlyFile, data: bytes) -> None:
+        journal.write(data)
+        if self.durability is not Durability.NEVER:
+            journal.sync()
+
+    def replace(self, path: Path, data: bytes, on_written: Callable[[], None] | None = None) -> None:
+        atomic_write_bytes(path, data, fsync=self.durability is not Durability.NEVER)
+        if on_written is not None:
+            on_written()
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
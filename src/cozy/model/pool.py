@@ -0,0 +1,88 @@
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from cozy.model.api import SiteController
+from cozy.model.models import StaffRegistry
+from cozy.model.persistence import WriteBehindWriter
+
+
+# Serves many site homes from one process. Sites are loaded the first time they are asked for and the least recently
+# used ones are flushed and dropped once more than max_resident are loaded (or, when a chair budget is given, once the
+# resident sites hold more chairs than that). All sites share one background writer and one staff registry.
+# Dropped controllers are closed : recording through one still held somewhere raises SiteClosedError, get the site from
+# the pool again instead.
+class SitePool:
+
+    def __init__(self, root: Path | None = None, max_resident: int = 8, chair_budget: int | None = None, writer: WriteBehindWriter | None = None, **controller_options: Any) -> None:
+        self.root = root
+        self.max_resident = max_resident
+        self.chair_budget = chair_budget
+        self._owns_writer = writer is None
+        self.writer = writer if writer is not None else WriteBehindWriter()
+        self.staff_registry = StaffRegistry()
+        self._controller_options = controller_options
+        self._sites: OrderedDict[Path, SiteController] = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _home(self, site: Path | str) -> Path:
+        home = Path(site)
+        if not home.is_absolute() and self.root is not None:
+            home = self.root / home
+        return home.resolve()
+
+    def get(self, site: Path | str) -> SiteController:
+        home = self._home(site)
+        with self._lock:
+            controller = self._sites.get(home)
+            if controller is not None:
+                self._sites.move_to_end(home)
+                return controller
+            controller = SiteController(home, writer=self.writer, staff_registry=self.staff_registry, **self._controller_options)
+            self._sites[home] = controller
+            self._evict_over_budget()
+            return controller
+
+    __getitem__ = get
+
+    def __contains__(self, site: Path | str) -> bool:
+        return self._home(site) in self._sites
+
+    def __len__(self) -> int:
+        return len(self._sites)
+
+    @property
+    def resident(self) -> list[Path]:
+        # least recently used first
+        return list(self._sites)
+
+    def evict(self, site: Path | str) -> None:
+        with self._lock:
+            controller = self._sites.pop(self._home(site), None)
+        if controller is not None:
+            controller.close()
+
+    def _resident_chairs(self) -> int:
+        return sum(len(c.site.chairs) for c in self._sites.values())
+
+    def _over_budget(self) -> bool:
+        if len(self._sites) > self.max_resident:
+            return True
+        return self.chair_budget is not None and len(self._sites) > 1 and self._resident_chairs() > self.chair_budget
+
+    def _evict_over_budget(self) -> None:
+        while self._over_budget():
+            _, controller = self._sites.popitem(last=False)
+            controller.close()
+
+    def flush(self) -> None:
+        self.writer.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            while self._sites:
+                _, controller = self._sites.popitem(last=False)
+                controller.close()
+        if self._owns_writer:
+            self.writer.close()
@@ -0,0 +1,210 @@
+import codecs
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Generator, Iterable, Iterator
+
+from cozy.model import binary
+from cozy.model.journal import EventJournal, HEADER_TYPE, SLIM
+from cozy.model.models import Site, Event, EventLog, ChairTakeEvent, ChairLeaveEvent, EVENT_LOG_VIEWS, EVENT_TYPES
+from cozy.model.slim import NameTable, NAME_TYPE, decode_record, chair_id_of
+
+_CHAIR_EVENTS = (ChairTakeEvent, ChairLeaveEvent)
+
+
+# Reads the events of a journal, a binary event log or a JSON event log one at a time, in the order they were recorded.
+# Type and chair filters are checked on the raw record so skipped events are never turned into models. `since` and
+# `until` are checked on every event : an event's `when` can be set by the caller, so the recording order says nothing
+# about it. With `ordered`, `when` is trusted to never go down and reading stops at the first event past `until`.
+class EventStream:
+
+    def __init__(self, path: Path, types: Iterable[type[Event]] | None = None, since: datetime | None = None,
+                 until: datetime | None = None, chair_id: int | None = None, ordered: bool = False) -> None:
+        self.path = path
+        self.since = since
+        self.until = until
+        self.chair_id = chair_id
+        self.ordered = ordered
+        wanted = tuple(types) if types is not None else (Event,)
+        if chair_id is not None:
+            wanted = tuple(t for t in _CHAIR_EVENTS if issubclass(t, wanted))
+        self.types = {t for t in EVENT_TYPES.values() if issubclass(t, wanted)}
+
+    def initial_site_state(self) -> Site | None:
+        kind = self._kind()
+        if kind == 'journal':
+            return EventJournal(self.path).read_initial_site_state()
+        if kind == 'binary':
+            with self.path.open('rb') as f:
+                for tag, payload in binary.iter_event_log_records(f):
+                    if tag == binary.TAG_INITIAL_SITE:
+                        return binary.read_site_record(payload)
+                    if binary.event_type_for_tag(tag) is not None:
+                        break
+            return None
+        return EventLog.model_validate_json(self.path.read_bytes()).initial_site_state
+
+    def __iter__(self) -> Iterator[Event]:
+        return self.events()
+
+    def events(self) -> Generator[Event, None, None]:
+        kind = self._kind()
+        records = self._journal_events() if kind == 'journal' else self._binary_events() if kind == 'binary' else self._json_events()
+        for event in records:
+            if self.until is not None and event.when > self.until:
+                if self.ordered:
+                    records.close()
+                    return
+                continue
+            if self.since is None or event.when >= self.since:
+                yield event
+
+    def _kind(self) -> str:
+        with self.path.open('rb') as f:
+            start = f.read(64)
+        if start.startswith(binary.MAGIC):
+            return 'binary'
+        if start.startswith(b'{"type":"' + HEADER_TYPE.encode() + b'"'):
+            return 'journal'
+        return 'json'
+
+    def _wants(self, event_type: type[Event] | None, data: dict) -> bool:
+        if event_type not in self.types:
+            return False
+        return self.chair_id is None or chair_id_of(data) == self.chair_id
+
+    def _journal_events(self) -> Generator[Event, None, None]:
+        with self.path.open('rb') as f:
+            header = json.loads(f.readline())
+            # slim journals declare names as they go, every declaration is read even when its events are skipped
+            names = NameTable() if header['data'].get('format') == SLIM else None
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # same as EventJournal.events, a torn tail is what a crash mid append leaves behind
+                    return
+                record = json.loads(line)
+                if names is not None and record['type'] == NAME_TYPE:
+                    decode_record(names, record)
+                    continue
+                event_type = EVENT_TYPES.get(record['type'])
+                if self._wants(event_type, record['data']):
+                    yield decode_record(names, record) if names is not None else event_type.model_validate(record['data'])
+
+    def _binary_events(self) -> Generator[Event, None, None]:
+        with self.path.open('rb') as f:
+            for tag, payload in binary.iter_event_log_records(f):
+                event_type = binary.event_type_for_tag(tag)
+                if event_type in self.types:
+                    event = binary.decode_event(tag, payload)
+                    if self.chair_id is None or event.chair.id == self.chair_id:
+                        yield event
+
+    def _json_events(self) -> Generator[Event, None, None]:
+        # a JSON event log is a single document, it is scanned a chunk at a time and only the wanted events are kept, as
+        # plain data until the whole document was read and they can be put back in event order
+        views = {EVENT_LOG_VIEWS.handler_for(t): t for t in EVENT_TYPES.values() if t in self.types}
+        order: list[str] = []
+        by_id: dict[str, tuple[type[Event], dict]] = {}
+        with self.path.open('rb') as f:
+            document = _JsonScanner(f)
+            for key in document.keys():
+                if key == 'event_order':
+                    order.extend(document.items())
+                elif key in views:
+                    for data in document.items():
+                        if self._wants(views[key], data):
+                            by_id[data['id']] = (views[key], data)
+                else:
+                    document.skip()
+        for event_id in order:
+            found = by_id.pop(event_id, None)
+            if found is not None:
+                yield found[0].model_validate(found[1])
+
+
+class _JsonScanner:
+    # Walks the top level object of a JSON document read from a binary file, one key and one array item at a time.
+    # Only the value being decoded and what is left of the current chunk are held in memory.
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, f: BinaryIO) -> None:
+        self._reader = codecs.getincrementaldecoder('utf-8')()
+        self._f = f
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        # reads at least as much as is buffered, a value spanning many chunks is retried a logarithmic number of times
+        chunk = self._f.read(max(self.CHUNK_SIZE, len(self._buffer) - self._pos))
+        self._eof = not chunk
+        self._buffer = self._buffer[self._pos:] + self._reader.decode(chunk, final=self._eof)
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON document")
+
+    def _expect(self, *chars: str) -> str:
+        char = self._peek()
+        if char not in chars:
+            raise ValueError(f"Expected one of [{''.join(chars)}] at [{char}] in JSON document")
+        self._pos += 1
+        return char
+
+    def _value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number running to the end of the buffer may go on in the next chunk
+            if end < len(self._buffer) or not self._fill():
+                self._pos = end
+                return value
+
+    def keys(self) -> Iterator[str]:
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            yield key
+            if self._expect(',', '}') == '}':
+                return
+
+    def items(self) -> Iterator[Any]:
+        # the caller must read every item before moving to the next key
+        if self._peek() == 'n':
+            self._value()
+            return
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(',', ']') == ']':
+                return
+
+    def skip(self) -> None:
+        self._value()
+
+def read_events(path: Path, types: Iterable[type[Event]] | None = None, since: datetime | None = None,
+                until: datetime | None = None, chair_id: int | None = None,
+                ordered: bool = False) -> Generator[Event, None, None]:
+    return EventStream(path, types, since, until, chair_id, ordered).events()
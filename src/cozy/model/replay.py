@@ -0,0 +1,113 @@
+from bisect import bisect_right
+from datetime import datetime
+from typing import Callable, Iterable
+
+from cozy.model.journal import EventJournal
+from cozy.model.models import Site, Chair, EventLog, EventRegistry, Event, SiteResizedEvent, ChairTakeEvent, ChairLeaveEvent, StaffAddEvent, \
+    StaffRemoveEvent, ClientAddEvent, ClientRemoveEvent
+
+
+def _apply_site_resized(site: Site, event: SiteResizedEvent) -> None:
+    # resizes recorded by SiteController.resize come after the moves they implied, nothing is left to relocate then
+    site.init_chairs(event.capacity)
+
+
+def _apply_chair_take(site: Site, event: ChairTakeEvent) -> None:
+    chair = site.chairs[event.chair.id - 1]
+    chair.occupant = event.chair.occupant.model_copy() if event.chair.occupant else None
+    chair.since = event.chair.since if event.chair.since is not None else event.when
+
+
+def _apply_chair_leave(site: Site, event: ChairLeaveEvent) -> None:
+    site.release(event.chair.id)
+
+
+def _apply_staff_add(site: Site, event: StaffAddEvent) -> None:
+    if not site.has_staff(event.who.name):
+        site.add_staff(event.who.model_copy())
+
+
+def _apply_staff_remove(site: Site, event: StaffRemoveEvent) -> None:
+    site.remove_staff(event.who.name)
+
+
+def _apply_nothing(site: Site, event: Event) -> None:
+    # clients are not part of the site state
+    pass
+
+
+EVENT_APPLIERS: EventRegistry[Callable[[Site, Event], None]] = EventRegistry({
+    SiteResizedEvent: _apply_site_resized,
+    ChairTakeEvent: _apply_chair_take,
+    ChairLeaveEvent: _apply_chair_leave,
+    StaffAddEvent: _apply_staff_add,
+    StaffRemoveEvent: _apply_staff_remove,
+    ClientAddEvent: _apply_nothing,
+    ClientRemoveEvent: _apply_nothing,
+})
+
+
+def apply_event(site: Site, event: Event) -> None:
+    EVENT_APPLIERS.handler_for(type(event))(site, event)
+
+
+def apply_events(site: Site, events: Iterable[Event]) -> Site:
+    for event in events:
+        apply_event(site, event)
+    return site
+
+
+class SiteReplayer:
+    # Rebuilds the site as it was at any moment of an event history. A snapshot of the site is kept every `stride`
+    # events so that seeking only replays the short span of events between the closest snapshot and the moment asked.
+    # Events are expected in the order they were recorded, which is also their chronological order.
+
+    def __init__(self, initial_site_state: Site | None, events: Iterable[Event] = (), stride: int = 256) -> None:
+        self.stride = stride
+        self._events: list[Event] = []
+        self._times: list[datetime] = []
+        self._snapshots: list[Site] = []
+        self._site = initial_site_state.model_copy(deep=True) if initial_site_state else Site(capacity=0, name='', staff=[], chairs=[])
+        for event in events:
+            self.append(event)
+
+    @classmethod
+    def from_event_log(cls, event_log: EventLog, stride: int = 256) -> 'SiteReplayer':
+        return cls(event_log.initial_site_state, event_log.events, stride=stride)
+
+    @classmethod
+    def from_journal(cls, journal: EventJournal, stride: int = 256) -> 'SiteReplayer':
+        return cls(journal.read_initial_site_state(), (event for _, event in journal.events()), stride=stride)
+
+    def append(self, event: Event) -> None:
+        if len(self._events) % self.stride == 0:
+            self._snapshots.append(self._site.model_copy(deep=True))
+        self._events.append(event)
+        self._times.append(event.when)
+        apply_event(self._site, event)
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    @property
+    def site(self) -> Site:
+        # the state after the last known event, do not modify
+        return self._site
+
+    def state_after(self, event_count: int) -> Site:
+        # the site once the first event_count events were applied
+        event_count = max(0, min(event_count, len(self._events)))
+        snapshot = event_count // self.stride
+        if snapshot >= len(self._snapshots):
+            snapshot = len(self._snapshots) - 1
+        if snapshot < 0:
+            return self._site.model_copy(deep=True)
+        site = self._snapshots[snapshot].model_copy(deep=True)
+        return apply_events(site, self._events[snapshot * self.stride:event_count])
+
+    def state_at(self, when: datetime) -> Site:
+        # the site including every event that happened at or before the given moment
+        return self.state_after(bisect_right(self._times, when))
+
+    def chair_at(self, chair_id: int, when: datetime) -> Chair:
+        return self.state_at(when).chairs[chair_id - 1]
@@ -0,0 +1,88 @@
+import time
+from datetime import timedelta
+from typing import Callable
+
+
+# Who is working the floor right now. Selecting a staff member opens a session that stays fully active for the grace
+# period after the last interaction, then winds down over the active period and expires. Nothing polls : the owner
+# gives a `wake_up(delay)` that calls check() once after `delay` seconds (a new call replaces the pending one), which
+# the UI backs with a single shot timer. Interactions only move the deadline, a wake up that comes too early simply
+# schedules the next one.
+class StaffSessionManager:
+
+    def __init__(self, grace_period: timedelta = timedelta(seconds=5), active_period: timedelta = timedelta(seconds=10),
+                 wake_up: Callable[[float], None] | None = None, clock: Callable[[], float] = time.monotonic) -> None:
+        self.grace_period = grace_period.total_seconds()
+        self.active_period = active_period.total_seconds()
+        self.wake_up = wake_up
+        self.clock = clock
+        self.staff: str | None = None
+        self.last_interaction = 0.0
+        self._started: list[Callable[[str], None]] = []
+        self._expired: list[Callable[[str], None]] = []
+
+    def on_started(self, listener: Callable[[str], None]) -> None:
+        self._started.append(listener)
+
+    def on_expired(self, listener: Callable[[str], None]) -> None:
+        self._expired.append(listener)
+
+    @property
+    def is_active(self) -> bool:
+        return self.staff is not None
+
+    @property
+    def deadline(self) -> float | None:
+        return self.last_interaction + self.grace_period + self.active_period if self.staff is not None else None
+
+    @property
+    def winding_down_at(self) -> float | None:
+        # when the grace period ends and the remaining time starts going down
+        return self.last_interaction + self.grace_period if self.staff is not None else None
+
+    def start(self, staff: str) -> None:
+        if self.staff == staff:
+            self.extend()
+            return
+        if self.staff is not None:
+            self._expire()
+        self.staff = staff
+        self.last_interaction = self.clock()
+        self._schedule()
+        for listener in self._started:
+            listener(staff)
+
+    def extend(self) -> None:
+        if self.staff is not None:
+            self.last_interaction = self.clock()
+
+    def end(self) -> None:
+        if self.staff is not None:
+            self._expire()
+
+    def remaining(self, now: float | None = None) -> float:
+        # 1.0 through the grace period, then down to 0.0 when the session expires
+        if self.staff is None:
+            return 0.0
+        now = self.clock() if now is None else now
+        left = self.deadline - now
+        if left <= 0:
+            return 0.0
+        return min(1.0, left / self.active_period) if self.active_period else 1.0
+
+    def check(self) -> None:
+        if self.staff is None:
+            return
+        if self.clock() >= self.deadline:
+            self._expire()
+        else:
+            self._schedule()
+
+    def _schedule(self) -> None:
+        if self.wake_up is not None:
+            self.wake_up(max(0.0, self.deadline - self.clock()))
+
+    def _expire(self) -> None:
+        staff, self.staff = self.staff, None
+        for listener in self._expired:
+            listener(staff)
@@ -0,0 +1,201 @@
+import argparse
+import json
+import mmap
+import os
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+from cozy.model.models import Event, EventRegistry, Staff, Client, SiteResizedEvent, ChairTakeEvent, \
+    ChairLeaveEvent, StaffAddEvent, StaffRemoveEvent, ClientAddEvent, ClientRemoveEvent, EVENT_TYPES
+
+NAME_TYPE = 'Name'
+
+# a whole name declaration line, a half written one at the tail of the journal is not
+_NAME_RECORD = re.compile(rb'^\{"type":"' + NAME_TYPE.encode() + rb'",.*\n', re.MULTILINE)
+
+
+# Every staff and client name a slim journal refers to, by id. A name gets its id the first time it is written and the
+# record declaring it goes in the journal right before the first event using it, so the journal stays self contained.
+# Ids given out while encoding are only taken for good by commit(), once the records declaring them are written : the
+# journal encodes and writes under the site lock, so no other process hands out the same id meanwhile.
+# Decoded events share one Staff and one Client instance per name.
+class NameTable:
+
+    def __init__(self) -> None:
+        self._ids: dict[str, int] = {}
+        self._names: dict[int, str] = {}
+        self._pending: dict[str, int] = {}
+        self._staff: dict[int, Staff] = {}
+        self._clients: dict[int, Client] = {}
+        # true once every name of the journal is known, ids can then be handed out
+        self.complete = False
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def register(self, name_id: int, name: str) -> None:
+        self._ids[name] = name_id
+        self._names[name_id] = name
+
+    def id_of(self, name: str, declared: list[bytes]) -> int:
+        # a name seen for the first time gets the next id and its declaration is added to `declared`
+        name_id = self._ids.get(name)
+        if name_id is None:
+            name_id = self._pending.get(name)
+            if name_id is None:
+                name_id = self._pending[name] = len(self._names) + len(self._pending) + 1
+                declared.append(_line({'type': NAME_TYPE, 'data': {'id': name_id, 'name': name}}))
+        return name_id
+
+    def commit(self) -> None:
+        # the records declaring the pending names are written
+        for name, name_id in self._pending.items():
+            self.register(name_id, name)
+        self._pending.clear()
+
+    def discard(self) -> None:
+        # the records declaring the pending names were never written, their ids are given out again
+        self._pending.clear()
+
+    def staff(self, name_id: int) -> Staff:
+        staff = self._staff.get(name_id)
+        if staff is None:
+            staff = self._staff[name_id] = Staff(name=self._names[name_id])
+        return staff
+
+    def client(self, name_id: int | None) -> Client | None:
+        if name_id is None:
+            return None
+        client = self._clients.get(name_id)
+        if client is None:
+            client = self._clients[name_id] = Client(name=self._names[name_id])
+        return client
+
+    def scan(self, path: Path, end: int | None = None) -> None:
+        # picks the name declarations out of the first `end` bytes of a journal without parsing anything else
+        with path.open('rb') as f:
+            size = f.seek(0, 2)
+            if size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for match in _NAME_RECORD.finditer(data, 0, size if end is None else min(end, size)):
+                    record = json.loads(match.group())
+                    self.register(record['data']['id'], record['data']['name'])
+
+
+def _line(record: dict) -> bytes:
+    return (json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def _encode_chair(names: NameTable, event: ChairTakeEvent | ChairLeaveEvent, declared: list[bytes], data: dict) -> None:
+    data['chair'] = event.chair.id
+    if event.chair.occupant is not None:
+        data['client'] = names.id_of(event.chair.occupant.name, declared)
+    since = event.chair.since
+    if since is not None:
+        try:
+            # seconds from the event time, a chair is taken when the event happens give or take the time zone
+            data['since'] = (since - event.when).total_seconds()
+        except TypeError:
+            # one is time zone aware and the other is not
+            data['since'] = since.isoformat()
+
+
+def _decode_chair(names: NameTable, data: dict, when: str) -> dict:
+    since = data.get('since')
+    if since is not None and not isinstance(since, str):
+        since = datetime.fromisoformat(when) + timedelta(seconds=since)
+    return {'chair': {'id': data['chair'], 'occupant': names.client(data.get('client')), 'since': since}}
+
+
+# per event type : what it adds to the id, time and staff of every event and how to read it back. Chairs are written
+# as their id plus the ids of the names involved, the rest of a chair snapshot is left out when empty.
+_SLIM_CODECS: EventRegistry[tuple[Callable[[NameTable, Any, list[bytes], dict], None], Callable[[NameTable, dict, str], dict]]] = EventRegistry({
+    SiteResizedEvent: (lambda n, e, d, data: data.update(capacity=e.capacity), lambda n, data, when: {'capacity': data['capacity']}),
+    ChairTakeEvent: (_encode_chair, _decode_chair),
+    ChairLeaveEvent: (_encode_chair, _decode_chair),
+    StaffAddEvent: (lambda n, e, d, data: data.update(who=n.id_of(e.who.name, d)), lambda n, data, when: {'who': n.staff(data['who'])}),
+    StaffRemoveEvent: (lambda n, e, d, data: data.update(who=n.id_of(e.who.name, d)), lambda n, data, when: {'who': n.staff(data['who'])}),
+    ClientAddEvent: (lambda n, e, d, data: data.update(who=n.id_of(e.who.name, d)), lambda n, data, when: {'who': n.client(data['who'])}),
+    ClientRemoveEvent: (lambda n, e, d, data: data.update(who=n.id_of(e.who.name, d)), lambda n, data, when: {'who': n.client(data['who'])}),
+})
+
+
+def encode_events(names: NameTable, events: Iterable[Event]) -> bytes:
+    lines: list[bytes] = []
+    for event in events:
+        encode, _ = _SLIM_CODECS.handler_for(type(event))
+        data = {'id': str(event.id), 'when': event.when.isoformat(), 'by': names.id_of(event.by.name, lines)}
+        encode(names, event, lines, data)
+        lines.append(_line({'type': type(event).__name__, 'data': data}))
+    return b''.join(lines)
+
+
+def decode_record(names: NameTable, record: dict) -> Event | None:
+    # the event held by a slim journal record in its usual shape, None for a name declaration (which is remembered)
+    data = record['data']
+    if record['type'] == NAME_TYPE:
+        names.register(data['id'], data['name'])
+        return None
+    event_type = EVENT_TYPES[record['type']]
+    _, decode = _SLIM_CODECS.handler_for(event_type)
+    # validated in one go from the raw values, the shared Staff and Client instances are taken as they are
+    fields = {'id': data['id'], 'when': data['when'], 'by': names.staff(data['by'])}
+    fields.update(decode(names, data, data['when']))
+    return event_type.model_validate(fields)
+
+
+def chair_id_of(data: dict) -> int:
+    # the chair of a chair event record, full or slim
+    chair = data['chair']
+    return chair if isinstance(chair, int) else chair['id']
+
+
+def migrate_journal(source: Path, destination: Path | None = None, batch_size: int = 1000) -> Path:
+    # rewrites a journal in the slim format, in place when no destination is given. Checkpoints and other files
+    # pointing into the old journal by byte offset no longer match it and are rebuilt on the next start.
+    from cozy.model.journal import EventJournal, SLIM
+    target = destination if destination is not None else source.with_name(source.name + '.slim')
+    old = EventJournal(source)
+    new = EventJournal(target, format=SLIM)
+    new.start(old.read_initial_site_state())
+    batch: list[Event] = []
+    for _, event in old.events():
+        batch.append(event)
+        if len(batch) >= batch_size:
+            new.append_many(batch)
+            batch.clear()
+    new.append_many(batch)
+    new.sync()
+    new.close()
+    if destination is None:
+        os.replace(target, source)
+        return source
+    return target
+
+
+def migrate_site(home: Path) -> tuple[int, int]:
+    # the journal of a site home, while no controller has it open. Its checkpoints are dropped with the old offsets,
+    # the next start replays the journal once and checkpoints again. Returns the journal size before and after.
+    from cozy.model.checkpoint import CheckpointStore
+    journal = home / 'journal.jsonl'
+    before = journal.stat().st_size
+    migrate_journal(journal)
+    for checkpoint in CheckpointStore(home / 'checkpoints').paths():
+        checkpoint.unlink()
+    return before, journal.stat().st_size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rewrite the journal of cozy sites with slim event records")
+    parser.add_argument('homes', type=Path, nargs='+', help="site homes, with no cozy running on them")
+    args = parser.parse_args()
+    for home in args.homes:
+        before, after = migrate_site(home)
+        print(f"{home} : {before} -> {after} bytes")
+
+
+if __name__ == '__main__':
+    main()
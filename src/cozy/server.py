@@ -0,0 +1,206 @@
+import argparse
+import json
+import logging
+import threading
+from datetime import datetime
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from os.path import expanduser
+from pathlib import Path
+from typing import Any, Callable
+from urllib.parse import urlparse, parse_qs
+
+from cozy.client import DEFAULT_PORT
+from cozy.model.api import SiteController
+from cozy.model.locking import SiteVersionConflictError, SiteLockTimeoutError
+from cozy.model.models import Client, SiteException, DoubleOccupancyError, StaffNotFoundError
+
+
+logger = logging.getLogger(__name__)
+
+
+# Owns the one SiteController of a site home and lets several terminals share it. Mutations go through a single lock,
+# reads never take it : they are answered from the last published snapshot, an immutable (version, serialized site)
+# pair swapped in whole after every mutation and every reload. Changes other processes make to the home are picked up
+# by a background tick. Versions are the controller's own, they survive a restart of the server and only move when an
+# event is recorded.
+class SiteService:
+
+    def __init__(self, controller: SiteController, poll_interval: float = 1.0) -> None:
+        self.controller = controller
+        self.poll_interval = poll_interval
+        self._write_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._poller: threading.Thread | None = None
+        self._snapshot: tuple[int, bytes] = self._serialize()
+
+    @property
+    def version(self) -> int:
+        return self.controller.version
+
+    def _serialize(self) -> tuple[int, bytes]:
+        return self.controller.version, self.controller.site.model_dump_json().encode('utf-8')
+
+    def _publish(self) -> None:
+        # under the write lock, readers see the previous tuple or this one
+        self._snapshot = self._serialize()
+
+    def snapshot(self) -> tuple[int, bytes]:
+        return self._snapshot
+
+    def reload(self) -> bool:
+        # another process sharing the home may have committed, reading its version file is all it costs otherwise
+        with self._write_lock:
+            changed = self.controller.reload_if_changed()
+            if changed:
+                self._publish()
+        return changed
+
+    def start(self) -> 'SiteService':
+        self._poller = threading.Thread(target=self._poll, name='cozy-site-poller', daemon=True)
+        self._poller.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._poller is not None:
+            self._poller.join()
+
+    def _poll(self) -> None:
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Could not reload the site")
+
+    def _mutate(self, staff: str | None, change: Callable[[], None]) -> int:
+        with self._write_lock:
+            if self.controller.reload_if_changed():
+                self._publish()
+            self.controller.active_staff = staff
+            try:
+                # a request failing half way leaves the site as it was
+                with self.controller.transaction():
+                    change()
+                # the writer checks the version on disk, a refusal is answered like any other conflict
+                self.controller.wait_written()
+            except SiteVersionConflictError:
+                self.controller.reload_if_changed()
+                raise
+            finally:
+                self.controller.active_staff = None
+                self._publish()
+            return self.version
+
+    def occupy(self, chair_id: int, occupant: str, staff: str | None, since: datetime | None = None) -> int:
+        def change() -> None:
+            chair = self.controller.site.chairs[chair_id - 1]
+            chair.take(Client(name=occupant), since)
+            self.controller.occupy_chair(chair)
+        return self._mutate(staff, change)
+
+    def free(self, chair_id: int, staff: str | None) -> int:
+        def change() -> None:
+            chair = self.controller.site.chairs[chair_id - 1]
+            chair.release()
+            self.controller.free_chair(chair)
+        return self._mutate(staff, change)
+
+    def add_staff(self, name: str) -> int:
+        return self._mutate(None, lambda: self.controller.add_staff(name))
+
+
+class SiteRequestHandler(BaseHTTPRequestHandler):
+    service: SiteService
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: HTTPStatus, payload: dict | bytes, version: int | None = None) -> None:
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if version is not None:
+            self.send_header('X-Site-Version', str(version))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: HTTPStatus, error: BaseException) -> None:
+        self._send_json(status, {'error': str(error), 'type': type(error).__name__})
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path != '/site':
+            self._send_json(HTTPStatus.NOT_FOUND, {'error': f"Unknown resource [{url.path}]"})
+            return
+        version, body = self.service.snapshot()
+        known = parse_qs(url.query).get('if_version_not', [None])[0]
+        if known is not None and known == str(version):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('X-Site-Version', str(version))
+            self.end_headers()
+            return
+        self._send_json(HTTPStatus.OK, body, version)
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if url.path == '/occupy':
+                since = datetime.fromisoformat(request['since']) if request.get('since') else None
+                version = self.service.occupy(int(request['chair_id']), request['occupant'], request.get('staff'), since)
+            elif url.path == '/free':
+                version = self.service.free(int(request['chair_id']), request.get('staff'))
+            elif url.path == '/staff':
+                version = self.service.add_staff(request['name'])
+            else:
+                self._send_json(HTTPStatus.NOT_FOUND, {'error': f"Unknown resource [{url.path}]"})
+                return
+        except (DoubleOccupancyError, SiteVersionConflictError) as e:
+            self._send_error(HTTPStatus.CONFLICT, e)
+            return
+        except StaffNotFoundError as e:
+            self._send_error(HTTPStatus.NOT_FOUND, e)
+            return
+        except SiteLockTimeoutError as e:
+            self._send_error(HTTPStatus.SERVICE_UNAVAILABLE, e)
+            return
+        except (SiteException, KeyError, ValueError, IndexError) as e:
+            self._send_error(HTTPStatus.BAD_REQUEST, e)
+            return
+        except Exception as e:
+            # the disk or anything else failing, the client still gets an answer
+            self._send_error(HTTPStatus.INTERNAL_SERVER_ERROR, e)
+            return
+        self._send_json(HTTPStatus.OK, {'version': version}, version)
+
+
+def make_server(service: SiteService, host: str = '127.0.0.1', port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    handler = type('BoundSiteRequestHandler', (SiteRequestHandler,), {'service': service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve one cozy site to every terminal of the shelter")
+    parser.add_argument('--home', type=Path, default=Path(expanduser("~")) / '.cozy_2')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    # a cozy window or tool opening the same home directly commits under the same lock
+    controller = SiteController(site_home=args.home, locking=True)
+    service = SiteService(controller).start()
+    server = make_server(service, args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+        controller.close()
+
+
+if __name__ == '__main__':
+    main()
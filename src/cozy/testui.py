@@ -18,29 +18,33 @@ cozy_data_folder = cozy_home / 'data'
 cozy_today_site_folder = cozy_home / 'data' / datetime.now().strftime('%Y-%m-%d')
 cozy_today_site_file = cozy_today_site_folder / 'site_state.json'
 
-if not cozy_home.exists():
-    cozy_home.mkdir()
+# filled in by load_sites() when the window is opened, importing this module does not touch the disk
+default_site: Site | None = None
+site: Site | None = None
 
-if not cozy_data_folder.exists():
-    cozy_data_folder.mkdir()
 
-if not cozy_default_site_file.exists():
-    default_site: Site = Site(capacity=50, name="Cozy", staff=[], chairs=[])
-    while len(default_site.chairs) < default_site.capacity:
-        default_site.chairs.append(Chair(id=len(default_site.chairs) + 1, occupant=None, since=None))
-    cozy_default_site_file.write_text(data=default_site.model_dump_json(indent=2), encoding='utf-8')
-else:
-    default_site: Site = Site.model_validate_json(cozy_default_site_file.read_text(encoding='utf-8'))
+def load_sites() -> None:
+    global default_site, site
+    if not cozy_home.exists():
+        cozy_home.mkdir()
+
+    if not cozy_data_folder.exists():
+        cozy_data_folder.mkdir()
 
-# now we load the actual site or take a copy of the default site
-if not cozy_today_site_folder.exists():
-    cozy_today_site_folder.mkdir()
-    cozy_today_site_file.write_text(data=default_site.model_dump_json(indent=2), encoding='utf-8')
+    if not cozy_default_site_file.exists():
+        default_site = Site(capacity=50, name="Cozy", staff=[], chairs=[])
+        while len(default_site.chairs) < default_site.capacity:
+            default_site.chairs.append(Chair(id=len(default_site.chairs) + 1, occupant=None, since=None))
+        cozy_default_site_file.write_text(data=default_site.model_dump_json(indent=2), encoding='utf-8')
+    else:
+        default_site = Site.model_validate_json(cozy_default_site_file.read_text(encoding='utf-8'))
 
-site: Site = Site.model_validate_json(cozy_today_site_file.read_text(encoding='utf-8'))
+    # now we load the actual site or take a copy of the default site
+    if not cozy_today_site_folder.exists():
+        cozy_today_site_folder.mkdir()
+        cozy_today_site_file.write_text(data=default_site.model_dump_json(indent=2), encoding='utf-8')
 
-sg.theme('DarkAmber')  # Add a touch of color
-staff_button_list = [sg.Button(s.name) for s in site.staff]
+    site = Site.model_validate_json(cozy_today_site_file.read_text(encoding='utf-8'))
 
 
 def save_staff():
@@ -55,7 +59,7 @@ def save_site():
 # All the stuff inside your window.
 def create_window() -> Window:
     layout = [
-        staff_button_list,
+        [sg.Button(s.name) for s in site.staff],
         [
             sg.Button('Add new Staff', enable_events=True, key='AddNewStaff'),
             sg.Button('Add', enable_events=True, key='StaffAdd', visible=False),
@@ -87,63 +91,68 @@ def create_single_chair(chair: Chair) -> list[Element]:
     ]
 
 
-window = create_window()
-# Event Loop to process "events" and get the "values" of the inputs
-while True:
-    event, values = window.read()
-    if event == sg.WIN_CLOSED or event == 'Cancel':  # if user closes window or clicks cancel
-        break
-    print('You entered ', values)
-    print(event)
-
-    if event == 'AddNewStaff':
-        print('AddNewStaff Button init')
-        add_btn = window['AddNewStaff']
-        do_add_btn = window['StaffAdd']
-        cancel_add_btn = window['StaffCancelAdd']
-        txt = window['StaffName']
-        print('AddNewStaff : begin', txt.Disabled)
-        add_btn.update(disabled=True, visible=False)
-        txt.update(disabled=False, visible=True)
-        do_add_btn.update(disabled=False, visible=True)
-        cancel_add_btn.update(disabled=False, visible=True)
-
-    if event == 'StaffAdd':
-        add_btn = window['AddNewStaff']
-        do_add_btn = window['StaffAdd']
-        cancel_add_btn = window['StaffCancelAdd']
-        txt = window['StaffName']
-        print('AddNewStaff: Update')
-        site.staff.append(Staff(name=values['StaffName']))
-        staff_button_list = [sg.Button(s.name) for s in site.staff]
-        window.close()
-        window = create_window()
-        save_staff()
-        save_site()
-
-    if event in ['StaffCancelAdd']:
-        add_btn = window['AddNewStaff']
-        do_add_btn = window['StaffAdd']
-        cancel_add_btn = window['StaffCancelAdd']
-        txt = window['StaffName']
-        add_btn.update(disabled=False, visible=True)
-        txt.update(disabled=True, visible=False, value='')
-        do_add_btn.update(disabled=True, visible=False)
-        cancel_add_btn.update(disabled=True, visible=False)
-
-    if event.startswith('Chair'):
-        chair = window[event].metadata
-        occupant = values[str(event).replace('Occupied', 'Occupant')]
-        print(f'Chair {chair.id} is occupied: {values[event]}')
-        if values[event]:
-            chair.since = datetime.now()
-            chair.occupant = Client.parse_obj({'name': occupant})
-        else:
-            chair.occupant = None
-            chair.since = None
-        window[str(event).replace('Occupied', 'Since')].update(str(chair))
-        window[str(event).replace('Occupied', 'Occupant')].update(str(chair.occupant if chair.occupant else ''))
-        save_site()
-
-
-window.close()
+def main():
+    load_sites()
+    sg.theme('DarkAmber')  # Add a touch of color
+    window = create_window()
+    # Event Loop to process "events" and get the "values" of the inputs
+    while True:
+        event, values = window.read()
+        if event == sg.WIN_CLOSED or event == 'Cancel':  # if user closes window or clicks cancel
+            break
+        print('You entered ', values)
+        print(event)
+
+        if event == 'AddNewStaff':
+            print('AddNewStaff Button init')
+            add_btn = window['AddNewStaff']
+            do_add_btn = window['StaffAdd']
+            cancel_add_btn = window['StaffCancelAdd']
+            txt = window['StaffName']
+            print('AddNewStaff : begin', txt.Disabled)
+            add_btn.update(disabled=True, visible=False)
+            txt.update(disabled=False, visible=True)
+            do_add_btn.update(disabled=False, visible=True)
+            cancel_add_btn.update(disabled=False, visible=True)
+
+        if event == 'StaffAdd':
+            add_btn = window['AddNewStaff']
+            do_add_btn = window['StaffAdd']
+            cancel_add_btn = window['StaffCancelAdd']
+            txt = window['StaffName']
+            print('AddNewStaff: Update')
+            site.staff.append(Staff(name=values['StaffName']))
+            window.close()
+            window = create_window()
+            save_staff()
+            save_site()
+
+        if event in ['StaffCancelAdd']:
+            add_btn = window['AddNewStaff']
+            do_add_btn = window['StaffAdd']
+            cancel_add_btn = window['StaffCancelAdd']
+            txt = window['StaffName']
+            add_btn.update(disabled=False, visible=True)
+            txt.update(disabled=True, visible=False, value='')
+            do_add_btn.update(disabled=True, visible=False)
+            cancel_add_btn.update(disabled=True, visible=False)
+
+        if event.startswith('Chair'):
+            chair = window[event].metadata
+            occupant = values[str(event).replace('Occupied', 'Occupant')]
+            print(f'Chair {chair.id} is occupied: {values[event]}')
+            if values[event]:
+                chair.since = datetime.now()
+                chair.occupant = Client.parse_obj({'name': occupant})
+            else:
+                chair.occupant = None
+                chair.since = None
+            window[str(event).replace('Occupied', 'Since')].update(str(chair))
+            window[str(event).replace('Occupied', 'Occupant')].update(str(chair.occupant if chair.occupant else ''))
+            save_site()
+
+    window.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+from pathlib import Path
+
+from cozy.model.api import SiteController
+from cozy.model.models import Client
+from cozy.model.persistence import DirectWriter
+
+
+def open_site(home: Path, staff: str = 'ann', **kwargs) -> SiteController:
+    # a controller writing synchronously, with `staff` on duty
+    controller = SiteController(home, writer=DirectWriter(), **kwargs)
+    controller.add_staff(staff)
+    controller.active_staff = staff
+    return controller
+
+
+def seat(controller: SiteController, chair_index: int, name: str) -> None:
+    chair = controller.site.chairs[chair_index]
+    chair.take(Client(name=name))
+    controller.occupy_chair(chair)
+
+
+def free(controller: SiteController, chair_index: int) -> None:
+    chair = controller.site.chairs[chair_index]
+    chair.release()
+    controller.free_chair(chair)
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from cozy.model.aio import AsyncSiteController
+from cozy.model.api import SiteController
+from cozy.model.history import client
+from cozy.model.locking import SiteVersionConflictError
+from cozy.model.models import Client
+from cozy.model.persistence import DirectWriter, WriteBehindWriter
+
+
+async def _open(home, **kwargs) -> AsyncSiteController:
+    api = await AsyncSiteController.open(home, writer=WriteBehindWriter(debounce=0.01), **kwargs)
+    await api.add_staff('ann')
+    api.active_staff = 'ann'
+    return api
+
+
+async def _seat(api: AsyncSiteController, index: int, name: str) -> None:
+    chair = api.site.chairs[index]
+    chair.take(Client(name=name))
+    await api.occupy_chair(chair)
+
+
+async def _close(api: AsyncSiteController) -> None:
+    await api.close()
+    api.controller.writer.close()
+
+
+def test_mutations_are_written_when_awaited(tmp_path):
+    home = tmp_path / 'site'
+
+    async def scenario():
+        api = await _open(home, checkpoint_interval=3)
+        for index in range(7):
+            await _seat(api, index, f'client {index}')
+        # written, checkpointed along the way, nothing waits in the writer
+        assert not api.controller.writing
+        assert list((home / 'checkpoints').iterdir())
+        other = SiteController(home, writer=DirectWriter())
+        assert other.site.model_dump() == api.site.model_dump()
+        other.close()
+        await _close(api)
+
+    asyncio.run(scenario())
+
+
+def test_refused_commit_raises_from_the_mutation(tmp_path):
+    home = tmp_path / 'site'
+
+    async def scenario():
+        first = await _open(home)
+        second = await _open(home)
+        await _seat(first, 0, 'zoe')
+        with pytest.raises(SiteVersionConflictError):
+            await _seat(second, 1, 'yan')
+        with pytest.raises(SiteVersionConflictError):
+            await second.add_staff('bob')
+
+        assert await second.reload_if_changed() is True
+        assert await second.reload_if_changed() is False
+        assert second.site.chairs[0].occupant.name == 'zoe'
+        await _seat(second, 1, 'yan')
+        assert await first.reload_if_changed() is True
+        assert first.site.model_dump() == second.site.model_dump()
+        await _close(first)
+        await _close(second)
+
+    asyncio.run(scenario())
+
+
+def test_queries_wait_for_the_event_log_off_the_loop(tmp_path):
+    async def scenario():
+        api = await _open(tmp_path / 'site')
+        await _seat(api, 0, 'zoe')
+        assert [e.chair.id for e in await api.query(client('zoe'))] == [1]
+        await _close(api)
+
+    asyncio.run(scenario())
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from cozy.model.models import EventLog, ChairTakeEvent, ChairLeaveEvent, StaffAddEvent, Chair, Client, Staff
+
+np = pytest.importorskip('numpy')
+from cozy.model.analytics import StayTable  # noqa: E402
+
+START = datetime(2024, 3, 1, 8)
+ANN = Staff(name='ann')
+
+
+def _at(minutes: int) -> datetime:
+    return START + timedelta(minutes=minutes)
+
+
+def _take(chair_id: int, minutes: int) -> ChairTakeEvent:
+    return ChairTakeEvent(when=_at(minutes), by=ANN, chair=Chair(id=chair_id, occupant=Client(name='zoe'), since=_at(minutes)))
+
+
+def _leave(chair_id: int, minutes: int) -> ChairLeaveEvent:
+    return ChairLeaveEvent(when=_at(minutes), by=ANN, chair=Chair(id=chair_id, occupant=None, since=None))
+
+
+def _log(*events) -> EventLog:
+    log = EventLog(initial_site_state=None)
+    for event in events:
+        log.append(event)
+    return log
+
+
+# chair 1 : 30 then 90 minutes, chair 2 : 60 minutes then still seated, chair 3 : a missed leave ends at the next take
+EVENTS = (_take(1, 0), _take(2, 10), StaffAddEvent(when=_at(15), by=ANN, who=Staff(name='bob')), _leave(1, 30),
+          _take(3, 40), _take(1, 60), _leave(2, 70), _take(3, 100), _take(2, 110), _leave(1, 150), _leave(3, 160))
+
+
+def test_pairs_takes_with_what_ends_them():
+    table = StayTable.from_event_log(_log(*EVENTS))
+    assert len(table) == 6
+    assert sorted(d // np.timedelta64(1, 'm') for d in table.durations()) == [30, 60, 60, 60, 90]
+    assert table.closed.sum() == 5
+    assert table.average_stay() == timedelta(minutes=60)
+    assert table.turnover_per_chair() == {1: 2, 2: 2, 3: 2}
+
+
+def test_stays_span_archived_logs():
+    first, second = _log(*EVENTS[:5]), _log(*EVENTS[5:])
+    assert sorted(StayTable.from_event_logs([first, second]).durations().tolist()) == sorted(StayTable.from_events(EVENTS).durations().tolist())
+
+
+def test_occupancy():
+    table = StayTable.from_events(EVENTS)
+    moments = np.array([_at(-1), _at(10), _at(30), _at(45), _at(110), _at(200)], dtype='datetime64[us]')
+    # a stay ending at a moment no longer counts at that moment
+    assert table.occupancy_at(moments).tolist() == [0, 2, 1, 2, 3, 1]
+    # first reached when chair 1 is taken again
+    assert table.peak_occupancy() == (3, _at(60))
+    hours, occupied = table.occupancy_per_hour()
+    assert hours.tolist() == [datetime(2024, 3, 1, h) for h in (8, 9, 10)]
+    assert occupied.tolist() == [1, 3, 3]
+
+
+def test_percentiles():
+    table = StayTable.from_events(EVENTS)
+    percentiles = table.stay_percentiles((0, 50, 100))
+    assert percentiles == {0: timedelta(minutes=30), 50: timedelta(minutes=60), 100: timedelta(minutes=90)}
+
+
+def test_empty_history():
+    table = StayTable.from_events([])
+    assert len(table) == 0
+    assert table.average_stay() is None
+    assert table.stay_percentiles() == {}
+    assert table.peak_occupancy() == (0, None)
+    assert table.turnover_per_chair() == {}
+    assert len(table.occupancy_per_hour()[0]) == 0
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from cozy.model.binary import BinaryFormatError, dump_event_log, load_event_log, dump_site, load_site
+from cozy.model.models import Client
+from tests.sites import open_site, seat, free
+
+
+def test_event_log_round_trip(tmp_path):
+    controller = open_site(tmp_path / 'site', locking=False)
+    seat(controller, 0, 'Zoé Tremblay')
+    seat(controller, 1, '')
+    free(controller, 0)
+    controller.add_client('walk in')
+    controller.resize(30)
+    chair = controller.site.chairs[2]
+    chair.take(Client(name='aware'), since=datetime.now(timezone(timedelta(hours=-4))))
+    controller.occupy_chair(chair)
+    event_log = controller.event_log
+    event_log.final_site_state = controller.site.model_copy(deep=True)
+
+    loaded = load_event_log(dump_event_log(event_log))
+    assert [e.model_dump() for e in loaded.events] == [e.model_dump() for e in event_log.events]
+    assert loaded.initial_site_state == event_log.initial_site_state
+    assert loaded.final_site_state.model_dump() == event_log.final_site_state.model_dump()
+    controller.close()
+
+
+def test_site_round_trip(tmp_path):
+    controller = open_site(tmp_path / 'site', locking=False)
+    seat(controller, 3, 'zoe')
+    assert load_site(dump_site(controller.site)).model_dump() == controller.site.model_dump()
+    controller.close()
+
+
+def test_rejects_other_content(tmp_path):
+    controller = open_site(tmp_path / 'site', locking=False)
+    data = dump_site(controller.site)
+    controller.close()
+    with pytest.raises(BinaryFormatError):
+        load_event_log(data)
+    with pytest.raises(BinaryFormatError):
+        load_site(b'not cozy')
+    with pytest.raises(BinaryFormatError):
+        load_site(data[:-3])
+
+
+def test_keeps_utc_offsets_to_the_second(tmp_path):
+    controller = open_site(tmp_path / 'site', locking=False)
+    chair = controller.site.chairs[0]
+    # a local mean time offset, as old tz database entries have
+    chair.take(Client(name='zoe'), since=datetime(1890, 5, 1, 9, tzinfo=timezone(timedelta(minutes=9, seconds=21))))
+    controller.occupy_chair(chair)
+    loaded = load_site(dump_site(controller.site))
+    assert loaded.chairs[0].since == chair.since
+    assert loaded.chairs[0].since.utcoffset() == timedelta(minutes=9, seconds=21)
+    controller.close()
+
+
+def test_rejects_strings_too_long_to_store(tmp_path):
+    controller = open_site(tmp_path / 'site', locking=False)
+    chair = controller.site.chairs[0]
+    chair.take(Client(name='x' * 65535))
+    with pytest.raises(BinaryFormatError):
+        dump_site(controller.site)
+    chair.release()
+    chair.take(Client(name='x' * 65534))
+    assert load_site(dump_site(controller.site)).chairs[0].occupant.name == chair.occupant.name
+    controller.close()
@@ -0,0 +1,55 @@
+from cozy.model.clients import ClientDirectory, PrefixTrie
+
+
+def _directory(*names: str, regulars: tuple[str, ...] = ()) -> ClientDirectory:
+    directory = ClientDirectory()
+    for name in names:
+        directory.add(name)
+    for name in regulars:
+        directory.add(name, visit=True)
+    return directory
+
+
+def _names(entries) -> list[str]:
+    return [e.name for e in entries]
+
+
+def test_trie_completes_shortest_words_first():
+    trie = PrefixTrie()
+    for client_id, word in enumerate(['joanna', 'jo', 'jonas', 'joe', 'bob'], start=1):
+        trie.add(word, client_id)
+    assert trie.complete('jo', lambda i: True, 10) == [2, 4, 3, 1]
+    assert trie.complete('jo', lambda i: True, 2) == [2, 4]
+    assert trie.complete('jo', lambda i: i != 2, 2) == [4, 3]
+    trie.remove('joe', 4)
+    assert trie.complete('jo', lambda i: True, 10) == [2, 3, 1]
+    assert trie.complete('x', lambda i: True, 10) == []
+
+
+def test_completes_any_word_ignoring_case_and_accents():
+    directory = _directory('John Smith', 'Jeanne Marie', 'Marie Jean', 'Émile Zola', regulars=('Marie Curie',))
+    assert _names(directory.complete('smi')) == ['John Smith']
+    assert _names(directory.complete('emi')) == ['Émile Zola']
+    # the regular comes first, then by name
+    assert _names(directory.complete('MARIE')) == ['Marie Curie', 'Jeanne Marie', 'Marie Jean']
+    # every word typed must start a word of the name
+    assert _names(directory.complete('mar jea')) == ['Jeanne Marie', 'Marie Jean']
+    assert _names(directory.complete('arie jea')) == []
+    assert directory.complete('  ') == []
+
+
+def test_search_tolerates_typos():
+    directory = _directory('Jean Dupont', 'Jeanne Dupond', 'Paul Martin')
+    assert _names(directory.search('jean dupnot'))[0] == 'Jean Dupont'
+    assert 'Paul Martin' not in _names(directory.search('jean dupnot'))
+    assert _names(directory.search('pual martin')) == ['Paul Martin']
+    assert directory.search('zzzz') == []
+
+
+def test_suggest_tops_up_prefix_matches_with_close_spellings():
+    directory = _directory('Jean Dupont', 'Jeanne Dupond', 'Paul Martin')
+    assert _names(directory.suggest('dupon')) == ['Jean Dupont', 'Jeanne Dupond']
+    assert _names(directory.suggest('jean dupnot', limit=1)) == ['Jean Dupont']
+    directory.remove('jean dupont')
+    assert 'Jean Dupont' not in _names(directory.suggest('dupon'))
+    assert 'jean dupont' not in directory
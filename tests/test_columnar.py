@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from cozy.model.columnar import ChairColumns
+from cozy.model.models import Client, DoubleOccupancyError, Site
+
+
+def _site() -> Site:
+    site = Site(capacity=5, name='cozy', staff=[], chairs=[])
+    site.occupy(2, Client(name='zoe'), datetime(2024, 3, 1, 8))
+    site.occupy(4, Client(name='yan'), datetime(2024, 3, 1, 15))
+    site.occupy(5, Client(name='zoe'), datetime(2024, 3, 1, 16))
+    return site
+
+
+def test_round_trips_a_site():
+    site = _site()
+    columns = ChairColumns.from_site(site)
+    assert len(columns) == 5 and columns.busy_count == 3
+    assert columns.names == ['zoe', 'yan']
+    assert columns.chair(2) == site.chairs[1]
+    assert columns.to_site('cozy').chairs == site.chairs
+    assert ChairColumns.from_dict(columns.to_dict()).to_chairs() == site.chairs
+
+
+def test_bulk_queries():
+    columns = ChairColumns.from_site(_site())
+    assert columns.free_chair_ids().tolist() == [1, 3]
+    long_stays = columns.occupied_longer_than(timedelta(hours=8), now=datetime(2024, 3, 1, 20))
+    assert long_stays.tolist() == [2]
+    assert columns.occupant_names([2, 3, 4]) == ['zoe', '', 'yan']
+
+
+def test_take_release_and_resize():
+    columns = ChairColumns(3)
+    columns.take(3, Client(name='zoe'), datetime(2024, 3, 1, 8))
+    with pytest.raises(DoubleOccupancyError):
+        columns.take(3, Client(name='yan'))
+    with pytest.raises(ValueError):
+        columns.resize(2)
+    columns.resize(6)
+    assert len(columns) == 6 and columns.chair(3).occupant.name == 'zoe'
+    columns.release(3)
+    columns.resize(2)
+    assert columns.free_chair_ids().tolist() == [1, 2]
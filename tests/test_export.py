@@ -0,0 +1,72 @@
+import csv
+from datetime import datetime, timedelta
+
+import pytest
+
+from cozy.model.export import export_stays, read_stay_columns
+from cozy.model.journal import EventJournal
+from cozy.model.models import EventLog, ChairTakeEvent, ChairLeaveEvent, Chair, Client, Staff, save_event_log
+
+NAMES = ('zoe', 'Yan "the second"', 'line one\nline two', 'Chloé, Roy')
+
+
+def _archives(folder, days: int = 3, per_day: int = 60):
+    # chair events split over several archives, stays start in one archive and end in a later one
+    ann = Staff(name='ann')
+    when = datetime(2024, 3, 1)
+    occupied: set[int] = set()
+    archives = []
+    for day in range(days):
+        log = EventLog(initial_site_state=None)
+        for i in range(per_day):
+            when += timedelta(minutes=7)
+            chair_id = (i * 5 + day) % 6 + 1
+            if chair_id in occupied:
+                occupied.discard(chair_id)
+                log.append(ChairLeaveEvent(when=when, by=ann, chair=Chair(id=chair_id, occupant=None, since=None)))
+            else:
+                occupied.add(chair_id)
+                client = Client(name=NAMES[(i + day) % len(NAMES)])
+                log.append(ChairTakeEvent(when=when, by=ann, chair=Chair(id=chair_id, occupant=client, since=when)))
+        # journals and saved event logs mixed, both are archives
+        if day % 2:
+            archive = folder / f'day{day}.json'
+            save_event_log(log, archive)
+        else:
+            archive = folder / f'day{day}.jsonl'
+            EventJournal(archive).start_from(log)
+        archives.append(archive)
+    return archives
+
+
+def _rows(path):
+    with path.open(newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    return rows[0], sorted(rows[1:])
+
+
+def test_parallel_csv_export_matches_sequential(tmp_path):
+    archives = _archives(tmp_path)
+    sequential = export_stays(archives, tmp_path / 'sequential.csv', chunk_size=7)
+    parallel = export_stays(archives, tmp_path / 'parallel.csv', chunk_size=7, workers=2)
+    assert parallel == sequential
+    header, rows = _rows(tmp_path / 'parallel.csv')
+    assert (header, rows) == _rows(tmp_path / 'sequential.csv')
+    assert len(rows) == sequential
+    assert 'line one\nline two' in {row[1] for row in rows}
+
+
+def test_parallel_column_export_matches_sequential(tmp_path):
+    np = pytest.importorskip('numpy')
+    archives = _archives(tmp_path)
+    sequential = export_stays(archives, tmp_path / 'sequential', format='columns', chunk_size=7)
+    parallel = export_stays(archives, tmp_path / 'parallel', format='columns', chunk_size=7, workers=2)
+    assert parallel == sequential
+
+    def stays(path):
+        columns, names = read_stay_columns(path)
+        name = lambda code: names[code] if code >= 0 else None
+        return sorted(zip(columns['chair_id'].tolist(), map(name, columns['client'].tolist()), columns['start'].tolist(),
+                          np.isnat(columns['end']).tolist(), columns['end'].tolist(), map(name, columns['freed_by'].tolist())), key=repr)
+
+    assert stays(tmp_path / 'parallel') == stays(tmp_path / 'sequential')
@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from cozy.model.api import SiteController
+from cozy.model.clients import ClientDirectory
+from cozy.model.history import EventIndex, EventQuery, between, by_staff, chair, client, of_type, run_query
+from cozy.model.models import (EventLog, Event, ChairTakeEvent, ChairLeaveEvent, ClientAddEvent, Chair, Client, Staff)
+from cozy.model.persistence import DirectWriter
+from tests.sites import open_site, seat, free
+
+START = datetime(2024, 3, 1, 20)
+
+
+def _log() -> EventLog:
+    # ann and bob take turns over three chairs through the night, a walk in is registered on the way
+    log = EventLog(initial_site_state=None)
+    seated: dict[int, str] = {}
+    for i in range(40):
+        when = START + timedelta(minutes=17 * i)
+        staff = Staff(name='ann' if i % 3 else 'bob')
+        chair_id = i % 3 + 1
+        if chair_id in seated:
+            seated.pop(chair_id)
+            log.append(ChairLeaveEvent(when=when, by=staff, chair=Chair(id=chair_id, occupant=None, since=None)))
+        else:
+            seated[chair_id] = name = f'Client {i % 4}'
+            log.append(ChairTakeEvent(when=when, by=staff, chair=Chair(id=chair_id, occupant=Client(name=name), since=when)))
+        if i == 20:
+            log.append(ClientAddEvent(when=when, by=staff, who=Client(name='Walk In')))
+    return log
+
+
+def _seated_on(log: EventLog, event: Event) -> str | None:
+    # who sat on the chair of a chair event, leave events included
+    if isinstance(event, ChairTakeEvent):
+        return event.chair.occupant.name
+    take = [e for e in log.events[:log.events.index(event)] if isinstance(e, ChairTakeEvent) and e.chair.id == event.chair.id]
+    return take[-1].chair.occupant.name
+
+
+def test_queries_match_a_plain_filter():
+    log = _log()
+    night = (START + timedelta(hours=2), START + timedelta(hours=6))
+    expected = {
+        by_staff('bob'): [e for e in log.events if e.by.name == 'bob'],
+        chair(2): [e for e in log.events if isinstance(e, (ChairTakeEvent, ChairLeaveEvent)) and e.chair.id == 2],
+        client('CLIENT 1'): [e for e in log.events if isinstance(e, (ChairTakeEvent, ChairLeaveEvent)) and _seated_on(log, e) == 'Client 1'],
+        client('walk in'): [e for e in log.events if isinstance(e, ClientAddEvent)],
+        of_type(ChairLeaveEvent): [e for e in log.events if isinstance(e, ChairLeaveEvent)],
+        between(*night): [e for e in log.events if night[0] <= e.when < night[1]],
+        between(end=START + timedelta(hours=1)): [e for e in log.events if e.when < START + timedelta(hours=1)],
+    }
+    for query, events in expected.items():
+        assert events and log.query(query) == events
+
+
+def test_combinators():
+    log = _log()
+    night = between(START + timedelta(hours=2), START + timedelta(hours=6))
+    assert log.query(by_staff('ann') & night & chair(3)) == [e for e in log.query(night) if e.by.name == 'ann' and e in log.query(chair(3))]
+    either = log.query(chair(1) | by_staff('bob'))
+    assert either == [e for e in log.events if e in log.query(chair(1)) or e.by.name == 'bob']
+    # overlapping parts of an | give each event once
+    assert log.query(chair(1) | chair(1)) == log.query(chair(1))
+    assert log.query(by_staff('nobody') & chair(1)) == []
+    assert log.query((chair(1) | chair(2)) & of_type(ChairTakeEvent)) == [e for e in log.events if isinstance(e, ChairTakeEvent) and e.chair.id < 3]
+
+
+def test_queries_must_say_how_they_match():
+    class Partial(EventQuery):
+        def estimate(self, index: EventIndex) -> int:
+            return 0
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_index_follows_appended_events():
+    log = _log()
+    assert log.query(chair(1))
+    log.append(ChairTakeEvent(when=START, by=Staff(name='cid'), chair=Chair(id=9, occupant=Client(name='late'), since=START)))
+    assert log.query(by_staff('cid') & chair(9)) == log.events[-1:]
+    assert log.index.state() == EventIndex.build(log).state()
+
+
+def _fill(controller: SiteController, rounds: int) -> None:
+    for i in range(rounds):
+        if controller.site.chairs[i % 10].is_occupied:
+            free(controller, i % 10)
+        else:
+            seat(controller, i % 10, f'client {i}')
+
+
+def test_saved_indexes_grow_with_each_checkpoint(tmp_path):
+    home = tmp_path / 'site'
+    controller = open_site(home, checkpoint_interval=4)
+    # both built now, every checkpoint from here on appends what changed to their files
+    controller.clients
+    controller.query(client('nobody'))
+    for i in range(15):
+        controller.add_client(f'walk in {i}')
+        if i % 4 == 0:
+            controller.remove_client(f'walk in {i}')
+    _fill(controller, 25)
+    controller.close()
+    assert len((home / 'event_index.json').read_bytes().splitlines()) > 1
+    assert len((home / 'clients.json').read_bytes().splitlines()) > 1
+
+    reopened = SiteController(home, writer=DirectWriter())
+    rebuilt = EventIndex.build(reopened.event_log)
+    assert reopened.event_log.index.state() == rebuilt.state()
+    assert [e.id for e in reopened.query(client('client 3'))] == [e.id for e in run_query(rebuilt, reopened.event_log.events, client('client 3'))]
+    assert sorted(e.name for e in reopened.clients.complete('walk in', limit=100)) == sorted(f'walk in {i}' for i in range(15) if i % 4)
+    assert reopened.clients.state() == ClientDirectory.load(tmp_path / 'missing.json', reopened.journal).state()
+    reopened.close()
@@ -0,0 +1,70 @@
+import pytest
+
+from cozy.model.api import SiteController
+from cozy.model.journal import EventJournal, JournalCorruptedError
+from cozy.model.persistence import DirectWriter
+from tests.sites import open_site, seat, free
+
+
+def test_mutations_append_to_the_journal(tmp_path):
+    home = tmp_path / 'site'
+    controller = open_site(home, locking=False)
+    journal = home / 'journal.jsonl'
+    sizes = [journal.stat().st_size]
+    seat(controller, 0, 'zoe')
+    sizes.append(journal.stat().st_size)
+    written = journal.read_bytes()
+    free(controller, 0)
+    sizes.append(journal.stat().st_size)
+    controller.close()
+    assert sizes == sorted(set(sizes))
+
+    # what was written before is left untouched
+    assert journal.read_bytes().startswith(written)
+    # the header, the staff added and both chair events
+    assert len(journal.read_bytes().splitlines()) == 4
+
+
+def test_journal_offsets_point_past_each_record(tmp_path):
+    home = tmp_path / 'site'
+    controller = open_site(home, locking=False)
+    for i in range(5):
+        seat(controller, i, f'client {i}')
+    controller.close()
+
+    journal = EventJournal(home / 'journal.jsonl')
+    offsets = [offset for offset, _ in journal.events()]
+    assert offsets[-1] == (home / 'journal.jsonl').stat().st_size
+    # reading from any offset gives the events after it
+    tail = [event.id for _, event in journal.events(offsets[2])]
+    assert tail == [event.id for _, event in list(journal.events())[3:]]
+
+
+def test_torn_tail_is_ignored_then_dropped(tmp_path):
+    home = tmp_path / 'site'
+    controller = open_site(home, locking=False)
+    seat(controller, 0, 'zoe')
+    state = controller.site.model_dump()
+    controller.close()
+    with (home / 'journal.jsonl').open('ab') as f:
+        f.write(b'{"type":"ChairTakeEvent","data":{"id":')
+
+    reopened = SiteController(home, writer=DirectWriter(), locking=False)
+    assert reopened.site.model_dump() == state
+    reopened.active_staff = 'ann'
+    seat(reopened, 1, 'yan')
+    state = reopened.site.model_dump()
+    reopened.close()
+
+    again = SiteController(home, writer=DirectWriter(), locking=False)
+    assert again.site.model_dump() == state
+    again.close()
+
+
+def test_unreadable_record_is_reported(tmp_path):
+    home = tmp_path / 'site'
+    open_site(home, locking=False).close()
+    with (home / 'journal.jsonl').open('ab') as f:
+        f.write(b'{"type":"NoSuchEvent","data":{}}\n')
+    with pytest.raises(JournalCorruptedError):
+        list(EventJournal(home / 'journal.jsonl').events())
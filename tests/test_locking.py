@@ -0,0 +1,83 @@
+import pytest
+
+from cozy.model import api
+from cozy.model.locking import SiteVersionConflictError, read_version, write_version
+from tests.sites import open_site, seat
+
+
+def test_second_controller_conflicts_then_reloads(tmp_path):
+    home = tmp_path / 'site'
+    first = open_site(home)
+    second = open_site(home)
+    assert second.reload_if_changed() is False
+
+    seat(first, 0, 'zoe')
+    # the second one still believes chair 0 is free
+    with pytest.raises(SiteVersionConflictError):
+        seat(second, 0, 'yan')
+
+    assert second.reload_if_changed() is True
+    assert second.site.chairs[0].occupant.name == 'zoe'
+    assert second.version == first.version == read_version(home / 'version')
+
+    seat(second, 1, 'yan')
+    assert first.reload_if_changed() is True
+    assert first.site.chairs[1].occupant.name == 'yan'
+    assert first.site.model_dump() == second.site.model_dump()
+    first.close()
+    second.close()
+
+
+def test_reload_brings_the_event_log_up_to_date(tmp_path):
+    home = tmp_path / 'site'
+    first = open_site(home)
+    second = open_site(home)
+    assert len(second.event_log) == len(first.event_log)
+    seat(first, 0, 'zoe')
+    second.reload_if_changed()
+    assert [e.id for e in second.event_log.events] == [e.id for e in first.event_log.events]
+    first.close()
+    second.close()
+
+
+def test_unlocked_controller_cannot_open_a_slim_journal(tmp_path):
+    home = tmp_path / 'site'
+    open_site(home).close()
+    with pytest.raises(ValueError):
+        open_site(home, locking=False)
+
+
+def test_version_left_behind_by_a_crash_is_repaired(tmp_path):
+    home = tmp_path / 'site'
+    controller = open_site(home)
+    seat(controller, 0, 'zoe')
+    controller.close()
+    # the journal got the event but the process died before writing the version
+    write_version(home / 'version', read_version(home / 'version') - 1)
+
+    reopened = open_site(home)
+    assert read_version(home / 'version') == reopened.version
+    seat(reopened, 1, 'yan')
+    reopened.close()
+
+
+def test_failed_version_write_is_recovered_by_reload(tmp_path, monkeypatch):
+    home = tmp_path / 'site'
+    controller = open_site(home)
+
+    def fail(path, version):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(api, 'write_version', fail)
+        with pytest.raises(OSError):
+            seat(controller, 0, 'zoe')
+    with pytest.raises(SiteVersionConflictError):
+        seat(controller, 1, 'yan')
+    assert controller.reload_if_changed() is True
+    # the event made it to the journal, the site and the version now agree with it
+    assert controller.site.chairs[0].occupant.name == 'zoe'
+    assert read_version(home / 'version') == controller.version
+    seat(controller, 1, 'yan')
+    assert controller.reload_if_changed() is False
+    controller.close()
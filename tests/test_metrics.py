@@ -0,0 +1,89 @@
+import re
+
+import pytest
+
+from cozy.model.metrics import Histogram, PrometheusFileExporter, SiteMetrics, instrumented
+from tests.sites import open_site, seat, free
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram(buckets=(0.1, 1.0, 10.0))
+    assert histogram.quantile(0.5) is None
+    for value in (0.05, 0.1, 0.5, 0.7, 3.0, 20.0):
+        histogram.observe(value)
+    # bounds are inclusive
+    assert histogram.counts == [2, 2, 1, 1]
+    assert histogram.count == 6 and histogram.sum == pytest.approx(24.35)
+    assert histogram.quantile(0.3) == 0.1
+    assert histogram.quantile(0.5) == 1.0
+    assert histogram.quantile(0.99) == float('inf')
+    assert histogram.to_dict()['buckets'] == {'0.1': 2, '1.0': 2, '10.0': 1, '+Inf': 1}
+
+
+class _Timed:
+    def __init__(self, metrics: SiteMetrics | None) -> None:
+        self.metrics = metrics
+
+    @instrumented('work')
+    def work(self, fail: bool = False) -> str:
+        if fail:
+            raise ValueError('failed')
+        return 'done'
+
+
+def test_instrumented_times_calls_and_failures():
+    metrics = SiteMetrics()
+    timed = _Timed(metrics)
+    assert timed.work() == 'done'
+    with pytest.raises(ValueError):
+        timed.work(fail=True)
+    assert metrics.latency['work'].count == 2
+    assert _Timed(None).work() == 'done'
+    assert _Timed.work.__name__ == 'work'
+
+
+def test_controller_metrics(tmp_path):
+    metrics = SiteMetrics()
+    controller = open_site(tmp_path / 'site', metrics=metrics)
+    seat(controller, 0, 'zoe')
+    free(controller, 0)
+    controller.close()
+    snapshot = metrics.snapshot()
+    assert snapshot['events'] == {'StaffAddEvent': 1, 'ChairTakeEvent': 1, 'ChairLeaveEvent': 1}
+    assert snapshot['log_length'] == {str(controller.home): 3}
+    assert snapshot['bytes_written']['journal'] > 0
+    assert snapshot['latency']['open']['count'] == snapshot['latency']['occupy_chair']['count'] == 1
+
+
+def _samples(text: str) -> dict[str, float]:
+    samples = {}
+    for line in text.splitlines():
+        if not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_prometheus_export(tmp_path):
+    metrics = SiteMetrics()
+    for seconds in (0.0002, 0.002, 0.002, 7.0):
+        metrics.observe('occupy', seconds)
+    metrics.wrote('journal', 120)
+    metrics.recorded('C:\\sites\\"north"', ['ChairTakeEvent'], 12)
+    text = metrics.to_prometheus()
+    for line in text.splitlines():
+        assert line.startswith('# ') or re.fullmatch(r'cozy_\w+\{\w+="(?:[^"\\]|\\.)*"(?:,le="[^"]+")?\} [0-9.e+-]+', line), line
+    samples = _samples(text)
+    # buckets are cumulative and end with every observation
+    assert samples['cozy_operation_seconds_bucket{operation="occupy",le="0.00025"}'] == 1
+    assert samples['cozy_operation_seconds_bucket{operation="occupy",le="0.0025"}'] == 3
+    assert samples['cozy_operation_seconds_bucket{operation="occupy",le="+Inf"}'] == 4
+    assert samples['cozy_operation_seconds_count{operation="occupy"}'] == 4
+    assert samples['cozy_bytes_written_total{target="journal"}'] == 120
+    assert samples['cozy_events_total{type="ChairTakeEvent"}'] == 1
+    assert samples['cozy_event_log_length{site="C:\\\\sites\\\\\\"north\\""}'] == 12
+
+    exporter = PrometheusFileExporter(metrics, tmp_path / 'cozy.prom', interval=60).start()
+    metrics.observe('free', 0.001)
+    exporter.stop()
+    assert (tmp_path / 'cozy.prom').read_text() == metrics.to_prometheus()
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from cozy.model.api import SiteController
+from cozy.model.locking import FileLock, SiteVersionConflictError, read_version
+from cozy.model.persistence import WriteBehindWriter, DirectWriter
+from tests.sites import seat
+
+
+class FlakyFile:
+    # an append target failing the first `failures` writes
+    def __init__(self, failures: int) -> None:
+        self.failures = failures
+        self.data = b''
+        self.writer_threads: set[str] = set()
+
+    def write(self, data: bytes) -> int:
+        self.writer_threads.add(threading.current_thread().name)
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        self.data += data
+        return len(self.data)
+
+    def sync(self) -> None:
+        pass
+
+
+class FailingTarget:
+    def __init__(self) -> None:
+        self.events = []
+
+    def commit(self, events, sync):
+        self.events.append(events)
+        raise OSError("disk full")
+
+    def sync(self):
+        pass
+
+
+def _open(home, writer):
+    controller = SiteController(home, writer=writer)
+    controller.add_staff('ann')
+    controller.active_staff = 'ann'
+    return controller
+
+
+def test_locked_commits_do_not_wait_for_the_lock(tmp_path):
+    home = tmp_path / 'site'
+    writer = WriteBehindWriter(debounce=0.01)
+    controller = _open(home, writer)
+    controller.flush()
+    # another process holds the site lock, the caller goes on and the writer waits for it
+    with FileLock(home / '.lock'):
+        started = time.monotonic()
+        seat(controller, 0, 'zoe')
+        seat(controller, 1, 'yan')
+        assert time.monotonic() - started < 0.5
+        time.sleep(0.1)
+        assert read_version(home / 'version') == 1
+    controller.flush()
+    other = SiteController(home, writer=DirectWriter())
+    assert [c.occupant.name for c in other.site.chairs[:2]] == ['zoe', 'yan']
+    assert other.version == controller.version == 3
+    other.close()
+    controller.close()
+    writer.close()
+
+
+def test_conflict_found_by_the_writer_fails_every_later_call(tmp_path):
+    home = tmp_path / 'site'
+    writer = WriteBehindWriter(debounce=0.01)
+    first = _open(home, writer)
+    first.flush()
+    second = _open(home, writer)
+    seat(first, 0, 'zoe')
+    first.flush()
+    # the second one does not know about chair 0 yet, its commit is refused on the writer's thread
+    seat(second, 1, 'yan')
+    with pytest.raises(SiteVersionConflictError):
+        second.flush()
+    with pytest.raises(SiteVersionConflictError):
+        seat(second, 2, 'ann')
+    with pytest.raises(SiteVersionConflictError):
+        second.save_site()
+
+    assert second.reload_if_changed() is True
+    assert second.site.chairs[0].occupant.name == 'zoe'
+    assert not second.site.chairs[1].is_occupied
+    seat(second, 1, 'yan')
+    second.flush()
+    first.reload_if_changed()
+    assert first.site.model_dump() == second.site.model_dump()
+    first.close()
+    second.close()
+    writer.close()
+
+
+def test_failed_appends_are_kept_and_retried(tmp_path):
+    writer = WriteBehindWriter(debounce=0.0, retry_interval=0.05)
+    target = FlakyFile(failures=2)
+    writer.append(target, b'one\n')
+    with pytest.raises(OSError):
+        writer.flush()
+    writer.append(target, b'two\n')
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            writer.flush()
+            break
+        except OSError:
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+    assert target.data == b'one\ntwo\n'
+    assert target.writer_threads == {'cozy-write-behind'}
+    writer.close()
+
+
+def test_failed_commit_is_left_to_its_target(tmp_path):
+    writer = WriteBehindWriter(debounce=0.0)
+    target = FailingTarget()
+    writer.commit(target, ['event'])
+    # not retried and not raised to whoever flushes next, the target knows it failed
+    writer.flush()
+    writer.flush()
+    assert target.events == [['event']]
+    writer.close()
@@ -0,0 +1,58 @@
+import pytest
+
+from cozy.model.api import SiteClosedError
+from cozy.model.pool import SitePool
+from tests.sites import seat
+
+
+def _staffed(pool: SitePool, site: str):
+    controller = pool.get(site)
+    if not controller.site.has_staff('ann'):
+        controller.add_staff('ann')
+    controller.active_staff = 'ann'
+    return controller
+
+
+def test_least_recently_used_sites_are_dropped(tmp_path):
+    pool = SitePool(tmp_path, max_resident=2)
+    first = _staffed(pool, 'a')
+    seat(first, 0, 'zoe')
+    pool.get('b')
+    assert pool.get('a') is first
+    pool.get('c')
+    assert pool.resident == [tmp_path / 'a', tmp_path / 'c'] and 'b' not in pool
+    pool.get('d')
+    assert len(pool) == 2 and 'a' not in pool
+    # the dropped controller refuses writes, the site comes back from disk as it was left
+    with pytest.raises(SiteClosedError):
+        seat(first, 1, 'yan')
+    again = pool.get(tmp_path / 'a')
+    assert again is not first
+    assert again.site.chairs[0].occupant.name == 'zoe' and not again.site.chairs[1].is_occupied
+    pool.close()
+
+
+def test_chair_budget(tmp_path):
+    pool = SitePool(tmp_path, chair_budget=50)
+    big = _staffed(pool, 'big')
+    big.resize(45)
+    pool.get('small')
+    assert 'big' not in pool and pool.resident == [tmp_path / 'small']
+    # a single site over the budget stays loaded
+    _staffed(pool, 'big').resize(80)
+    assert pool.resident == [tmp_path / 'big']
+    assert pool.get('big').site.capacity == 80
+    pool.close()
+
+
+def test_sites_share_staff_and_evict_on_demand(tmp_path):
+    pool = SitePool(tmp_path)
+    a, b = _staffed(pool, 'a'), _staffed(pool, 'b')
+    assert a.active_staff is b.active_staff
+    seat(b, 2, 'zoe')
+    pool.evict('b')
+    pool.evict('missing')
+    assert pool.resident == [tmp_path / 'a']
+    assert pool.get('b').site.chairs[2].occupant.name == 'zoe'
+    pool.close()
+    assert len(pool) == 0
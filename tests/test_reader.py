@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from cozy.model import binary, reader
+from cozy.model.journal import EventJournal
+from cozy.model.models import (EventLog, ChairTakeEvent, ChairLeaveEvent, StaffAddEvent, Chair, Client, Site, Staff,
+                               save_event_log)
+from cozy.model.reader import EventStream, read_events
+
+START = datetime(2024, 3, 1, 8)
+
+
+def _log() -> EventLog:
+    # chairs 1 and 2 taken then freed, a staff member added in between and one take recorded late, with an earlier when
+    ann = Staff(name='ann')
+    log = EventLog(initial_site_state=Site(capacity=3, name='cozy', staff=[ann], chairs=[]))
+    for minutes, chair_id, name in ((0, 1, 'zoe'), (10, 2, 'yan'), (20, 1, None), (30, 2, None), (5, 3, 'léa "x"')):
+        when = START + timedelta(minutes=minutes)
+        if name is None:
+            log.append(ChairLeaveEvent(when=when, by=ann, chair=Chair(id=chair_id, occupant=None, since=None)))
+        else:
+            log.append(ChairTakeEvent(when=when, by=ann, chair=Chair(id=chair_id, occupant=Client(name=name), since=when)))
+        if minutes == 10:
+            log.append(StaffAddEvent(when=when, by=ann, who=Staff(name='bob')))
+    return log
+
+
+@pytest.fixture(params=['json', 'journal', 'binary'])
+def archive(request, tmp_path, monkeypatch):
+    log = _log()
+    path = tmp_path / f'log.{request.param}'
+    if request.param == 'json':
+        save_event_log(log, path)
+        # tiny chunks so values and numbers are cut at every possible place
+        monkeypatch.setattr(reader._JsonScanner, 'CHUNK_SIZE', 7)
+    elif request.param == 'journal':
+        EventJournal(path).start_from(log)
+    else:
+        path.write_bytes(binary.dump_event_log(log))
+    return path, log
+
+
+def test_reads_every_event_in_order(archive):
+    path, log = archive
+    assert list(EventStream(path)) == log.events
+    assert EventStream(path).initial_site_state() == log.initial_site_state
+
+
+def test_filters_by_type_and_chair(archive):
+    path, log = archive
+    takes = list(read_events(path, types=[ChairTakeEvent]))
+    assert takes == [e for e in log.events if isinstance(e, ChairTakeEvent)]
+    assert [type(e) for e in read_events(path, chair_id=1)] == [ChairTakeEvent, ChairLeaveEvent]
+    assert list(read_events(path, types=[StaffAddEvent], chair_id=1)) == []
+    assert [e.who.name for e in read_events(path, types=[StaffAddEvent])] == ['bob']
+
+
+def test_time_window_checks_every_event(archive):
+    path, log = archive
+    until = START + timedelta(minutes=10)
+    window = list(read_events(path, since=START + timedelta(minutes=5), until=until))
+    assert [e.when for e in window] == [until, until, START + timedelta(minutes=5)]
+    # trusting the order stops at the first event past until and misses the late one
+    ordered = list(read_events(path, until=until, ordered=True))
+    assert ordered == log.events[:3]
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+from cozy.model.journal import EventJournal
+from cozy.model.models import EventLog, ChairTakeEvent, ChairLeaveEvent, SiteResizedEvent, StaffAddEvent, Chair, \
+    Client, Site, Staff
+from cozy.model.replay import SiteReplayer, apply_events
+
+START = datetime(2024, 3, 1, 8)
+
+
+def _log() -> EventLog:
+    ann = Staff(name='ann')
+    log = EventLog(initial_site_state=Site(capacity=4, name='cozy', staff=[ann], chairs=[]))
+    seated: set[int] = set()
+    for i in range(23):
+        when = START + timedelta(minutes=10 * i)
+        if i == 9:
+            log.append(SiteResizedEvent(when=when, by=ann, capacity=6))
+        elif i == 15:
+            log.append(StaffAddEvent(when=when, by=ann, who=Staff(name='bob')))
+        elif (chair_id := i % 5 + 1) in seated:
+            seated.discard(chair_id)
+            log.append(ChairLeaveEvent(when=when, by=ann, chair=Chair(id=chair_id, occupant=None, since=None)))
+        elif chair_id <= (4 if i < 9 else 6):
+            seated.add(chair_id)
+            log.append(ChairTakeEvent(when=when, by=ann, chair=Chair(id=chair_id, occupant=Client(name=f'client {i}'), since=when)))
+    return log
+
+
+def _replayed(log: EventLog, count: int) -> Site:
+    return apply_events(log.initial_site_state.model_copy(deep=True), log.events[:count])
+
+
+def test_state_after_every_event_matches_a_full_replay():
+    log = _log()
+    replayer = SiteReplayer.from_event_log(log, stride=4)
+    assert len(replayer) == len(log.events)
+    for count in range(len(log.events) + 1):
+        assert replayer.state_after(count) == _replayed(log, count)
+    assert replayer.site == _replayed(log, len(log.events))
+    # out of range counts are clamped
+    assert replayer.state_after(-3) == log.initial_site_state
+    assert replayer.state_after(1000) == replayer.site
+
+
+def test_state_at_includes_events_up_to_the_moment():
+    log = _log()
+    replayer = SiteReplayer.from_event_log(log, stride=4)
+    for count, event in enumerate(log.events, start=1):
+        assert replayer.state_at(event.when) == _replayed(log, count)
+        assert replayer.state_at(event.when - timedelta(seconds=1)) == _replayed(log, count - 1)
+    assert replayer.state_at(START - timedelta(days=1)) == log.initial_site_state
+    take = next(e for e in log.events if isinstance(e, ChairTakeEvent))
+    assert replayer.chair_at(take.chair.id, take.when).occupant == take.chair.occupant
+
+
+def test_replays_a_journal(tmp_path):
+    log = _log()
+    journal = EventJournal(tmp_path / 'journal.jsonl')
+    journal.start_from(log)
+    replayer = SiteReplayer.from_journal(journal, stride=5)
+    assert replayer.state_after(12) == _replayed(log, 12)
+    assert replayer.site.capacity == 6 and replayer.site.has_staff('bob')
+
+
+def test_replayed_states_are_copies():
+    log = _log()
+    replayer = SiteReplayer.from_event_log(log, stride=4)
+    state = replayer.state_after(8)
+    state.chairs[0].release()
+    state.chairs[1].take(Client(name='intruder'))
+    assert replayer.state_after(8) == _replayed(log, 8)
@@ -0,0 +1,60 @@
+import pytest
+
+from cozy.model.api import SiteClosedError
+from cozy.model.models import SiteResizeBelowOccupancyException
+from tests.sites import open_site, seat
+
+
+def _occupants(controller):
+    return [c.occupant.name if c.occupant else None for c in controller.site.chairs]
+
+
+def test_shrinking_moves_occupants_down_in_order(tmp_path):
+    controller = open_site(tmp_path / 'site')
+    for index, name in ((0, 'a'), (6, 'b'), (8, 'c'), (20, 'd'), (22, 'e')):
+        seat(controller, index, name)
+    moves = controller.resize(10)
+    assert [(s.id, d.id) for s, d in moves] == [(21, 8), (23, 10)]
+    assert _occupants(controller) == ['a', None, None, None, None, None, 'b', 'd', 'c', 'e']
+    assert controller.site.capacity == len(controller.site.chairs) == 10
+    assert controller.site.next_free_chair().id == 2
+    controller.close()
+
+
+def test_resize_replays_to_the_same_site(tmp_path):
+    home = tmp_path / 'site'
+    controller = open_site(home, checkpoint_interval=1000)
+    for index in range(0, 24, 3):
+        seat(controller, index, f'client {index}')
+    controller.resize(12)
+    controller.resize(30)
+    seat(controller, 29, 'last')
+    state = controller.site.model_dump()
+    # no checkpoint, everything comes back from the journal
+    controller.journal.close()
+
+    reopened = open_site(home)
+    assert reopened.site.model_dump() == state
+    reopened.close()
+
+
+def test_impossible_resize_changes_nothing(tmp_path):
+    controller = open_site(tmp_path / 'site')
+    for index in range(5):
+        seat(controller, 20 + index, f'client {index}')
+    state = controller.site.model_dump()
+    with pytest.raises(SiteResizeBelowOccupancyException):
+        controller.resize(4)
+    assert controller.site.model_dump() == state
+    controller.close()
+
+
+def test_failed_commit_puts_the_site_back(tmp_path):
+    controller = open_site(tmp_path / 'site')
+    seat(controller, 20, 'zoe')
+    state = controller.site.model_dump()
+    controller.close()
+    with pytest.raises(SiteClosedError):
+        controller.resize(5)
+    assert controller.site.model_dump() == state
+    assert _occupants(controller)[20] == 'zoe'
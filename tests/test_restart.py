@@ -0,0 +1,72 @@
+from cozy.model.api import SiteController
+from cozy.model.journal import EventJournal
+from cozy.model.replay import apply_event
+from cozy.model.persistence import DirectWriter
+from tests.sites import open_site, seat, free
+
+
+def _fill(controller, rounds: int) -> None:
+    for i in range(rounds):
+        if controller.site.chairs[i % 10].is_occupied:
+            free(controller, i % 10)
+        else:
+            seat(controller, i % 10, f'client {i}')
+
+
+def _replayed(home):
+    # the site rebuilt from the journal alone, ignoring every checkpoint
+    journal = EventJournal(home / 'journal.jsonl')
+    site = journal.read_initial_site_state()
+    count = 0
+    for _, event in journal.events():
+        apply_event(site, event)
+        count += 1
+    journal.close()
+    return site, count
+
+
+def test_restart_from_checkpoint_matches_full_replay(tmp_path):
+    home = tmp_path / 'site'
+    controller = open_site(home, checkpoint_interval=7)
+    _fill(controller, 30)
+    state = controller.site.model_dump()
+    controller.close()
+    assert list((home / 'checkpoints').iterdir())
+
+    site, count = _replayed(home)
+    reopened = SiteController(home, writer=DirectWriter())
+    assert reopened.site.model_dump() == state
+    assert reopened.version == count
+    site.version = count
+    assert site.model_dump() == state
+    assert len(reopened.event_log) == count
+    reopened.close()
+
+
+def test_restart_replays_events_past_the_last_checkpoint(tmp_path):
+    home = tmp_path / 'site'
+    controller = open_site(home, checkpoint_interval=1000)
+    controller.save_site()
+    _fill(controller, 12)
+    state = controller.site.model_dump()
+    # the process goes away without checkpointing again
+    controller.journal.close()
+
+    reopened = SiteController(home, writer=DirectWriter())
+    assert reopened.site.model_dump() == state
+    reopened.close()
+
+
+def test_stale_checkpoints_are_ignored(tmp_path):
+    home = tmp_path / 'site'
+    controller = open_site(home, checkpoint_interval=5)
+    _fill(controller, 12)
+    state = controller.site.model_dump()
+    controller.close()
+    for checkpoint in (home / 'checkpoints').iterdir():
+        checkpoint.write_text('{"offset": 1', encoding='utf-8')
+
+    reopened = SiteController(home, writer=DirectWriter())
+    assert reopened.site.model_dump() == state
+    reopened.close()
+
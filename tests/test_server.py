@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+from cozy.client import RemoteSiteController, RemoteSiteError
+from cozy.model.api import SiteController
+from cozy.model.models import Chair, Client, Staff, StaffNotFoundError
+from cozy.model.persistence import DirectWriter
+from cozy.server import SiteService, make_server
+from tests.sites import open_site, seat
+
+
+@pytest.fixture
+def served(tmp_path):
+    # a cozy.server on a free loopback port, over a site with ann on staff
+    controller = open_site(tmp_path / 'site')
+    service = SiteService(controller, poll_interval=0.05).start()
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield service, f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+    service.stop()
+    controller.close()
+
+
+def _remote(url: str) -> RemoteSiteController:
+    remote = RemoteSiteController(url)
+    remote.active_staff = 'ann'
+    return remote
+
+
+def _take(remote: RemoteSiteController, chair_id: int, name: str) -> None:
+    remote.occupy_chair(Chair(id=chair_id, occupant=Client(name=name), since=None))
+
+
+def test_terminals_see_each_others_changes(served):
+    service, url = served
+    first, second = _remote(url), _remote(url)
+    _take(first, 1, 'zoe')
+    assert second.refresh() is True
+    assert second.site.chairs[0].occupant.name == 'zoe'
+    assert second.refresh() is False
+    second.free_chair(second.site.chairs[0])
+    first.refresh()
+    assert not first.site.chairs[0].is_occupied
+    assert first.version == second.version == service.version
+
+
+def test_refused_actions_get_their_status(served):
+    _, url = served
+    remote = _remote(url)
+    _take(remote, 1, 'zoe')
+    with pytest.raises(RemoteSiteError) as refused:
+        _take(remote, 1, 'yan')
+    assert refused.value.status == 409
+    remote.active_staff = Staff(name='nobody')
+    with pytest.raises(StaffNotFoundError):
+        _take(remote, 2, 'yan')
+    remote.active_staff = 'ann'
+    with pytest.raises(RemoteSiteError) as refused:
+        _take(remote, 999, 'yan')
+    assert refused.value.status == 400
+
+
+def test_changes_made_in_the_home_are_picked_up(served, tmp_path):
+    service, url = served
+    remote = _remote(url)
+    remote.refresh()
+    other = SiteController(tmp_path / 'site', writer=DirectWriter())
+    other.active_staff = 'ann'
+    seat(other, 4, 'walk in')
+    deadline = time.monotonic() + 5
+    while service.version != other.version:
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    assert remote.refresh() is True
+    assert remote.site.chairs[4].occupant.name == 'walk in'
+    # and the server writes after them rather than over them
+    _take(remote, 6, 'zoe')
+    assert other.reload_if_changed() is True
+    assert other.site.chairs[5].occupant.name == 'zoe'
+    other.close()
+
+
+def test_reads_do_not_wait_for_writes(served):
+    service, url = served
+    remote = _remote(url)
+    remote.refresh()
+    with service._write_lock:
+        # a mutation holds the lock, reads are still answered
+        started = time.monotonic()
+        assert remote.refresh() is False
+        assert time.monotonic() - started < 1
@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from cozy.model.session import StaffSessionManager
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _manager():
+    clock = _Clock()
+    wake_ups: list[float] = []
+    events: list[tuple[str, str]] = []
+    manager = StaffSessionManager(timedelta(seconds=5), timedelta(seconds=10), wake_up=wake_ups.append, clock=clock)
+    manager.on_started(lambda staff: events.append(('started', staff)))
+    manager.on_expired(lambda staff: events.append(('expired', staff)))
+    return manager, clock, wake_ups, events
+
+
+def test_session_winds_down_then_expires():
+    manager, clock, wake_ups, events = _manager()
+    assert not manager.is_active and manager.remaining() == 0.0
+    manager.start('ann')
+    assert events == [('started', 'ann')] and wake_ups == [15.0]
+    assert manager.deadline == 115.0 and manager.winding_down_at == 105.0
+    clock.now = 104.0
+    assert manager.remaining() == 1.0
+    clock.now = 110.0
+    assert manager.remaining() == 0.5
+    clock.now = 115.0
+    manager.check()
+    assert events[-1] == ('expired', 'ann') and not manager.is_active
+    assert manager.remaining() == 0.0 and manager.deadline is None
+
+
+def test_interactions_move_the_deadline_without_extra_timers():
+    manager, clock, wake_ups, events = _manager()
+    manager.start('ann')
+    clock.now = 110.0
+    manager.extend()
+    assert wake_ups == [15.0]
+    # the wake up asked for at start comes too early now, it schedules the next one
+    clock.now = 115.0
+    manager.check()
+    assert manager.is_active and wake_ups == [15.0, 10.0]
+    # selecting the same staff again is an interaction
+    clock.now = 118.0
+    manager.start('ann')
+    assert events == [('started', 'ann')] and manager.deadline == 133.0
+
+
+def test_switching_staff_expires_the_previous_session():
+    manager, clock, wake_ups, events = _manager()
+    manager.start('ann')
+    clock.now = 103.0
+    manager.start('bob')
+    assert events == [('started', 'ann'), ('expired', 'ann'), ('started', 'bob')]
+    assert manager.staff == 'bob' and manager.deadline == 118.0
+    manager.end()
+    manager.end()
+    manager.check()
+    manager.extend()
+    assert events[-1] == ('expired', 'bob') and len(events) == 4
+
+
+def test_works_without_a_timer():
+    clock = _Clock()
+    manager = StaffSessionManager(active_period=timedelta(0), clock=clock)
+    manager.start('ann')
+    assert manager.remaining() == 1.0
+    clock.now = 106.0
+    manager.check()
+    assert not manager.is_active
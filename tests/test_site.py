@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from cozy.model.models import Chair, Client, Site, Staff, StaffNotFoundError
+
+
+def _site(capacity: int = 8) -> Site:
+    return Site(capacity=capacity, name='cozy', staff=[], chairs=[])
+
+
+def _counted(site: Site) -> tuple[int, int, int | None]:
+    # what the indexes should say, from the chairs themselves
+    busy = sum(c.is_occupied for c in site.chairs)
+    first_free = next((c.id for c in site.chairs if not c.is_occupied), None)
+    return busy, len(site.chairs) - busy, first_free
+
+
+def _indexed(site: Site) -> tuple[int, int, int | None]:
+    chair = site.next_free_chair()
+    return site.busy_count, site.free_count, chair.id if chair is not None else None
+
+
+def test_indexes_follow_takes_and_releases():
+    site = _site()
+    rng = random.Random(7)
+    for _ in range(300):
+        chair = site.chairs[rng.randrange(len(site.chairs))]
+        if chair.is_occupied:
+            site.release(chair.id)
+        elif rng.random() < 0.5:
+            site.occupy(chair.id, Client(name='zoe'), None)
+        else:
+            # straight through the chair, as the windows do
+            chair.occupant = Client(name='yan')
+        assert _indexed(site) == _counted(site)
+
+
+def test_next_free_chair_is_the_lowest_free_one():
+    site = _site(4)
+    assert site.next_free_chair() is site.chairs[0]
+    for chair_id in (1, 2, 3, 4):
+        site.occupy(chair_id, Client(name=f'client {chair_id}'), None)
+    assert site.next_free_chair() is None and site.free_count == 0
+    site.release(3)
+    site.release(2)
+    assert site.next_free_chair() is site.chairs[1]
+    site.occupy(2, Client(name='zoe'), None)
+    assert site.next_free_chair() is site.chairs[2]
+
+
+def test_indexes_are_rebuilt_when_chairs_change_behind_the_site():
+    site = _site(6)
+    site.occupy(1, Client(name='zoe'), None)
+    assert site.busy_count == 1
+    site.init_chairs(10)
+    site.occupy(9, Client(name='yan'), None)
+    assert _indexed(site) == _counted(site) == (2, 8, 2)
+    site.chairs = [Chair(id=1, occupant=None, since=None), Chair(id=2, occupant=Client(name='bob'), since=None)]
+    assert _indexed(site) == _counted(site) == (1, 1, 1)
+    site.init_chairs(1)
+    assert _indexed(site) == _counted(site) == (1, 0, None)
+
+
+def test_copies_keep_their_own_counts():
+    site = _site(3)
+    site.occupy(1, Client(name='zoe'), None)
+    copied = site.model_copy(deep=True)
+    copied.occupy(2, Client(name='yan'), None)
+    copied.chairs[0].release()
+    assert _indexed(site) == (1, 2, 2)
+    assert _indexed(copied) == (1, 2, 1)
+    site.restore(copied)
+    assert _indexed(site) == _counted(site) == (1, 2, 1)
+    # a detached copy of one of the site's chairs does not count
+    loose = site.chairs[2].model_copy()
+    loose.occupant = Client(name='ghost')
+    assert _indexed(site) == (1, 2, 1)
+    assert site == copied
+
+
+def test_staff_lookup():
+    site = _site()
+    site.add_staff(Staff(name='ann'))
+    assert site.has_staff('ann') and site.get_staff_from_name('ann') is site.staff[0]
+    site.staff.append(Staff(name='bob'))
+    assert site.has_staff('bob')
+    site.remove_staff('ann')
+    assert not site.has_staff('ann')
+    with pytest.raises(StaffNotFoundError):
+        site.get_staff_from_name('ann')
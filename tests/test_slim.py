@@ -0,0 +1,65 @@
+import pytest
+
+from cozy.model.journal import EventJournal, FULL, SLIM
+from cozy.model.slim import migrate_journal
+from tests.sites import open_site, seat, free
+
+
+def _full_site(home):
+    # a site written before slim journals existed
+    controller = open_site(home, locking=False, checkpoint_interval=10)
+    for i in range(40):
+        seat(controller, i % 8, f'Client Number {i % 5}')
+        free(controller, i % 8)
+    controller.close()
+    return controller.site.model_dump()
+
+
+def test_migrated_journal_holds_the_same_events(tmp_path):
+    source = tmp_path / 'journal.jsonl'
+    journal = EventJournal(source)
+    controller = open_site(tmp_path / 'site', locking=False)
+    seat(controller, 0, 'zoe')
+    free(controller, 0)
+    journal.start_from(controller.event_log)
+    journal.close()
+    controller.close()
+
+    target = migrate_journal(source, tmp_path / 'slim.jsonl')
+    assert EventJournal(target).read_format() == SLIM
+    assert target.stat().st_size < source.stat().st_size
+    full_events = [e.model_dump() for _, e in EventJournal(source).events()]
+    slim_events = [e.model_dump() for _, e in EventJournal(target).events()]
+    assert slim_events == full_events
+    assert EventJournal(target).read_initial_site_state() == EventJournal(source).read_initial_site_state()
+
+
+def test_controller_migrates_its_home(tmp_path):
+    home = tmp_path / 'site'
+    _full_site(home)
+    journal = home / 'journal.jsonl'
+    before = journal.stat().st_size
+    assert EventJournal(journal).read_format() == FULL
+
+    controller = open_site(home)
+    events = [e.model_dump() for e in controller.event_log.events]
+    controller.migrate_journal()
+    assert journal.stat().st_size < before
+    assert EventJournal(journal).read_format() == SLIM
+    seat(controller, 9, 'Client Number 2')
+    state = controller.site.model_dump()
+    controller.close()
+
+    reopened = open_site(home)
+    assert reopened.site.model_dump() == state
+    assert [e.model_dump() for e in reopened.event_log.events][:len(events)] == events
+    reopened.close()
+
+
+def test_migration_needs_the_lock(tmp_path):
+    home = tmp_path / 'site'
+    _full_site(home)
+    controller = open_site(home, locking=False)
+    with pytest.raises(ValueError):
+        controller.migrate_journal()
+    controller.close()
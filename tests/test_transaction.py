@@ -0,0 +1,54 @@
+import pytest
+
+from tests.sites import open_site, seat, free
+
+
+def test_commit_writes_all_events_together(tmp_path):
+    controller = open_site(tmp_path / 'site')
+    before = controller.version
+    with controller.transaction():
+        seat(controller, 0, 'zoe')
+        seat(controller, 1, 'yan')
+        # nothing is written until the block ends
+        assert controller.version == before
+    assert controller.version == before + 2
+    controller.close()
+
+    reopened = open_site(tmp_path / 'site')
+    assert [c.occupant.name for c in reopened.site.chairs[:2]] == ['zoe', 'yan']
+    assert reopened.version == before + 2
+    reopened.close()
+
+
+def test_rollback_restores_site_and_drops_events(tmp_path):
+    controller = open_site(tmp_path / 'site')
+    seat(controller, 0, 'zoe')
+    state = controller.site.model_dump()
+    before = controller.version
+    with pytest.raises(RuntimeError):
+        with controller.transaction():
+            free(controller, 0)
+            seat(controller, 1, 'yan')
+            raise RuntimeError("cancelled")
+    assert controller.site.model_dump() == state
+    assert controller.version == before
+    controller.close()
+
+    reopened = open_site(tmp_path / 'site')
+    assert reopened.site.model_dump() == state
+    reopened.close()
+
+
+def test_nested_transaction_joins_outer_one(tmp_path):
+    controller = open_site(tmp_path / 'site')
+    before = controller.version
+    with pytest.raises(RuntimeError):
+        with controller.transaction():
+            seat(controller, 0, 'zoe')
+            with controller.transaction():
+                seat(controller, 1, 'yan')
+            raise RuntimeError("cancelled")
+    assert controller.version == before
+    assert not controller.site.chairs[0].is_occupied and not controller.site.chairs[1].is_occupied
+    controller.close()
+